@@ -55,7 +55,7 @@ export const search_locations = async (params = {}) => {
         .trim();
     }
 
-    if (normalized.limit == null) normalized.limit = 1000;
+    if (normalized.limit == null) normalized.limit = 10;
     if (normalized.locationcategoryid == null)
       normalized.locationcategoryid = "CITY";
     if (!normalized.sortfield) normalized.sortfield = "name";
@@ -26,6 +26,51 @@ load_dotenv(dotenv_path=dotenv_path)
 OWM_API_KEY  = os.getenv("OWM_API_KEY")  # stays on this module, no circular access
 OWM_BASE_URL = (os.getenv("OWM_BASE_URL", "https://api.openweathermap.org") or "").rstrip("/")
 
+# NOAA / National Weather Service
+NWS_BASE_URL = (os.getenv("NWS_BASE_URL", "https://api.weather.gov") or "").rstrip("/")
+
+# Answer /api/alerts from a locally indexed copy of the active-alerts feed
+ALERTS_INDEX_ENABLED = os.getenv("ALERTS_INDEX_ENABLED", "1") == "1"
+
+# IP geolocation: local range DB (manage.py build_geoip_db), opt-in remote lookup on its misses
+# (with no DB file the remote lookup is always used)
+GEOIP_DB_PATH = os.getenv("GEOIP_DB_PATH", str(BASE_DIR / "data" / "geoip.bin"))
+GEOIP_REMOTE_FALLBACK = os.getenv("GEOIP_REMOTE_FALLBACK", "0") == "1"
+# Reverse proxies in front of the app; X-Forwarded-For is ignored unless this is set
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+
+# Persist fetched forecasts (base/forecast_store.py) and serve cold misses from them
+FORECAST_STORE_ENABLED = os.getenv("FORECAST_STORE_ENABLED", "1") == "1"
+FORECAST_STORE_RETAIN_HOURS = float(os.getenv("FORECAST_STORE_RETAIN_HOURS", "48"))
+
+# /api/locations autocomplete: local city gazetteer (manage.py build_gazetteer), OWM for misses
+GAZETTEER_ENABLED = os.getenv("GAZETTEER_ENABLED", "1") == "1"
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH") or None
+
+# Keep the most requested locations warm with a background prefetch thread. Each gunicorn
+# worker runs its own (its caches are in-process) and spends 1/PREFETCH_WORKERS of PREFETCH_BUDGET
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_BUDGET = int(os.getenv("PREFETCH_BUDGET", "20"))
+PREFETCH_WORKERS = int(os.getenv("GUNICORN_WORKERS", "1"))
+
+# Serve the upstream-bound endpoints from base/async_views.py (set when running app.asgi)
+ASYNC_VIEWS = os.getenv("WT_ASYNC_VIEWS", "0") == "1"
+
+# Upstream request budget shared by all workers on the host (SQLite file; see base/resilience.py)
+UPSTREAM_QUOTA_ENABLED = os.getenv("UPSTREAM_QUOTA_ENABLED", "1") == "1"
+UPSTREAM_QUOTA_DB = os.getenv("WT_UPSTREAM_QUOTA_DB") or None
+
+# Per-request phase timings in a Server-Timing header; opt-in cProfile sampling (1 in N requests)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "1") == "1"
+PROFILE_SAMPLE_EVERY = int(os.getenv("WT_PROFILE_EVERY", "0"))
+PROFILE_DIR = os.getenv("WT_PROFILE_DIR", "/tmp/wt-profiles")
+
+# Whole-request time budget that upstream calls and their retries share (see base/deadline.py);
+# optional hedged upstream GETs past the learned p95 latency (see base/hedging.py)
+REQUEST_DEADLINE_SECS = float(os.getenv("WT_REQUEST_DEADLINE_SECS", "15"))
+REQUEST_DEADLINES = {"/api/map-html/": float(os.getenv("WT_MAP_DEADLINE_SECS", "25"))}
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -67,7 +112,12 @@ CSRF_TRUSTED_ORIGINS = [
  ]                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                             
  
 MIDDLEWARE = [
+    "base.metrics.MetricsMiddleware",          # outermost: latency covers every other middleware
+    "base.timing.ServerTimingMiddleware",      # Server-Timing breakdown (SERVER_TIMING_ENABLED)
+    "base.timing.SamplingProfilerMiddleware",  # cProfile 1-in-PROFILE_SAMPLE_EVERY requests; off at 0
+    "base.deadline.DeadlineMiddleware",        # per-request upstream deadline (REQUEST_DEADLINE_SECS)
     "corsheaders.middleware.CorsMiddleware",
+    "base.middleware.CompressionMiddleware",   # gzip/brotli; must wrap everything that writes the body
     "django.middleware.common.CommonMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -81,6 +131,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'app.urls'
 
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "base.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
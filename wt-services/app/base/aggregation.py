@@ -0,0 +1,126 @@
+"""
+Columnar forecast aggregation shared by trends, daily_forecast and the NWS view.
+
+A forecast payload is turned into NumPy columns once (day key, temp, humidity,
+wind, pop; NaN where a value is missing) and every per-day statistic is then a
+grouped reduction over day-sorted runs, so there's a single pass of Python over
+the payload no matter how many series or locations are aggregated.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+
+COLUMNS = ("temp", "humidity", "wind", "pop")
+
+
+def _num(v):
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+
+
+def _owm_day(item):
+    dt_txt = item.get("dt_txt") or ""
+    if len(dt_txt) >= 10:
+        return dt_txt[:10]  # YYYY-MM-DD (UTC)
+    ts = item.get("dt")
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).date().isoformat()
+
+
+def _columns(days, rows):
+    return {
+        "day": np.array(days, dtype="<U10"),
+        **{name: np.array([r[i] for r in rows], dtype=np.float64) for i, name in enumerate(COLUMNS)},
+    }
+
+
+def owm_columns(slices):
+    """OWM 3-hour `list` -> columns. Slices without any usable timestamp are dropped."""
+    days, rows = [], []
+    for item in slices or []:
+        d = _owm_day(item)
+        if d is None:
+            continue
+        main = item.get("main") or {}
+        wind = item.get("wind") or {}
+        days.append(d)
+        rows.append((_num(main.get("temp")), _num(main.get("humidity")), _num(wind.get("speed")), _num(item.get("pop"))))
+    return _columns(days, rows)
+
+
+def nws_columns(periods):
+    """NWS forecast `periods` -> columns; pop is in percent, humidity/wind are left empty."""
+    days, rows = [], []
+    for p in periods or []:
+        d = (p.get("startTime") or "")[:10]
+        if not d:
+            continue
+        pop = (p.get("probabilityOfPrecipitation") or {}).get("value")
+        days.append(d)
+        rows.append((_num(p.get("temperature")), np.nan, np.nan, _num(pop)))
+    return _columns(days, rows)
+
+
+def daily_stats(cols):
+    """
+    Per-day reductions over the columns: tMax, tMin, tMean, popMax, rhMax,
+    rhMean, windMax (NaN where a day had no values) plus `date` (sorted ISO
+    day keys) and `n` (slices per day).
+    """
+    days = cols["day"]
+    if days.size == 0:
+        empty = np.empty(0)
+        return {"date": days, "n": np.empty(0, dtype=np.int64),
+                **{k: empty for k in ("tMax", "tMin", "tMean", "popMax", "rhMax", "rhMean", "windMax")}}
+
+    order = np.argsort(days, kind="stable")
+    dates, starts = np.unique(days[order], return_index=True)
+    counts = np.diff(np.append(starts, days.size))
+
+    def grouped(name):
+        return cols[name][order]
+
+    def fmax(v):
+        return np.fmax.reduceat(v, starts)
+
+    def fmin(v):
+        return np.fmin.reduceat(v, starts)
+
+    def nanmean(v):
+        present = ~np.isnan(v)
+        sums = np.add.reduceat(np.where(present, v, 0.0), starts)
+        n = np.add.reduceat(present.astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n > 0, sums / np.maximum(n, 1), np.nan)
+
+    temp, rh, wind, pop = grouped("temp"), grouped("humidity"), grouped("wind"), grouped("pop")
+    return {
+        "date": dates,
+        "n": counts,
+        "tMax": fmax(temp),
+        "tMin": fmin(temp),
+        "tMean": nanmean(temp),
+        "popMax": fmax(pop),
+        "rhMax": fmax(rh),
+        "rhMean": nanmean(rh),
+        "windMax": fmax(wind),
+    }
+
+
+def filled_range(stats):
+    """(tMax, tMin) with a missing side falling back to the other, and to 0 when both are missing."""
+    tmax, tmin = stats["tMax"], stats["tMin"]
+    hi = np.where(np.isnan(tmax), tmin, tmax)
+    lo = np.where(np.isnan(tmin), tmax, tmin)
+    return np.nan_to_num(hi, nan=0.0), np.nan_to_num(lo, nan=0.0)
+
+
+def pop_max(stats):
+    """Daily max PoP with no-data days at 0."""
+    return np.fmax(stats["popMax"], 0.0)
+
+
+def opt(x):
+    """NaN -> None, otherwise a plain float (for JSON)."""
+    x = float(x)
+    return None if np.isnan(x) else x
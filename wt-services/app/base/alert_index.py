@@ -0,0 +1,180 @@
+"""
+In-memory spatial index over the NWS active-alerts feed.
+
+A background thread pulls the full /alerts/active feed every
+ALERTS_INDEX_REFRESH_SECS and swaps in a freshly built AlertIndex. Point
+queries go through a grid of lat/lon buckets holding polygon bounding boxes,
+then an exact point-in-polygon test; zone-only alerts (no geometry) are
+matched through the point's forecast/county/fire-weather zone ids. While
+no index younger than ALERTS_INDEX_MAX_AGE_SECS exists, current() returns
+None and callers fall back to the upstream point query.
+"""
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+ALERTS_INDEX_REFRESH_SECS = 60
+ALERTS_INDEX_MAX_AGE_SECS = 300
+ALERTS_INDEX_BUCKET_DEG   = 1.0
+
+
+def zone_id(url_or_id):
+    """'https://api.weather.gov/zones/forecast/NCZ071' -> 'NCZ071'."""
+    return (url_or_id or "").rstrip("/").rsplit("/", 1)[-1]
+
+
+def _polygons(geom):
+    """GeoJSON Polygon/MultiPolygon -> list of polygons, each a list of (N, 2) lon/lat ring arrays."""
+    if not geom:
+        return []
+    kind = geom.get("type")
+    coords = geom.get("coordinates") or []
+    if kind == "Polygon":
+        polys = [coords]
+    elif kind == "MultiPolygon":
+        polys = coords
+    elif kind == "GeometryCollection":
+        return [p for g in geom.get("geometries") or [] for p in _polygons(g)]
+    else:
+        return []
+    out = []
+    for poly in polys:
+        rings = [np.asarray(r, dtype=np.float64)[:, :2] for r in poly if len(r) >= 3]
+        if rings:
+            out.append(rings)
+    return out
+
+
+def _in_ring(x, y, ring):
+    """Even-odd ray cast of (x, y) against one ring, vectorized over its edges."""
+    x0, y0 = ring[:, 0], ring[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    crosses = (y0 > y) != (y1 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xs = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return bool(np.count_nonzero(crosses & (x < xs)) % 2)
+
+
+def point_in_polygons(lon, lat, polygons):
+    for rings in polygons:
+        if _in_ring(lon, lat, rings[0]) and not any(_in_ring(lon, lat, h) for h in rings[1:]):
+            return True
+    return False
+
+
+class AlertIndex:
+    def __init__(self, features, to_alert, bucket_deg=ALERTS_INDEX_BUCKET_DEG, built_at=None):
+        self.bucket_deg = bucket_deg
+        self.built_at = built_at if built_at is not None else time.monotonic()
+        self.alerts = []
+        self._shapes = []          # per alert: (bbox, polygons) or None
+        self._buckets = {}
+        self._zones = {}
+
+        for f in features or []:
+            i = len(self.alerts)
+            self.alerts.append(to_alert(f))
+            props = f.get("properties") or {}
+            polys = _polygons(f.get("geometry"))
+            if polys:
+                pts = np.concatenate([r for rings in polys for r in rings])
+                bbox = (pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max())
+                self._shapes.append((bbox, polys))
+                for key in self._bucket_keys(bbox):
+                    self._buckets.setdefault(key, []).append(i)
+            else:
+                self._shapes.append(None)
+                zones = {zone_id(z) for z in props.get("affectedZones") or []}
+                zones.update((props.get("geocode") or {}).get("UGC") or [])
+                for z in zones:
+                    self._zones.setdefault(z, []).append(i)
+
+    def _bucket(self, lon, lat):
+        return math.floor(lon / self.bucket_deg), math.floor(lat / self.bucket_deg)
+
+    def _bucket_keys(self, bbox):
+        x0, y0 = self._bucket(bbox[0], bbox[1])
+        x1, y1 = self._bucket(bbox[2], bbox[3])
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def query(self, lat, lon, zones=()):
+        """Alerts whose polygon contains the point or whose zones include one of `zones`, in feed order."""
+        hits = set()
+        for i in self._buckets.get(self._bucket(lon, lat), ()):
+            (minx, miny, maxx, maxy), polys = self._shapes[i]
+            if minx <= lon <= maxx and miny <= lat <= maxy and point_in_polygons(lon, lat, polys):
+                hits.add(i)
+        for z in zones:
+            hits.update(self._zones.get(z, ()))
+        return [self.alerts[i] for i in sorted(hits)]
+
+    def __len__(self):
+        return len(self.alerts)
+
+
+# -----------------------------
+# Background refresher
+# -----------------------------
+_INDEX = None
+_REFRESHER = None
+_LOCK = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, "ALERTS_INDEX_ENABLED", True)
+
+
+def refresh(fetch_feed, to_alert):
+    """Pulls the feed once and swaps in a new index; returns it (or None when the fetch failed)."""
+    global _INDEX
+    payload = fetch_feed()
+    if payload is None:
+        return None
+    idx = AlertIndex(
+        payload.get("features") or [], to_alert,
+        bucket_deg=getattr(settings, "ALERTS_INDEX_BUCKET_DEG", ALERTS_INDEX_BUCKET_DEG),
+    )
+    _INDEX = idx
+    return idx
+
+
+def _run(fetch_feed, to_alert):
+    interval = getattr(settings, "ALERTS_INDEX_REFRESH_SECS", ALERTS_INDEX_REFRESH_SECS)
+    while True:
+        try:
+            idx = refresh(fetch_feed, to_alert)
+            if idx is not None:
+                log.info("Alert index rebuilt with %d alerts", len(idx))
+        except Exception:
+            log.exception("Alert index refresh failed")
+        time.sleep(interval)
+
+
+def ensure_started(fetch_feed, to_alert):
+    global _REFRESHER
+    if _REFRESHER is not None:
+        return
+    with _LOCK:
+        if _REFRESHER is None:
+            _REFRESHER = threading.Thread(target=_run, args=(fetch_feed, to_alert), name="alert-index", daemon=True)
+            _REFRESHER.start()
+
+
+def current():
+    """The live index if it's recent enough to trust, else None."""
+    idx = _INDEX
+    max_age = getattr(settings, "ALERTS_INDEX_MAX_AGE_SECS", ALERTS_INDEX_MAX_AGE_SECS)
+    if idx is None or time.monotonic() - idx.built_at > max_age:
+        return None
+    return idx
+
+
+def reset():
+    global _INDEX
+    _INDEX = None
@@ -0,0 +1,457 @@
+"""
+Native async versions of the upstream-bound endpoints.
+
+Served when ASYNC_VIEWS is on (see base/urls.py) under an ASGI worker, so a
+single process can hold many concurrent upstream waits instead of one per
+sync worker. Payload building is shared with base/views.py, so the JSON
+contracts are identical. The routes that stay sync (DRF) get thin async
+wrappers too, so nothing is left for Django to queue on asgiref's single
+thread-sensitive executor.
+"""
+import asyncio
+import functools
+import json
+import logging
+import threading
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import deadline, hedging, metrics, prefetch, renderers, resilience, streams, timing, views
+from .cache import FRESH, STALE
+from .models import snap_point
+from .singleflight import AsyncSingleFlight
+
+log = logging.getLogger(__name__)
+
+ASYNC_POOL_MAX_CONNECTIONS = 200
+ASYNC_POOL_MAX_KEEPALIVE   = 50
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_OWM_FLIGHT = AsyncSingleFlight("owm-async")
+_NWS_FLIGHT = AsyncSingleFlight("nws-async")
+
+# One pooled client per event loop; a client can't be shared across loops.
+_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=getattr(settings, "ASYNC_POOL_MAX_CONNECTIONS", ASYNC_POOL_MAX_CONNECTIONS),
+                max_keepalive_connections=getattr(settings, "ASYNC_POOL_MAX_KEEPALIVE", ASYNC_POOL_MAX_KEEPALIVE),
+            ),
+            follow_redirects=True,
+        )
+        _CLIENTS[loop] = client
+    return client
+
+
+def _blocking(fn):
+    """
+    fn as an awaitable on the loop's worker threads. sync_to_async's default
+    (thread_sensitive) runs every request's blocking calls one at a time on a
+    single shared thread; DB connections fn opens are closed afterwards, as
+    Django does at the end of a request.
+    """
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def _sync_view(view):
+    """Async wrapper serving a sync view through _blocking (keeps csrf_exempt and friends)."""
+    run = _blocking(view)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run(request, *args, **kwargs)
+    return wrapper
+
+
+def _json_resp(status, body):
+    return views._CachedResp(status, json.dumps(body).encode())
+
+
+async def _get(url, *, provider, params=None, headers=None, timeout, retries, backoff):
+    """
+    GET with retry/backoff on 429/5xx and transport errors; raises httpx.HTTPError once retries run out.
+    Refused by the circuit breaker or shared quota, it answers 503 without touching the network.
+    Each attempt's timeout is clipped to the request deadline, and no retry is started that can't finish
+    before it; running out of deadline raises httpx.TimeoutException without counting against the breaker.
+    """
+    if deadline.expired():
+        raise httpx.TimeoutException(f"{provider.upper()} request skipped: request deadline exceeded")
+    refused = await resilience.aadmit(provider)
+    if refused:
+        return _json_resp(503, {"detail": f"{provider.upper()} unavailable: {resilience.REFUSALS[refused]}"})
+    client = get_async_client()
+    with metrics.upstream_call(provider, url) as call:
+        for attempt in range(retries + 1):
+            delay = backoff * (2 ** attempt)
+            try:
+                attempt_timeout = deadline.timeout(timeout)
+                r = await hedging.acall(provider, url, lambda: client.get(
+                    url, params=params, headers=headers, timeout=attempt_timeout))
+            except (httpx.HTTPError, deadline.DeadlineExceeded) as e:
+                if deadline.expired():
+                    call.status = "deadline"
+                    resilience.breaker(provider).cancel()
+                    raise httpx.TimeoutException(f"{provider.upper()} request cut off by the request deadline") from e
+                if attempt >= retries or not deadline.allows(delay):
+                    call.status = "timeout" if isinstance(e, httpx.TimeoutException) else "error"
+                    resilience.record(provider, None)
+                    raise
+                reason = type(e).__name__
+            else:
+                if r.status_code not in RETRY_STATUSES or attempt >= retries or not deadline.allows(delay):
+                    call.status = r.status_code
+                    resilience.record(provider, r.status_code)
+                    return views._CachedResp(r.status_code, r.content)
+                reason = r.status_code
+            metrics.retried(provider, reason)
+            await asyncio.sleep(delay)
+
+
+# -----------------------------
+# OWM
+# -----------------------------
+async def _owm_fetch(path, params=None):
+    base = getattr(settings, "OWM_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+    key  = getattr(settings, "OWM_API_KEY", None)
+    if not key:
+        return _json_resp(401, {"cod": 401, "message": "Missing OWM_API_KEY"})
+
+    q = dict(params or {})
+    q["appid"] = key
+    try:
+        return await _get(
+            f"{base}/{path.lstrip('/')}", provider="owm", params=q,
+            timeout=views.OWM_TIMEOUT_SECS, retries=views.OWM_MAX_RETRIES, backoff=views.OWM_BACKOFF,
+        )
+    except httpx.TimeoutException:
+        return _json_resp(504, {"cod": 504, "message": "OWM request timed out"})
+    except httpx.HTTPError as e:
+        return _json_resp(502, {"cod": 502, "message": f"OWM request failed: {e}"})
+
+
+@timing.timed("owm")
+async def owm_request(path, params=None):
+    """Async _owm_request: shares the response cache and key normalization with the sync path."""
+    q    = views._owm_normalize_params(params)
+    ttl  = views._owm_ttl(path)
+    ckey = views._owm_cache_key(path, q)
+    if ttl <= 0 or not getattr(settings, "OWM_API_KEY", None):
+        return await _OWM_FLIGHT.do(ckey, _owm_fetch, path, q)
+
+    hit, state = views._OWM_CACHE.get(ckey)
+    if state == FRESH:
+        return hit
+    if state == STALE:
+        # The refresh runs on a thread so it outlives per-request event loops
+        if views._OWM_CACHE.begin_refresh(ckey):
+            threading.Thread(target=views._owm_refresh, args=(ckey, path, q, ttl), daemon=True).start()
+        return hit
+
+    stored = await _blocking(views._owm_from_store)(ckey, path, q, ttl)
+    if stored is not None:
+        return stored
+
+    resp = await _OWM_FLIGHT.do(ckey, _owm_fetch, path, q)
+    if resp.ok:
+        views._owm_store(ckey, resp, ttl)
+        views._owm_archive(path, q, resp)
+    return views._owm_last_resort(ckey, resp)
+
+
+# -----------------------------
+# NWS
+# -----------------------------
+async def _nws_get(url):
+    return await _NWS_FLIGHT.do(
+        url, _get, url, provider="nws", headers=views.NWS_HEADERS,
+        timeout=views.NOAA_TIMEOUT_SECS, retries=views.NOAA_MAX_RETRIES, backoff=views.NOAA_BACKOFF,
+    )
+
+
+async def nws_points(lat, lon):
+    lat, lon = snap_point(lat, lon)
+    props = await _blocking(views._nws_points_cached)(lat, lon)
+    if props is not None:
+        return {"properties": props}
+    r = await _nws_get(views._nws_url(f"/points/{lat},{lon}"))
+    meta = r.json()
+    await _blocking(views._nws_points_store)(lat, lon, meta)
+    return meta
+
+
+async def nws_forecast(lat, lon, days=7):
+    return views._nws_daily(await nws_forecast_payload(lat, lon), days)
+
+
+@timing.timed("nws")
+async def nws_forecast_payload(lat, lon):
+    lat, lon = snap_point(lat, lon)
+    payload, state = views._NWS_CACHE.get(("forecast", lat, lon))
+    if state is not None:
+        return payload
+    try:
+        meta = await nws_points(lat, lon)
+        r, error = await _nws_get(meta["properties"]["forecast"]), None
+    except (httpx.HTTPError, KeyError) as e:
+        r, error = None, e
+    return views._nws_forecast_result(lat, lon, r, error)
+
+
+@timing.timed("alerts")
+async def alerts_payload(lat, lon):
+    """
+    Unsimplified /api/alerts body: local index at the exact point, then the
+    cache and NWS at the snapped point, as fetch_alerts does; (body, status).
+    """
+    body = await _blocking(views._alerts_from_index)(lat, lon)
+    lat, lon = snap_point(lat, lon)
+    if body is None:
+        body, state = views._NWS_CACHE.get(("alerts", lat, lon))
+    if body is None:
+        try:
+            r = await _nws_get(views._nws_url(f"/alerts/active?point={lat},{lon}"))
+        except httpx.HTTPError as e:
+            return {"error": "nws_error", "message": str(e)}, 502
+        if not r.ok:
+            return views._nws_error(r)
+        body = views._alerts_body(r.json())
+        views._nws_cache_store(("alerts", lat, lon), body,
+                               getattr(settings, "ALERTS_POINT_TTL_SECS", views.ALERTS_POINT_TTL_SECS), r)
+    return body, 200
+
+
+# -----------------------------
+# Views
+# -----------------------------
+@timing.timed("render")
+def _respond(body, status, columnar_ok=False, request=None):
+    """JSON response; forecast endpoints pass columnar_ok so ?format=columnar is honoured as in the DRF views."""
+    if columnar_ok and request is not None and request.GET.get("format") == "columnar":
+        return HttpResponse(renderers.dumps(renderers.columnar(body)), status=status,
+                            content_type=renderers.COLUMNAR_MEDIA_TYPE)
+    return HttpResponse(renderers.dumps(body), status=status, content_type="application/json")
+
+
+async def _lat_lon(request):
+    qlat = request.GET.get("lat")
+    qlon = request.GET.get("lon")
+    if qlat and qlon:
+        return float(qlat), float(qlon)
+    return await asyncio.to_thread(views._geolocate_ip, request)
+
+
+@require_GET
+async def weather_data(request):
+    try:
+        lat, lon = await asyncio.to_thread(views._geolocate_ip, request)
+    except (TypeError, ValueError):
+        return _respond({"error": "lat & lon are required or could not be determined"}, 400)
+
+    units = (request.GET.get("units") or "metric").strip()
+    views._track_owm("/data/2.5/weather", lat, lon, units)
+    resp = await owm_request("/data/2.5/weather", params={"lat": lat, "lon": lon, "units": units})
+    if not resp.ok:
+        return _respond(*views._owm_error(resp))
+    return _respond(resp.json(), 200)
+
+
+@require_GET
+async def trends(request):
+    try:
+        lat = float(request.GET.get("lat"))
+        lon = float(request.GET.get("lon"))
+    except (TypeError, ValueError):
+        return _respond({"error": "lat & lon are required"}, 400)
+
+    days  = int(request.GET.get("days", 7))
+    units = (request.GET.get("units") or "metric").strip()
+    views._track_owm("/data/2.5/forecast", lat, lon, units)
+
+    resp = await owm_request("/data/2.5/forecast", params={"lat": lat, "lon": lon, "units": units})
+    if not resp.ok:
+        return _respond(*views._owm_error(resp))
+    cond = views._owm_validators(request, "trends", resp, lat, lon, units, days)
+    if cond is not None and cond.fresh_for(request):
+        return cond.not_modified()
+    return views._with_validators(
+        cond, _respond(*views._trends_body(resp.json(), lat, lon, units, days), columnar_ok=True, request=request))
+
+
+@require_GET
+async def daily_forecast(request):
+    try:
+        lat, lon = await _lat_lon(request)
+    except (TypeError, ValueError):
+        return _respond({"error": "lat & lon are required or could not be determined"}, 400)
+
+    days  = int(request.GET.get("days", 5))
+    units = (request.GET.get("units") or "metric").strip()
+    views._track_owm("/data/2.5/forecast", lat, lon, units)
+
+    resp = await owm_request("/data/2.5/forecast", params={"lat": lat, "lon": lon, "units": units})
+    if not resp.ok:
+        return _respond(*views._owm_error(resp))
+    cond = views._owm_validators(request, "daily", resp, lat, lon, units, days)
+    if cond is not None and cond.fresh_for(request):
+        return cond.not_modified()
+    return views._with_validators(
+        cond, _respond(*views._daily_body(resp.json(), lat, lon, units, days), columnar_ok=True, request=request))
+
+
+@require_GET
+async def nws(request):
+    try:
+        lat, lon = await _lat_lon(request)
+    except (TypeError, ValueError):
+        return _respond({"error": "lat & lon are required or could not be determined"}, 400)
+
+    days = int(request.GET.get("days", 7))
+    prefetch.record("nws", *snap_point(lat, lon))
+    try:
+        payload = await nws_forecast_payload(lat, lon)
+        cond = views._nws_validators(request, payload, lat, lon, days)
+        if cond.fresh_for(request):
+            return cond.not_modified()
+        out = views._nws_daily(payload, days)
+    except Exception as e:
+        return _respond({"error": "nws_error", "message": str(e)[:200]}, 502)
+
+    return cond.apply(_respond({
+        "location": {"lat": float(lat), "lon": float(lon)},
+        "days": len(out),
+        "daily": out
+    }, 200, columnar_ok=True, request=request))
+
+
+@require_GET
+async def alerts(request):
+    try:
+        lat = float(request.GET.get("lat"))
+        lon = float(request.GET.get("lon"))
+    except (TypeError, ValueError):
+        return _respond({"error": "lat & lon required"}, 400)
+    try:
+        tolerance = views._simplify_tolerance(request.GET)
+    except ValueError:
+        return _respond({"error": "zoom/tolerance must be finite numbers"}, 400)
+
+    prefetch.record("alerts", *snap_point(lat, lon))
+    body, status = await alerts_payload(lat, lon)
+    if status != 200:
+        return _respond(body, status)
+    cond = views._alerts_validators(request, body, tolerance)
+    if cond.fresh_for(request):
+        return cond.not_modified()
+    return cond.apply(_respond(views._simplified_alerts(body, tolerance), 200))
+
+
+async def _batch_item(item, kind, sem):
+    try:
+        spec = views._batch_spec(item, kind)
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    _, lat, lon, units, _ = spec
+    try:
+        async with sem:
+            resp = await owm_request("/data/2.5/forecast", params={"lat": lat, "lon": lon, "units": units})
+        return views._batch_finish(resp, spec)
+    except Exception as e:
+        log.exception("Batch forecast entry failed")
+        return 502, {"error": "batch_item_failed", "message": str(e)[:200]}
+
+
+@csrf_exempt
+@require_POST
+async def forecast_batch(request):
+    try:
+        data = json.loads(request.body or b"null")
+        locations, kind, concurrency = views._batch_parse(data)
+    except ValueError as e:
+        return _respond({"error": str(e)}, 400)
+
+    sem = asyncio.Semaphore(concurrency)
+    outcomes = await asyncio.gather(*(_batch_item(item, kind, sem) for item in locations))
+    return _respond(views._batch_body(outcomes), 200, columnar_ok=True, request=request)
+
+
+
+# The DRF views without native versions, run on worker threads
+getData = _sync_view(views.getData)
+get_locations = _sync_view(views.get_locations)
+get_map_html = _sync_view(views.get_map_html)
+
+
+# -----------------------------
+# Server-sent events (see base/streams.py)
+# -----------------------------
+STREAM_CONDITION_FIELDS = ("weather", "main", "wind", "clouds", "rain", "snow", "visibility")
+
+
+async def _stream_alerts(lat, lon, units):
+    body, status = await alerts_payload(lat, lon)
+    return body if status == 200 else None
+
+
+def _alerts_digest(body):
+    return tuple(sorted(a.get("id") or "" for a in body.get("alerts", [])))
+
+
+async def _stream_conditions(lat, lon, units):
+    resp = await owm_request("/data/2.5/weather", params={"lat": lat, "lon": lon, "units": units})
+    return resp.json() if resp.ok else None
+
+
+def _conditions_digest(body):
+    # dt moves on every observation even when nothing a user sees has changed
+    return renderers.dumps({k: body.get(k) for k in STREAM_CONDITION_FIELDS})
+
+
+STREAM_FETCHERS = {
+    "alerts": (_stream_alerts, _alerts_digest),
+    "conditions": (_stream_conditions, _conditions_digest),
+}
+
+
+@require_GET
+async def stream(request):
+    """
+    text/event-stream of `alerts` and `conditions` events for a location; each
+    is sent on connect and again only when it changes.
+    """
+    if not getattr(settings, "ASYNC_VIEWS", False):
+        # A WSGI worker would have to buffer the endless body
+        return _respond({"error": "streaming requires the ASGI server"}, 501)
+    try:
+        lat = float(request.GET.get("lat"))
+        lon = float(request.GET.get("lon"))
+    except (TypeError, ValueError):
+        return _respond({"error": "lat & lon required"}, 400)
+
+    units = (request.GET.get("units") or "metric").strip()
+    # Topics are per exact point so alerts match /api/alerts for the same
+    # coordinates; nearby topics still share the OWM and NWS cache entries
+    key = (lat, lon, units)
+    response = StreamingHttpResponse(streams.events(streams.get_hub(STREAM_FETCHERS), key),
+                                     content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"   # nginx would otherwise hold events back
+    return response
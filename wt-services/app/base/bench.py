@@ -0,0 +1,426 @@
+"""
+Offline benchmark harness (driven by `manage.py bench`).
+
+StubUpstream is a threaded local HTTP server that stands in for both
+OpenWeatherMap and api.weather.gov: it answers the paths the views call with
+recorded payloads (a directory of JSON files) or built-in synthetic ones,
+after a configurable latency, and fails a configurable fraction of requests
+with 503. run() points OWM_BASE_URL / NWS_BASE_URL at it, drives each route
+in-process through Django's test client at a given concurrency (AsyncClient
+when ASYNC_VIEWS is on), and reports throughput, latency percentiles and
+upstream calls per request as a JSON-serializable dict.
+
+The run uses a throwaway test database, so persisted NWS points carrying
+stub URLs never reach the real one. Background work that would muddy the
+numbers (popularity prefetch, forecast snapshot writes) is switched off, as
+is the shared upstream quota (the stub has none); everything else runs as
+configured.
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from . import gazetteer, geoip
+
+BENCH_IP_NET = ipaddress.ip_network("10.77.0.0/16")   # client IPs the bench resolver maps to locations
+
+ROUTES = ("api/data/", "api/trends/", "api/forecast/daily", "api/nws",
+          "api/alerts/", "api/locations/", "api/map-html/")
+
+# Stub path prefix -> payload name (and recorded file name, <name>.json)
+UPSTREAM_PATHS = (
+    ("/data/2.5/weather", "owm_weather"),
+    ("/data/2.5/forecast", "owm_forecast"),
+    ("/geo/1.0/direct", "owm_geo"),
+    ("/points/", "nws_points"),
+    ("/gridpoints/", "nws_forecast"),
+    ("/alerts/active", "nws_alerts"),
+)
+
+
+# -----------------------------
+# Synthetic payloads
+# -----------------------------
+def _coords(query):
+    try:
+        return float(query["lat"][0]), float(query["lon"][0])
+    except (KeyError, ValueError):
+        return 35.23, -80.84
+
+
+def _owm_weather(path, query, base):
+    lat, lon = _coords(query)
+    return {
+        "coord": {"lat": lat, "lon": lon},
+        "weather": [{"id": 802, "main": "Clouds", "description": "scattered clouds", "icon": "03d"}],
+        "main": {"temp": 18.4, "feels_like": 17.9, "temp_min": 16.1, "temp_max": 20.2, "pressure": 1016, "humidity": 63},
+        "visibility": 10000,
+        "wind": {"speed": 3.6, "deg": 220},
+        "clouds": {"all": 40},
+        "dt": int(time.time()),
+        "timezone": -18000,
+        "name": "Bench",
+        "cod": 200,
+    }
+
+
+def _owm_forecast(path, query, base):
+    lat, lon = _coords(query)
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    items = []
+    for i in range(40):
+        t = start + timedelta(hours=3 * i)
+        temp = 15 + 6 * np.sin(i * np.pi / 4) + (lat % 5)
+        items.append({
+            "dt": int(t.timestamp()),
+            "dt_txt": t.strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {"temp": round(float(temp), 2), "temp_min": round(float(temp) - 1, 2),
+                     "temp_max": round(float(temp) + 1, 2), "humidity": 50 + i % 30},
+            "weather": [{"id": 500, "main": "Rain", "description": "light rain", "icon": "10d"}],
+            "wind": {"speed": 2 + (i % 7) * 0.8, "deg": 180},
+            "pop": round((i % 10) / 10, 1),
+        })
+    return {"cod": "200", "cnt": len(items), "list": items,
+            "city": {"name": "Bench", "coord": {"lat": lat, "lon": lon}, "timezone": -18000}}
+
+
+def _owm_geo(path, query, base):
+    q = (query.get("q") or [""])[0]
+    return [{"name": q.split(",")[0].title() or "Bench", "lat": 35.23, "lon": -80.84, "country": "US", "state": "North Carolina"}]
+
+
+def _zone(lat, lon):
+    return f"BCZ{int(abs(lat) * 10) % 1000:03d}"
+
+
+def _nws_points(path, query, base):
+    lat, lon = (float(x) for x in path.rsplit("/", 1)[-1].split(","))
+    gx, gy = int(abs(lon) * 10) % 300, int(abs(lat) * 10) % 300
+    return {"properties": {
+        "gridId": "BCH", "gridX": gx, "gridY": gy,
+        "forecast": f"{base}/gridpoints/BCH/{gx},{gy}/forecast",
+        "forecastHourly": f"{base}/gridpoints/BCH/{gx},{gy}/forecast/hourly",
+        "forecastZone": f"{base}/zones/forecast/{_zone(lat, lon)}",
+        "county": f"{base}/zones/county/{_zone(lat, lon)}",
+        "fireWeatherZone": f"{base}/zones/fire/{_zone(lat, lon)}",
+    }}
+
+
+def _nws_forecast(path, query, base):
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    periods = []
+    for i in range(14):
+        t = start + timedelta(hours=12 * i)
+        periods.append({
+            "number": i + 1, "startTime": t.isoformat(), "endTime": (t + timedelta(hours=12)).isoformat(),
+            "isDaytime": i % 2 == 0, "temperature": 70 - 12 * (i % 2), "temperatureUnit": "F",
+            "probabilityOfPrecipitation": {"value": (i * 10) % 70},
+        })
+    return {"properties": {"updateTime": start.isoformat(), "periods": periods}}
+
+
+def _nws_alerts(path, query, base):
+    if "point" in query:
+        lat, lon = (float(x) for x in query["point"][0].split(","))
+        centers = [(lat, lon)]
+    else:
+        centers = [(c.lat, c.lon) for c in gazetteer.get().cities[:10]]
+    feats = []
+    for i, (lat, lon) in enumerate(centers):
+        ring = [[lon + 0.2 * np.cos(a), lat + 0.2 * np.sin(a)] for a in np.linspace(0, 2 * np.pi, 60)]
+        ring[-1] = ring[0]
+        feats.append({
+            "id": f"urn:bench:alert:{i}",
+            "geometry": {"type": "Polygon", "coordinates": [[[float(x), float(y)] for x, y in ring]]},
+            "properties": {
+                "event": "Flood Watch", "severity": "Moderate", "headline": "Flood Watch (bench)",
+                "effective": datetime.now(timezone.utc).isoformat(), "ends": None, "areaDesc": "Bench County",
+                "affectedZones": [f"{base}/zones/forecast/{_zone(lat, lon)}"],
+            },
+        })
+    return {"type": "FeatureCollection", "features": feats}
+
+
+SYNTHETIC = {
+    "owm_weather": _owm_weather,
+    "owm_forecast": _owm_forecast,
+    "owm_geo": _owm_geo,
+    "nws_points": _nws_points,
+    "nws_forecast": _nws_forecast,
+    "nws_alerts": _nws_alerts,
+}
+
+
+# -----------------------------
+# Upstream stub
+# -----------------------------
+class StubUpstream:
+    """
+    Local OWM + NWS stand-in. payload_dir may hold <name>.json recordings
+    (names as in UPSTREAM_PATHS); absolute api.weather.gov URLs inside them
+    are rewritten to point back at the stub.
+    """
+
+    def __init__(self, payload_dir=None, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._recorded = {}
+        if payload_dir:
+            for _, name in UPSTREAM_PATHS:
+                p = os.path.join(payload_dir, f"{name}.json")
+                if os.path.exists(p):
+                    with open(p, encoding="utf-8") as f:
+                        self._recorded[name] = f.read()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                status, body = stub.respond(self.path)
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="bench-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.calls)
+
+    def respond(self, raw_path):
+        """(status, body text) for one upstream request; sleeps the configured latency first."""
+        url = urlsplit(raw_path)
+        name = next((n for prefix, n in UPSTREAM_PATHS if url.path.startswith(prefix)), None)
+        with self._lock:
+            self.calls[name or "unknown"] += 1
+            fail = self._rng.random() < self.error_rate
+            delay = self.latency + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if name is None:
+            return 404, json.dumps({"detail": "not stubbed"})
+        if fail:
+            return 503, json.dumps({"detail": "injected failure"})
+        if name in self._recorded:
+            return 200, self._recorded[name].replace("https://api.weather.gov", self.base_url)
+        return 200, json.dumps(SYNTHETIC[name](url.path, parse_qs(url.query), self.base_url))
+
+
+# -----------------------------
+# Client side
+# -----------------------------
+class BenchResolver:
+    """GEOIP_RESOLVER for the run: 10.77.x.y maps onto the benchmark locations."""
+
+    locations = [(35.23, -80.84)]
+
+    def resolve(self, ip):
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if addr not in BENCH_IP_NET:
+            return None
+        return self.locations[(int(addr) - int(BENCH_IP_NET.network_address)) % len(self.locations)]
+
+
+def bench_locations(n):
+    """The n most populous US gazetteer cities (NWS only covers the US)."""
+    cities = sorted((c for c in gazetteer.get().cities if c.country == "US"), key=lambda c: -c.population)
+    locs = [(round(c.lat, 4), round(c.lon, 4)) for c in cities[:n]]
+    return locs or [(35.23, -80.84)]
+
+
+def _request_for(route, i, locations, names):
+    """(path, headers) for the i-th request of a route."""
+    lat, lon = locations[i % len(locations)]
+    if route == "api/data/":
+        # As a proxy would send it; works for both the WSGI and ASGI test clients
+        return "/api/data/", {"X-Forwarded-For": str(BENCH_IP_NET.network_address + (i % len(locations)))}
+    if route == "api/locations/":
+        name = names[i % len(names)]
+        return f"/api/locations/?q={name[:3 + i % 4]}", {}
+    if route == "api/map-html/":
+        return f"/api/map-html/?lat={lat}&lon={lon}", {}
+    return f"/{route}?lat={lat}&lon={lon}", {}
+
+
+def _timed_sync(client_local, path, headers):
+    client = getattr(client_local, "client", None)
+    if client is None:
+        client = client_local.client = Client()
+    t0 = time.perf_counter()
+    resp = client.get(path, headers=headers)
+    return time.perf_counter() - t0, resp.status_code
+
+
+async def _drive_async(requests, concurrency):
+    client = AsyncClient()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(path, headers):
+        async with sem:
+            t0 = time.perf_counter()
+            resp = await client.get(path, headers=headers)
+            return time.perf_counter() - t0, resp.status_code
+
+    return await asyncio.gather(*(one(p, m) for p, m in requests))
+
+
+def _drive(requests, concurrency):
+    """[(seconds, status)] for every request, run `concurrency` at a time."""
+    if getattr(settings, "ASYNC_VIEWS", False):
+        return asyncio.run(_drive_async(requests, concurrency))
+    local = threading.local()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda r: _timed_sync(local, *r), requests))
+
+
+def _summarize(samples, wall, upstream):
+    secs = np.array([s for s, _ in samples], dtype=float) * 1000.0
+    statuses = Counter(str(code) for _, code in samples)
+    n = len(samples)
+    ups = sum(upstream.values())
+    p50, p95, p99 = (float(x) for x in np.percentile(secs, [50, 95, 99])) if n else (0.0, 0.0, 0.0)
+    return {
+        "requests": n,
+        "errors": sum(c for code, c in statuses.items() if int(code) >= 500),
+        "statuses": dict(sorted(statuses.items())),
+        "throughputRps": round(n / wall, 2) if wall > 0 else None,
+        "latencyMs": {
+            "mean": round(float(secs.mean()), 3) if n else 0.0,
+            "p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3),
+            "max": round(float(secs.max()), 3) if n else 0.0,
+        },
+        "upstreamCalls": ups,
+        "upstreamPerRequest": round(ups / n, 4) if n else None,
+        "upstream": dict(sorted(upstream.items())),
+    }
+
+
+def reset_caches():
+    """Drop the in-process response caches so every run starts cold."""
+    from . import alert_index, prefetch, resilience, risk_grid, simplify, views
+    for cache in (views._OWM_CACHE, views._NWS_CACHE, views._MAP_CACHE, views._POINT_ZONES, views._LOCATION_MISSES,
+                  risk_grid._GRID_CACHE):
+        cache.clear()
+    simplify.clear_cache()
+    geoip.clear_cache()
+    alert_index.reset()
+    prefetch.reset()
+    resilience.reset()
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(routes=ROUTES, requests=200, concurrency=16, warmup=0, locations=20,
+        payload_dir=None, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0, cold=True):
+    """Benchmark each route against a fresh stub; returns the JSON report as a dict."""
+    locs = bench_locations(locations)
+    names = [c.name for c in gazetteer.get().cities if c.country == "US"][:max(1, locations)] or ["Charlotte"]
+    BenchResolver.locations = locs
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "startedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "asyncViews": bool(getattr(settings, "ASYNC_VIEWS", False)),
+            "requestsPerRoute": requests, "concurrency": concurrency, "warmup": warmup, "locations": len(locs),
+            "upstream": {"latencyMs": latency_ms, "jitterMs": jitter_ms, "errorRate": error_rate,
+                         "payloads": payload_dir or "synthetic"},
+        },
+        "routes": {},
+    }
+    old_db = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        _run_routes(report, routes, requests, concurrency, warmup, locs, names,
+                    payload_dir, latency_ms, jitter_ms, error_rate, seed, cold)
+    finally:
+        connection.creation.destroy_test_db(old_db, verbosity=0)
+    return report
+
+
+def _run_routes(report, routes, requests, concurrency, warmup, locs, names,
+                payload_dir, latency_ms, jitter_ms, error_rate, seed, cold):
+    with StubUpstream(payload_dir, latency_ms, jitter_ms, error_rate, seed) as stub, override_settings(
+        OWM_BASE_URL=stub.base_url,
+        NWS_BASE_URL=stub.base_url,
+        OWM_API_KEY=getattr(settings, "OWM_API_KEY", None) or "bench",
+        GEOIP_RESOLVER="base.bench.BenchResolver",
+        TRUSTED_PROXY_COUNT=1,             # api/data's client address travels in X-Forwarded-For
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        PREFETCH_ENABLED=False,
+        FORECAST_STORE_ENABLED=False,
+        UPSTREAM_QUOTA_ENABLED=False,
+    ):
+        if cold:
+            reset_caches()
+        geoip.clear_cache()
+        for route in routes:
+            if warmup:
+                _drive([_request_for(route, i, locs, names) for i in range(warmup)], concurrency)
+            batch = [_request_for(route, i, locs, names) for i in range(requests)]
+            before = stub.snapshot()
+            t0 = time.perf_counter()
+            samples = _drive(batch, concurrency)
+            wall = time.perf_counter() - t0
+            report["routes"][route] = _summarize(samples, wall, stub.snapshot() - before)
+        geoip.clear_cache()
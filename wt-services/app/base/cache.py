@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+# Entry states returned by TTLCache.get
+FRESH = "fresh"
+STALE = "stale"
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "stale_until", "keep_until")
+
+    def __init__(self, value, size, expires_at, stale_until, keep_until):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.keep_until = keep_until
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache bounded by entry count and total bytes.
+    Each entry has its own TTL plus an optional stale-while-revalidate
+    window during which get() still returns it (marked STALE) so the
+    caller can serve it immediately and refresh in the background.
+    Entries set with a grace period linger past that window as a last
+    resort for get_stale() when the upstream is down.
+    A named cache also reports lookups and evictions to base.metrics.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, clock=time.monotonic, name=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns (value, FRESH|STALE) or (None, None) on a miss."""
+        value, state = self._get(key)
+        if self.name is not None:
+            metrics.cache_lookup(self.name, state or "miss")
+        return value, state
+
+    def _get(self, key):
+        now = self._clock()
+        with self._lock:
+            e = self._data.get(key)
+            if e is None:
+                self.misses += 1
+                return None, None
+            if now < e.expires_at:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return e.value, FRESH
+            if now < e.stale_until:
+                self._data.move_to_end(key)
+                self.stale_hits += 1
+                return e.value, STALE
+            if now >= e.keep_until:
+                self._drop(key)
+            self.misses += 1
+            return None, None
+
+    def get_stale(self, key):
+        """The value however old, as long as its grace period hasn't run out; None otherwise."""
+        now = self._clock()
+        with self._lock:
+            e = self._data.get(key)
+            if e is None:
+                return None
+            if now >= e.keep_until:
+                self._drop(key)
+                return None
+            return e.value
+
+    def set(self, key, value, ttl, swr=0, size=1, grace=0):
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        now = self._clock()
+        evicted = 0
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            stale_until = now + ttl + max(swr, 0)
+            self._data[key] = _Entry(value, size, now + ttl, stale_until, stale_until + max(grace, 0))
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+                evicted += 1
+        if evicted and self.name is not None:
+            metrics.cache_evicted(self.name, evicted)
+
+    def peek_servable(self, key):
+        """Whether get() would return the entry, fresh or stale; no LRU or stats update."""
+        with self._lock:
+            e = self._data.get(key)
+            return e is not None and self._clock() < e.stale_until
+
+    def ttl_remaining(self, key):
+        """Seconds until the entry goes stale (negative once stale), or None if absent."""
+        with self._lock:
+            e = self._data.get(key)
+            return None if e is None else e.expires_at - self._clock()
+
+    def begin_refresh(self, key):
+        """Claims the background refresh for key; False if one is already running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._refreshing.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "staleHits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _drop(self, key):
+        e = self._data.pop(key)
+        self._bytes -= e.size
@@ -0,0 +1,64 @@
+"""
+HTTP validators and caching headers for the polled API endpoints.
+
+Views build a Validators from whatever their output is derived from (the
+upstream response digest or issue time, plus the request parameters that
+shape the output) before doing any aggregation. If the client's
+If-None-Match / If-Modified-Since still matches, they answer 304 right away;
+otherwise apply() stamps ETag, Last-Modified and Cache-Control on the full
+response.
+"""
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+HTTP_SWR_SECS = 120
+
+
+def etag_for(*parts):
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(str(p).encode())
+        h.update(b"\0")
+    return f'"{h.hexdigest()[:24]}"'
+
+
+def etag_matches(request, etag):
+    """If-None-Match check with weak comparison (compression marks our ETags weak)."""
+    client = parse_etags(request.headers.get("If-None-Match", ""))
+    return "*" in client or etag.removeprefix("W/") in {e.removeprefix("W/") for e in client}
+
+
+def cache_control(max_age, swr=HTTP_SWR_SECS, public=True):
+    scope = "public" if public else "private"
+    return f"{scope}, max-age={max(0, int(max_age))}, stale-while-revalidate={max(0, int(swr))}"
+
+
+class Validators:
+    __slots__ = ("etag", "last_modified", "cache_control")
+
+    def __init__(self, etag, last_modified=None, cache_control=None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.cache_control = cache_control
+
+    def fresh_for(self, request):
+        """True when the client's cached copy is still current (If-None-Match wins over If-Modified-Since)."""
+        if request.headers.get("If-None-Match"):
+            return etag_matches(request, self.etag)
+        ims = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+        return ims is not None and self.last_modified is not None and int(self.last_modified.timestamp()) <= ims
+
+    def not_modified(self):
+        return self.apply(HttpResponseNotModified())
+
+    def apply(self, response):
+        if response.status_code not in (200, 304):
+            return response
+        response["ETag"] = self.etag
+        if self.last_modified is not None:
+            response["Last-Modified"] = http_date(self.last_modified.timestamp())
+        if self.cache_control:
+            response["Cache-Control"] = self.cache_control
+        return response
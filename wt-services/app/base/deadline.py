@@ -0,0 +1,108 @@
+"""
+End-to-end request deadlines.
+
+DeadlineMiddleware gives every request a time budget (REQUEST_DEADLINE_SECS,
+or a longer one from REQUEST_DEADLINES for routes that fan out, like the map).
+The absolute deadline sits in a contextvar, so it follows the request into
+sync_to_async/to_thread and, via in_context(), into worker-thread pools.
+
+Upstream helpers ask timeout(default) for their per-call timeout: the default
+clipped to what's left of the budget, or DeadlineExceeded when nothing is.
+Retry loops ask allows(delay) before sleeping for a backoff. Outside a request
+(background refreshes, prefetch, management commands) there is no deadline
+and the defaults apply unchanged.
+"""
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REQUEST_DEADLINE_SECS = 15
+REQUEST_DEADLINES = {"/api/map-html/": 25}   # path prefix -> seconds
+MIN_CALL_TIMEOUT_SECS = 0.05   # below this an upstream call can't succeed; fail instead
+
+_DEADLINE = contextvars.ContextVar("wt_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def remaining():
+    """Seconds left in the current request's budget, or None without a deadline."""
+    d = _DEADLINE.get()
+    return None if d is None else d - time.monotonic()
+
+
+def timeout(default):
+    """Per-call timeout: default, clipped to the remaining budget; raises DeadlineExceeded when it's spent."""
+    left = remaining()
+    if left is None:
+        return default
+    if left < MIN_CALL_TIMEOUT_SECS:
+        raise DeadlineExceeded("request deadline exceeded")
+    return min(default, left)
+
+
+def expired():
+    """True once the current request's budget is spent (never without a deadline)."""
+    left = remaining()
+    return left is not None and left < MIN_CALL_TIMEOUT_SECS
+
+
+def allows(delay):
+    """Whether waiting `delay` seconds (a retry backoff) still leaves time for another attempt."""
+    left = remaining()
+    return left is None or left - delay >= MIN_CALL_TIMEOUT_SECS
+
+
+@contextmanager
+def scope(seconds):
+    """Runs the block with a deadline `seconds` from now (never later than an enclosing one)."""
+    d = time.monotonic() + seconds
+    outer = _DEADLINE.get()
+    token = _DEADLINE.set(d if outer is None else min(outer, d))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def in_context(fn):
+    """fn bound to a copy of the caller's context, for thread pools (they don't inherit contextvars)."""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def budget_for(path):
+    for prefix, secs in getattr(settings, "REQUEST_DEADLINES", REQUEST_DEADLINES).items():
+        if path.startswith(prefix):
+            return secs
+    return getattr(settings, "REQUEST_DEADLINE_SECS", REQUEST_DEADLINE_SECS)
+
+
+class DeadlineMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with scope(budget_for(request.path_info)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with scope(budget_for(request.path_info)):
+            return await self.get_response(request)
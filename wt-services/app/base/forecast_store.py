@@ -0,0 +1,176 @@
+"""
+Persistent store of fetched OWM forecasts.
+
+Every forecast fetched from upstream is handed to archive(), which queues it
+for a background writer thread; the writer drains the queue in batches and
+saves each one as a ForecastSnapshot plus its 3-hour ForecastSlice rows with
+bulk_create, so requests never wait on the database. latest() reads a
+snapshot's original response bytes back for cold-cache misses (so the body
+and its ETag match what the live fetch served), and ForecastSlice.objects
+range queries cover the kept history: the writer deletes snapshots older
+than FORECAST_STORE_RETAIN_HOURS at most every FORECAST_STORE_PRUNE_EVERY_SECS.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import ForecastSlice, ForecastSnapshot
+
+log = logging.getLogger(__name__)
+
+FORECAST_STORE_MAX_AGE     = timedelta(minutes=30)   # how old a snapshot may be and still be served
+FORECAST_STORE_QUEUE_SIZE  = 256
+FORECAST_STORE_WRITE_BATCH = 32
+FORECAST_STORE_RETAIN_HOURS = 48          # history kept for range queries; older snapshots are deleted
+FORECAST_STORE_PRUNE_EVERY_SECS = 600
+
+_QUEUE = queue.Queue(maxsize=getattr(settings, "FORECAST_STORE_QUEUE_SIZE", FORECAST_STORE_QUEUE_SIZE))
+_WRITER = None
+_LOCK = threading.Lock()
+_LAST_PRUNE = None
+
+
+def enabled():
+    return getattr(settings, "FORECAST_STORE_ENABLED", True)
+
+
+def _num(v):
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+
+def _slice_rows(snap, items):
+    rows = []
+    for item in items:
+        ts = item.get("dt")
+        if not isinstance(ts, (int, float)):
+            continue
+        main = item.get("main") or {}
+        rows.append(ForecastSlice(
+            snapshot=snap, lat=snap.lat, lon=snap.lon, units=snap.units,
+            valid_at=datetime.fromtimestamp(ts, tz=dt_timezone.utc), issued_at=snap.issued_at,
+            temp=_num(main.get("temp")), humidity=_num(main.get("humidity")),
+            wind=_num((item.get("wind") or {}).get("speed")), pop=_num(item.get("pop")),
+            raw=item,
+        ))
+    return rows
+
+
+def save(lat, lon, units, payload, issued_at, body=None):
+    """Synchronously writes one snapshot (with the response bytes, if given) and its slices; returns the snapshot."""
+    items = (payload or {}).get("list") or []
+    with transaction.atomic():
+        snap = ForecastSnapshot.objects.create(
+            lat=lat, lon=lon, units=units, issued_at=issued_at,
+            city=(payload or {}).get("city") or {}, slice_count=len(items), body=body,
+        )
+        ForecastSlice.objects.bulk_create(_slice_rows(snap, items), batch_size=500)
+    return snap
+
+
+def latest(lat, lon, units, max_age=None):
+    """(response bytes, issued_at) of the newest snapshot still within max_age, else None."""
+    max_age = max_age or getattr(settings, "FORECAST_STORE_MAX_AGE", FORECAST_STORE_MAX_AGE)
+    snap = ForecastSnapshot.latest(lat, lon, units, max_age)
+    if snap is None or not snap.slice_count:
+        return None
+    return snap.content(), snap.issued_at
+
+
+def prune(now=None):
+    """Deletes snapshots (and their slices) issued over FORECAST_STORE_RETAIN_HOURS ago; returns how many."""
+    hours = getattr(settings, "FORECAST_STORE_RETAIN_HOURS", FORECAST_STORE_RETAIN_HOURS)
+    cutoff = (now or datetime.now(dt_timezone.utc)) - timedelta(hours=hours)
+    _, per_model = ForecastSnapshot.objects.filter(issued_at__lt=cutoff).delete()
+    return per_model.get(ForecastSnapshot._meta.label, 0)
+
+
+def _maybe_prune():
+    global _LAST_PRUNE
+    now = time.monotonic()
+    if _LAST_PRUNE is not None and now - _LAST_PRUNE < getattr(
+            settings, "FORECAST_STORE_PRUNE_EVERY_SECS", FORECAST_STORE_PRUNE_EVERY_SECS):
+        return
+    _LAST_PRUNE = now
+    try:
+        n = prune()
+        if n:
+            log.info("Forecast store pruned %d old snapshots", n)
+    except Exception:
+        log.exception("Forecast store prune failed")
+
+
+# -----------------------------
+# Background writer
+# -----------------------------
+def archive(lat, lon, units, content, issued_at):
+    """
+    Queues a fetched forecast (raw response bytes or a parsed payload) for the
+    writer; drops it with a warning if the writer is behind.
+    """
+    if not enabled():
+        return
+    ensure_started()
+    try:
+        _QUEUE.put_nowait((lat, lon, units, content, issued_at))
+    except queue.Full:
+        log.warning("Forecast store queue full; dropping snapshot for %s,%s", lat, lon)
+
+
+def _drain():
+    batch = [_QUEUE.get()]
+    limit = getattr(settings, "FORECAST_STORE_WRITE_BATCH", FORECAST_STORE_WRITE_BATCH)
+    while len(batch) < limit:
+        try:
+            batch.append(_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write_batch(batch):
+    # One commit per batch; each snapshot gets its own savepoint so a bad one doesn't sink the rest
+    with transaction.atomic():
+        for lat, lon, units, content, issued_at in batch:
+            try:
+                if isinstance(content, (bytes, str)):
+                    body = content.encode() if isinstance(content, str) else bytes(content)
+                    save(lat, lon, units, json.loads(body), issued_at, body=body)
+                else:
+                    save(lat, lon, units, content, issued_at)
+            except Exception:
+                log.exception("Forecast snapshot write failed for %s,%s", lat, lon)
+
+
+def _run():
+    while True:
+        batch = _drain()
+        try:
+            close_old_connections()
+            _write_batch(batch)
+            _maybe_prune()
+        except Exception:
+            log.exception("Forecast store batch failed")
+        finally:
+            for _ in batch:
+                _QUEUE.task_done()
+
+
+def ensure_started():
+    global _WRITER
+    if _WRITER is not None:
+        return
+    with _LOCK:
+        if _WRITER is None:
+            _WRITER = threading.Thread(target=_run, name="forecast-store", daemon=True)
+            _WRITER.start()
+
+
+def flush():
+    """Blocks until everything queued so far has been written."""
+    _QUEUE.join()
@@ -0,0 +1,203 @@
+"""
+Local city gazetteer for /api/locations autocomplete.
+
+Cities are loaded once from a TSV (GAZETTEER_PATH, defaulting to the bundled
+base/data/cities.tsv; `manage.py build_gazetteer` builds a larger one from
+GeoNames) into two indexes:
+
+* a sorted array of normalized names, searched with bisect, for prefix
+  matches ("char" -> Charlotte, Charleston, ...);
+* a trigram -> city-id inverted index, used only when no name has the
+  prefix, for misspellings ("charlote").
+
+Results are ranked by population. Any prefix hit is a complete answer;
+/api/locations asks the OWM geocoder only when there is none and ranks
+trigram guesses behind its matches (see views.get_locations), so deployments
+that need more places than the bundled file should build a bigger one. A
+trailing ", NC" / ", North Carolina" / ", US" in the query filters on state
+code, state name or country code.
+"""
+import logging
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "data", "cities.tsv")
+TRIGRAM_MIN_QUERY = 4       # shorter queries are too ambiguous to fuzz
+TRIGRAM_MIN_SCORE = 0.45    # Dice coefficient over padded trigrams
+SHORT_PREFIX_MEMO = 2       # prefixes up to this length have their ranked matches memoized
+
+_PUNCT = re.compile(r"[^\w\s]+")
+
+
+def normalize(text):
+    """Lowercase, accents stripped, punctuation dropped, whitespace collapsed: 'São  Paulo!' -> 'sao paulo'."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_PUNCT.sub(" ", text.lower()).split())
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class City:
+    __slots__ = ("name", "admin1", "state", "country", "lat", "lon", "population", "key", "_filter_keys")
+
+    def __init__(self, name, admin1, state, country, lat, lon, population):
+        self.name = name
+        self.admin1 = admin1
+        self.state = state
+        self.country = country
+        self.lat = lat
+        self.lon = lon
+        self.population = population
+        self.key = normalize(name)
+        self._filter_keys = (admin1.lower(), country.lower(), normalize(state))
+
+    def matches(self, filters):
+        """Every filter term must match the state code, country code or a state name prefix."""
+        admin1, country, state = self._filter_keys
+        return all(f in (admin1, country) or (len(f) > 2 and state.startswith(f)) for f in filters)
+
+    def as_result(self):
+        return {
+            "id": f"{self.name},{self.state or ''},{self.country or ''}".strip(", "),
+            "name": self.name,
+            "state": self.state or None,
+            "country": self.country,
+            "lat": self.lat,
+            "lon": self.lon,
+        }
+
+
+class Gazetteer:
+    def __init__(self, cities):
+        self.cities = list(cities)
+        order = sorted(range(len(self.cities)), key=lambda i: self.cities[i].key)
+        self._keys = [self.cities[i].key for i in order]
+        self._ids = order
+        self._trigrams = {}
+        self._gram_counts = []
+        for i, c in enumerate(self.cities):
+            grams = _trigrams(c.key)
+            self._gram_counts.append(len(grams))
+            for g in grams:
+                self._trigrams.setdefault(g, []).append(i)
+        self._memo = {}
+
+    @classmethod
+    def load(cls, path):
+        cities = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                parts = line.rstrip("\n").split("\t")
+                try:
+                    name, admin1, state, country, lat, lon, pop = parts[:7]
+                    cities.append(City(name, admin1, state, country, float(lat), float(lon), int(pop or 0)))
+                except ValueError:
+                    continue
+        return cls(cities)
+
+    def _prefix_ids(self, prefix):
+        lo = bisect_left(self._keys, prefix)
+        hi = lo
+        while hi < len(self._keys) and self._keys[hi].startswith(prefix):
+            hi += 1
+        return self._ids[lo:hi]
+
+    def _ranked_prefix(self, prefix):
+        if len(prefix) > SHORT_PREFIX_MEMO:
+            return sorted(self._prefix_ids(prefix), key=lambda i: -self.cities[i].population)
+        hit = self._memo.get(prefix)
+        if hit is None:
+            hit = self._memo[prefix] = sorted(self._prefix_ids(prefix), key=lambda i: -self.cities[i].population)
+        return hit
+
+    def _fuzzy_ids(self, key):
+        grams = _trigrams(key)
+        shared = Counter(i for g in grams for i in self._trigrams.get(g, ()))
+        scored = []
+        for i, n in shared.items():
+            dice = 2.0 * n / (len(grams) + self._gram_counts[i])
+            if dice >= TRIGRAM_MIN_SCORE:
+                scored.append((dice, self.cities[i].population, i))
+        return [i for _, _, i in sorted(scored, reverse=True)]
+
+    def search(self, query, limit=10):
+        """Up to `limit` result dicts (the /api/locations shape), best first; [] when nothing matches."""
+        return self.match(query, limit)[0]
+
+    def match(self, query, limit=10):
+        """(results, fuzzy): fuzzy is True when the results are trigram guesses rather than name-prefix hits."""
+        name, _, rest = (query or "").partition(",")
+        key = normalize(name)
+        if not key:
+            return [], False
+        filters = [f for f in (normalize(p) for p in rest.split(",")) if f]
+
+        def take(ids):
+            out = (self.cities[i] for i in ids)
+            if filters:
+                out = (c for c in out if c.matches(filters))
+            return [c.as_result() for c in islice(out, limit)]
+
+        results = take(self._ranked_prefix(key))
+        if not results and len(key) >= TRIGRAM_MIN_QUERY:
+            return take(self._fuzzy_ids(key)), True
+        return results, False
+
+    def __len__(self):
+        return len(self.cities)
+
+
+_GAZETTEER = None
+_LOCK = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, "GAZETTEER_ENABLED", True)
+
+
+def get():
+    """The process-wide gazetteer, loaded on first use; an empty one if the data file is missing."""
+    global _GAZETTEER
+    if _GAZETTEER is None:
+        with _LOCK:
+            if _GAZETTEER is None:
+                path = getattr(settings, "GAZETTEER_PATH", None) or DEFAULT_PATH
+                try:
+                    _GAZETTEER = Gazetteer.load(path)
+                except OSError:
+                    log.warning("Gazetteer file %s not readable; autocomplete goes to OWM", path)
+                    _GAZETTEER = Gazetteer([])
+    return _GAZETTEER
+
+
+def search(query, limit=10):
+    return get().search(query, limit)
+
+
+def match(query, limit=10):
+    return get().match(query, limit)
+
+
+def location_key(result):
+    """(name, state, country) normalized, for de-duplicating gazetteer and OWM results."""
+    return tuple(normalize(result.get(k) or "") for k in ("name", "state", "country"))
+
+
+def reset():
+    global _GAZETTEER
+    _GAZETTEER = None
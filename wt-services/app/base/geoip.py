@@ -0,0 +1,190 @@
+"""
+Client IP -> (lat, lon) resolution.
+
+The default chain looks the client address up in a local IP-range database
+(a sorted, memory-mapped binary file built by `manage.py build_geoip_db`);
+geocoder's remote lookup on misses is opt-in (GEOIP_REMOTE_FALLBACK), since
+every unknown address would otherwise cost a third-party call. Until a range
+DB is installed the remote lookup is the whole chain, so a stock checkout
+still works. Results are kept in a small LRU (misses only briefly). Swap the
+whole thing out with the GEOIP_RESOLVER setting (dotted path to a class with
+a resolve(ip) method).
+"""
+import ipaddress
+import logging
+import mmap
+import os
+import struct
+import threading
+
+import geocoder
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+GEOIP_CACHE_SIZE = 4096
+GEOIP_HIT_TTL    = 24 * 3600
+GEOIP_MISS_TTL   = 60       # misses may be a flaky remote lookup; retry soon
+TRUSTED_PROXY_COUNT = 0     # reverse proxies in front of the app that append X-Forwarded-For
+
+# File layout: 8-byte magic, uint32 record count, then four contiguous columns
+# (start, end as uint32; lat, lon as float32) sorted by start, so the search
+# only ever touches the pages of the start column it needs.
+DB_MAGIC = b"WTGEOIP1"
+DB_HEADER = struct.Struct("<8sI")
+DB_COLUMNS = (("start", "<u4"), ("end", "<u4"), ("lat", "<f4"), ("lon", "<f4"))
+
+
+def client_ip(request):
+    """
+    The client address as seen by the outermost proxy we run. Each of the
+    TRUSTED_PROXY_COUNT proxies appends one X-Forwarded-For hop, so the client
+    is that many hops from the right; anything further left is whatever the
+    client chose to send. With no trusted proxies (the default), REMOTE_ADDR.
+    """
+    remote = request.META.get("REMOTE_ADDR") or None
+    trusted = int(getattr(settings, "TRUSTED_PROXY_COUNT", TRUSTED_PROXY_COUNT) or 0)
+    if trusted <= 0:
+        return remote
+    hops = [p.strip() for p in (request.META.get("HTTP_X_FORWARDED_FOR") or "").split(",") if p.strip()]
+    if len(hops) < trusted:
+        return remote
+    try:
+        return str(ipaddress.ip_address(hops[-trusted]))
+    except ValueError:
+        return remote
+
+
+def write_db(path, ranges):
+    """Writes (start_ip, end_ip, lat, lon) ranges, IPs as ints or strings, in the resolver's format."""
+    rows = []
+    for start, end, lat, lon in ranges:
+        rows.append((int(ipaddress.IPv4Address(start)), int(ipaddress.IPv4Address(end)), lat, lon))
+    rows.sort()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(DB_HEADER.pack(DB_MAGIC, len(rows)))
+        for i, (_, dtype) in enumerate(DB_COLUMNS):
+            f.write(np.array([r[i] for r in rows], dtype=dtype).tobytes())
+    os.replace(tmp, path)
+    return len(rows)
+
+
+class RangeDbResolver:
+    """Binary search over a memory-mapped, start-sorted IPv4 range table."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._records = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._records is None:
+                with open(self.path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count = DB_HEADER.unpack_from(mm, 0)
+                if magic != DB_MAGIC:
+                    raise ValueError(f"{self.path} is not a geoip range database")
+                cols, offset = {}, DB_HEADER.size
+                for name, dtype in DB_COLUMNS:
+                    cols[name] = np.frombuffer(mm, dtype=dtype, count=count, offset=offset)
+                    offset += count * np.dtype(dtype).itemsize
+                self._records = cols
+        return self._records
+
+    def resolve(self, ip):
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if addr.version != 4:
+            return None
+        recs = self._load()
+        n = int(addr)
+        i = int(np.searchsorted(recs["start"], n, side="right")) - 1
+        if i < 0 or n > int(recs["end"][i]):
+            return None
+        return float(recs["lat"][i]), float(recs["lon"][i])
+
+
+class RemoteResolver:
+    """geocoder's HTTP lookup; private/loopback clients resolve to the server's own location."""
+
+    def resolve(self, ip):
+        try:
+            addr = ipaddress.ip_address(ip)
+            target = "me" if (addr.is_private or addr.is_loopback) else str(addr)
+        except ValueError:
+            target = "me"
+        loc = geocoder.ip(target)
+        if not loc or not loc.latlng:
+            return None
+        lat, lon = map(float, loc.latlng)
+        return lat, lon
+
+
+class ChainResolver:
+    def __init__(self, resolvers):
+        self.resolvers = list(resolvers)
+
+    def resolve(self, ip):
+        for r in self.resolvers:
+            try:
+                hit = r.resolve(ip)
+            except Exception:
+                log.warning("%s failed for %s", type(r).__name__, ip, exc_info=True)
+                continue
+            if hit is not None:
+                return hit
+        return None
+
+
+def _default_resolver():
+    chain = []
+    path = getattr(settings, "GEOIP_DB_PATH", None)
+    if path and os.path.exists(path):
+        chain.append(RangeDbResolver(path))
+    # Without a range DB the remote lookup is the only way to place anyone, so it's used regardless
+    if not chain or getattr(settings, "GEOIP_REMOTE_FALLBACK", False):
+        chain.append(RemoteResolver())
+    return ChainResolver(chain)
+
+
+_RESOLVER = None
+
+def get_resolver():
+    global _RESOLVER
+    if _RESOLVER is None:
+        dotted = getattr(settings, "GEOIP_RESOLVER", None)
+        _RESOLVER = import_string(dotted)() if dotted else _default_resolver()
+    return _RESOLVER
+
+
+_RESULTS = TTLCache(max_entries=GEOIP_CACHE_SIZE, name="geoip")
+
+def resolve(ip):
+    hit, state = _RESULTS.get(ip)
+    if state is not None:
+        return hit
+    hit = get_resolver().resolve(ip)
+    _RESULTS.set(ip, hit, GEOIP_HIT_TTL if hit is not None else GEOIP_MISS_TTL)
+    return hit
+
+
+def clear_cache():
+    global _RESOLVER
+    _RESULTS.clear()
+    _RESOLVER = None
+
+
+def locate_request(request):
+    """(lat, lon) for the client behind request; raises ValueError when it can't be determined."""
+    hit = resolve(client_ip(request) or "")
+    if hit is None:
+        raise ValueError("Could not geolocate client IP.")
+    return hit
@@ -0,0 +1,188 @@
+"""
+Hedged upstream requests (opt-in: HEDGE_ENABLED).
+
+Recent latencies are kept per provider and upstream path. Once a path has
+HEDGE_MIN_SAMPLES of them, a call that hasn't answered within the path's
+HEDGE_PERCENTILE latency gets a duplicate GET, and whichever finishes first
+wins. That trims the slow-upstream tail at the cost of roughly
+(100 - HEDGE_PERCENTILE)% extra calls.
+
+A hedge is only sent while the provider's breaker is closed, the shared quota
+grants it (see resilience.admit) and the request deadline leaves room for it.
+Sync callers run both attempts on a small shared pool, so a losing requests
+call finishes in the background; when the pool is saturated calls simply run
+unhedged. Async callers cancel the loser.
+"""
+import asyncio
+import collections
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from . import deadline, metrics, resilience
+
+HEDGE_ENABLED        = False
+HEDGE_PERCENTILE     = 95
+HEDGE_MIN_SAMPLES    = 20
+HEDGE_WINDOW         = 200     # latencies kept per provider/path
+HEDGE_MIN_DELAY_SECS = 0.05
+HEDGE_MAX_INFLIGHT   = 16      # hedged sync calls at once (each may hold two pool threads)
+
+
+class LatencyWindow:
+    """The last `size` latencies of one upstream path and their percentile."""
+
+    def __init__(self, size=HEDGE_WINDOW):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._sorted = None
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._sorted = None
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        with self._lock:
+            if not self._samples:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            s = self._sorted
+        return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+
+_WINDOWS = {}
+_LOCK = threading.Lock()
+_POOL = None
+_SLOTS = threading.BoundedSemaphore(HEDGE_MAX_INFLIGHT)
+
+
+def enabled():
+    return getattr(settings, "HEDGE_ENABLED", HEDGE_ENABLED)
+
+
+def window(provider, url):
+    key = (provider, metrics.upstream_path(provider, url))
+    w = _WINDOWS.get(key)
+    if w is None:
+        with _LOCK:
+            w = _WINDOWS.setdefault(key, LatencyWindow(getattr(settings, "HEDGE_WINDOW", HEDGE_WINDOW)))
+    return w
+
+
+def hedge_delay(provider, url):
+    """Seconds to wait before hedging a call to url, or None while there's too little history."""
+    w = window(provider, url)
+    if len(w) < getattr(settings, "HEDGE_MIN_SAMPLES", HEDGE_MIN_SAMPLES):
+        return None
+    return max(getattr(settings, "HEDGE_MIN_DELAY_SECS", HEDGE_MIN_DELAY_SECS),
+               w.percentile(getattr(settings, "HEDGE_PERCENTILE", HEDGE_PERCENTILE)))
+
+
+def _has_room(provider, delay):
+    left = deadline.remaining()
+    if left is not None and left <= delay + deadline.MIN_CALL_TIMEOUT_SECS:
+        return False
+    return resilience.breaker(provider).state == resilience.CLOSED
+
+
+def _may_hedge(provider, delay):
+    return _has_room(provider, delay) and resilience.admit(provider) is None
+
+
+async def _amay_hedge(provider, delay):
+    return _has_room(provider, delay) and await resilience.aadmit(provider) is None
+
+
+def _pool():
+    global _POOL
+    if _POOL is None:
+        with _LOCK:
+            if _POOL is None:
+                _POOL = ThreadPoolExecutor(max_workers=2 * HEDGE_MAX_INFLIGHT, thread_name_prefix="hedge")
+    return _POOL
+
+
+def _timed(w, fn):
+    t0 = time.perf_counter()
+    result = fn()
+    w.observe(time.perf_counter() - t0)
+    return result
+
+
+def call(provider, url, fn):
+    """fn() (one upstream GET), hedged with a second fn() once it runs past the learned delay."""
+    if not enabled():
+        return fn()
+    w = window(provider, url)
+    delay = hedge_delay(provider, url)
+    if delay is None or not _SLOTS.acquire(blocking=False):
+        return _timed(w, fn)
+    try:
+        pool = _pool()
+        first = pool.submit(deadline.in_context(_timed), w, fn)
+        done, _ = wait([first], timeout=delay)
+        if done or not _may_hedge(provider, delay):
+            return first.result()
+        metrics.hedged(provider, "sent")
+        second = pool.submit(deadline.in_context(_timed), w, fn)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is second:
+                        metrics.hedged(provider, "won")
+                    return f.result()
+                error = error or f.exception()
+        raise error
+    finally:
+        _SLOTS.release()
+
+
+async def acall(provider, url, fn):
+    """Async call(): fn is a coroutine function; the losing attempt is cancelled."""
+    if not enabled():
+        return await fn()
+    w = window(provider, url)
+    delay = hedge_delay(provider, url)
+
+    async def timed():
+        t0 = time.perf_counter()
+        result = await fn()
+        w.observe(time.perf_counter() - t0)
+        return result
+
+    if delay is None:
+        return await timed()
+    first = asyncio.ensure_future(timed())
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not await _amay_hedge(provider, delay):
+            return await first
+        metrics.hedged(provider, "sent")
+        second = asyncio.ensure_future(timed())
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    if t is second:
+                        metrics.hedged(provider, "won")
+                    return t.result()
+                error = error or t.exception()
+        raise error
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+def reset():
+    _WINDOWS.clear()
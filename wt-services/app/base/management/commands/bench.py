@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base import bench
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the API routes in-process against a local OWM/NWS stub and print a JSON report "
+            "(throughput, p50/p95/p99 latency, upstream calls per request).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--routes", default=",".join(bench.ROUTES),
+                            help="Comma-separated routes as in base/urls.py (default: all upstream-bound routes)")
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests per route")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--warmup", type=int, default=0, help="Unmeasured requests per route first")
+        parser.add_argument("--locations", type=int, default=20, help="Distinct locations the requests cycle through")
+        parser.add_argument("--payloads", default=None, help="Directory of recorded <name>.json upstream payloads")
+        parser.add_argument("--latency-ms", type=float, default=50.0, help="Stub upstream latency")
+        parser.add_argument("--jitter-ms", type=float, default=0.0, help="+/- uniform jitter on the latency")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream calls answered 503")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--warm-caches", action="store_true", help="Keep in-process caches from before the run")
+        parser.add_argument("--out", default=None, help="Write the report here instead of stdout")
+
+    def handle(self, *args, **opts):
+        routes = [r.strip().lstrip("/") for r in opts["routes"].split(",") if r.strip()]
+        unknown = [r for r in routes if r not in bench.ROUTES]
+        if unknown:
+            raise CommandError(f"Unknown route(s): {', '.join(unknown)}; choose from {', '.join(bench.ROUTES)}")
+        if not 0.0 <= opts["error_rate"] <= 1.0:
+            raise CommandError("--error-rate must be between 0 and 1")
+        if opts["requests"] < 1 or opts["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        report = bench.run(
+            routes=routes, requests=opts["requests"], concurrency=opts["concurrency"], warmup=opts["warmup"],
+            locations=opts["locations"], payload_dir=opts["payloads"], latency_ms=opts["latency_ms"],
+            jitter_ms=opts["jitter_ms"], error_rate=opts["error_rate"], seed=opts["seed"],
+            cold=not opts["warm_caches"],
+        )
+        text = json.dumps(report, indent=2)
+        if opts["out"]:
+            with open(opts["out"], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote benchmark report to {opts['out']}"))
+        else:
+            self.stdout.write(text)
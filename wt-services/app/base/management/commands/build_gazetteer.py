@@ -0,0 +1,47 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from base import gazetteer
+
+
+class Command(BaseCommand):
+    help = "Build the autocomplete gazetteer TSV from a GeoNames cities dump (e.g. cities15000.txt)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("cities_path", help="GeoNames cities*.txt (tab-separated, no header)")
+        parser.add_argument("--admin1", default=None, help="GeoNames admin1CodesASCII.txt, for state names")
+        parser.add_argument("--out", default=None, help="Output path (defaults to settings.GAZETTEER_PATH or the bundled file)")
+        parser.add_argument("--min-population", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        out = opts["out"] or getattr(settings, "GAZETTEER_PATH", None) or gazetteer.DEFAULT_PATH
+
+        states = {}
+        if opts["admin1"]:
+            with open(opts["admin1"], encoding="utf-8") as f:
+                for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                    if len(row) >= 2:
+                        states[row[0]] = row[1]
+
+        n = 0
+        with open(opts["cities_path"], encoding="utf-8") as src, open(out, "w", encoding="utf-8") as dst:
+            dst.write("# name\tadmin1\tstate\tcountry\tlat\tlon\tpopulation\n")
+            for row in csv.reader(src, delimiter="\t", quoting=csv.QUOTE_NONE):
+                if len(row) < 15:
+                    continue
+                try:
+                    pop = int(row[14] or 0)
+                    lat, lon = float(row[4]), float(row[5])
+                except ValueError:
+                    continue
+                if pop < opts["min_population"]:
+                    continue
+                country, admin1 = row[8], row[10]
+                state = states.get(f"{country}.{admin1}", "")
+                dst.write(f"{row[1]}\t{admin1}\t{state}\t{country}\t{lat:.4f}\t{lon:.4f}\t{pop}\n")
+                n += 1
+
+        gazetteer.reset()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {n} cities to {out}"))
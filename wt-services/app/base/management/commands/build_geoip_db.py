@@ -0,0 +1,40 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base import geoip
+
+
+class Command(BaseCommand):
+    help = "Build the local IP-range geolocation database from a CSV of IPv4 ranges."
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", help="CSV with start_ip,end_ip,...,lat,...,lon rows")
+        parser.add_argument("--out", default=None, help="Output path (defaults to settings.GEOIP_DB_PATH)")
+        parser.add_argument("--lat-col", type=int, default=2, help="0-based latitude column")
+        parser.add_argument("--lon-col", type=int, default=3, help="0-based longitude column")
+        parser.add_argument("--skip-header", action="store_true")
+
+    def handle(self, *args, **opts):
+        out = opts["out"] or getattr(settings, "GEOIP_DB_PATH", None)
+        if not out:
+            raise CommandError("No --out given and GEOIP_DB_PATH is not set")
+
+        def rows():
+            with open(opts["csv_path"], newline="") as f:
+                reader = csv.reader(f)
+                if opts["skip_header"]:
+                    next(reader, None)
+                for row in reader:
+                    # IPv6 ranges are skipped; the resolver is IPv4-only
+                    if not row or ":" in row[0]:
+                        continue
+                    try:
+                        yield row[0], row[1], float(row[opts["lat_col"]]), float(row[opts["lon_col"]])
+                    except (IndexError, ValueError):
+                        continue
+
+        n = geoip.write_db(out, rows())
+        geoip.clear_cache()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {n} ranges to {out}"))
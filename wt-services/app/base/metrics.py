@@ -0,0 +1,268 @@
+"""
+Prometheus metrics.
+
+Request latency per route, upstream latency/status per provider and path,
+urllib3 and async retries, single-flight coalescing, upstream connection
+pools, in-process cache lookups and in-flight requests.
+
+Under gunicorn every worker is its own process, so set PROMETHEUS_MULTIPROC_DIR
+(the Dockerfile does) before the app is imported: prometheus_client then keeps
+values in per-process files, /metrics merges them, and gunicorn.conf.py's
+child_exit hook drops a dead worker's live gauges. Without it the registry is
+plain in-process, which is what tests and runserver use.
+"""
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+
+from . import deadline
+
+log = logging.getLogger(__name__)
+
+UPSTREAM_SLOW_SECS = 2.0   # upstream calls slower than this are also logged
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    "wt_http_request_duration_seconds", "Time to produce a response, by route pattern.",
+    ["route", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "wt_http_requests_in_flight", "Requests currently being handled, per worker.",
+    multiprocess_mode="liveall",
+)
+UPSTREAM_LATENCY = Histogram(
+    "wt_upstream_request_duration_seconds", "Upstream call time including client-side retries.",
+    ["provider", "path"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "wt_upstream_responses_total", "Upstream calls by final status (or 'timeout' / 'error').",
+    ["provider", "path", "status"],
+)
+UPSTREAM_RETRIES = Counter(
+    "wt_upstream_retries_total", "Retries made against an upstream, by what triggered them.",
+    ["provider", "reason"],
+)
+UPSTREAM_REJECTED = Counter(
+    "wt_upstream_rejected_total", "Upstream calls not made: circuit open or shared quota exhausted.",
+    ["provider", "reason"],
+)
+UPSTREAM_HEDGES = Counter(
+    "wt_upstream_hedges_total", "Duplicate upstream GETs sent for slow calls ('sent') and how many answered first ('won').",
+    ["provider", "outcome"],
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "wt_singleflight_calls_total", "Single-flight calls by group: 'leader' ran the fetch, 'coalesced' shared one.",
+    ["group", "role"],
+)
+CACHE_LOOKUPS = Counter(
+    "wt_cache_lookups_total", "In-process cache lookups by outcome.", ["cache", "result"],
+)
+CACHE_EVICTIONS = Counter(
+    "wt_cache_evictions_total", "Entries pushed out of an in-process cache by its size bounds.", ["cache"],
+)
+
+# Upstream URLs carry coordinates and grid ids; collapse them so label sets stay bounded
+_NWS_PATHS = (
+    (re.compile(r"^/points/"), "/points"),
+    (re.compile(r"^/gridpoints/[^/]+/[^/]+/forecast/hourly"), "/gridpoints/forecast/hourly"),
+    (re.compile(r"^/gridpoints/[^/]+/[^/]+/forecast"), "/gridpoints/forecast"),
+    (re.compile(r"^/gridpoints/"), "/gridpoints"),
+    (re.compile(r"^/alerts/active"), "/alerts/active"),
+    (re.compile(r"^/zones/"), "/zones"),
+)
+
+
+def upstream_path(provider, url):
+    path = urlsplit(url).path or "/"
+    if provider == "nws":
+        return next((label for rx, label in _NWS_PATHS if rx.match(path)), "other")
+    return path
+
+
+def observe_upstream(provider, url, seconds, status):
+    path = upstream_path(provider, url)
+    UPSTREAM_LATENCY.labels(provider, path).observe(seconds)
+    UPSTREAM_RESPONSES.labels(provider, path, str(status)).inc()
+    if seconds >= getattr(settings, "UPSTREAM_SLOW_SECS", UPSTREAM_SLOW_SECS):
+        log.warning("Slow %s upstream call: %s took %.2fs (status %s)", provider, path, seconds, status)
+
+
+@contextmanager
+def upstream_call(provider, url):
+    """Times the block; set .status on the yielded object (exceptions are recorded as 'error')."""
+    call = _Call()
+    t0 = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        if call.status is None:
+            call.status = "error"
+        raise
+    finally:
+        observe_upstream(provider, url, time.perf_counter() - t0, call.status or "error")
+
+
+class _Call:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = None
+
+
+def retried(provider, reason):
+    UPSTREAM_RETRIES.labels(provider, str(reason)).inc()
+
+
+class CountingRetry(Retry):
+    """
+    urllib3 Retry that counts every retry it grants, labelled by provider and status/error,
+    and gives up early when the backoff would run past the request deadline.
+    """
+
+    def __init__(self, *args, provider="upstream", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.provider = provider
+
+    def new(self, **kw):
+        r = super().new(**kw)
+        r.provider = self.provider
+        return r
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        # super() raises MaxRetryError once exhausted, so reaching the count means a retry will happen
+        r = super().increment(method, url, response, error, _pool, _stacktrace)
+        if not deadline.allows(r.get_backoff_time()):
+            # Same outcome as running out of retries: the last response, or the last error
+            raise MaxRetryError(_pool, url, error) from error
+        reason = response.status if response is not None and response.status else type(error).__name__
+        retried(self.provider, reason)
+        return r
+
+
+def hedged(provider, outcome):
+    UPSTREAM_HEDGES.labels(provider, outcome).inc()
+
+
+def rejected(provider, reason):
+    UPSTREAM_REJECTED.labels(provider, reason).inc()
+
+
+def singleflight_call(group, role):
+    SINGLEFLIGHT_CALLS.labels(group, role).inc()
+
+
+def cache_lookup(cache, result):
+    CACHE_LOOKUPS.labels(cache, result).inc()
+
+
+def cache_evicted(cache, n=1):
+    CACHE_EVICTIONS.labels(cache).inc(n)
+
+
+# -----------------------------
+# Request middleware and exposition
+# -----------------------------
+def _route(request):
+    match = getattr(request, "resolver_match", None)
+    return ("/" + match.route) if match is not None and match.route is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    """Outermost middleware: in-flight gauge and per-route latency (the route pattern, never the raw path)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(_route(request), request.method, str(status)).observe(time.perf_counter() - t0)
+
+    async def __acall__(self, request):
+        IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(_route(request), request.method, str(status)).observe(time.perf_counter() - t0)
+
+
+class PoolCollector:
+    """
+    Upstream connection-pool figures read at scrape time from source(), which
+    returns {pool: {"connectionsOpened", "requests", "idle", "maxsize"}}.
+    They live in the sessions of the process being scraped, so under gunicorn
+    a scrape reports the worker that answered it.
+    """
+
+    def __init__(self):
+        self.source = None
+
+    def collect(self):
+        stats = self.source() if self.source is not None else {}
+        opened = CounterMetricFamily("wt_upstream_pool_connections_opened",
+                                     "Connections opened by an upstream pool (this worker).", labels=["pool"])
+        requests = CounterMetricFamily("wt_upstream_pool_requests",
+                                       "Requests sent through an upstream pool (this worker).", labels=["pool"])
+        idle = GaugeMetricFamily("wt_upstream_pool_idle_connections",
+                                 "Keep-alive connections currently idle in an upstream pool.", labels=["pool"])
+        size = GaugeMetricFamily("wt_upstream_pool_maxsize", "Upstream pool size limit.", labels=["pool"])
+        for pool, s in stats.items():
+            opened.add_metric([pool], s["connectionsOpened"])
+            requests.add_metric([pool], s["requests"])
+            idle.add_metric([pool], s["idle"])
+            size.add_metric([pool], s["maxsize"])
+        return [opened, requests, idle, size]
+
+
+POOLS = PoolCollector()
+REGISTRY.register(POOLS)
+
+
+def register_pool_stats(source):
+    """Sets the function /metrics reads upstream pool figures from (views.upstream_pool_stats)."""
+    POOLS.source = source
+
+
+def registry():
+    """Registry to expose: every worker's files merged when running multiprocess, else the default one."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        reg = CollectorRegistry()
+        multiprocess.MultiProcessCollector(reg)
+        reg.register(POOLS)
+        return reg
+    return REGISTRY
+
+
+def metrics_view(request):
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,105 @@
+"""
+Response compression negotiated per request: brotli when the client accepts
+it (the brotli package is in requirements.txt), gzip otherwise. Works under both
+WSGI and ASGI without a thread hop; streaming responses (SSE) are left alone.
+"""
+import gzip
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # bare dev installs; gzip only
+    brotli = None
+
+COMPRESSION_MIN_BYTES = 512
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5   # dynamic content: much faster than 11, most of the gain
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "+json", "image/svg+xml")
+
+
+def _accepted(header):
+    """{coding: q} from an Accept-Encoding header."""
+    out = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            name, _, value = p.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        out[coding] = q
+    return out
+
+
+def choose_encoding(header):
+    """'br', 'gzip' or None; brotli wins ties."""
+    acc = _accepted(header)
+    star = acc.get("*", 0.0)
+    options = []
+    if brotli is not None:
+        options.append((acc.get("br", star), 1, "br"))
+    options.append((acc.get("gzip", star), 0, "gzip"))
+    q, _, coding = max(options)
+    return coding if q > 0 else None
+
+
+def compress_response(request, response):
+    if response.streaming or response.has_header("Content-Encoding"):
+        return response
+    if response.status_code in (204, 304) or not (200 <= response.status_code < 600):
+        return response
+    ctype = response.get("Content-Type", "").split(";")[0].strip().lower()
+    if not any(t in ctype for t in COMPRESSIBLE_TYPES):
+        return response
+
+    patch_vary_headers(response, ("Accept-Encoding",))
+    if len(response.content) < getattr(settings, "COMPRESSION_MIN_BYTES", COMPRESSION_MIN_BYTES):
+        return response
+    coding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    if coding is None:
+        return response
+
+    if coding == "br":
+        body = brotli.compress(response.content,
+                               quality=getattr(settings, "COMPRESSION_BROTLI_QUALITY", COMPRESSION_BROTLI_QUALITY))
+    else:
+        body = gzip.compress(response.content,
+                             compresslevel=getattr(settings, "COMPRESSION_GZIP_LEVEL", COMPRESSION_GZIP_LEVEL), mtime=0)
+    if len(body) >= len(response.content):
+        return response
+
+    response.content = body
+    response["Content-Length"] = str(len(body))
+    response["Content-Encoding"] = coding
+    # Same resource, different bytes: a strong validator no longer applies (as Django's GZipMiddleware does)
+    etag = response.get("ETag")
+    if etag and etag.startswith('"'):
+        response["ETag"] = "W/" + etag
+    return response
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compress_response(request, await self.get_response(request))
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NwsPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('grid_id', models.CharField(blank=True, max_length=8)),
+                ('grid_x', models.IntegerField(null=True)),
+                ('grid_y', models.IntegerField(null=True)),
+                ('forecast_url', models.URLField(max_length=300)),
+                ('forecast_hourly_url', models.URLField(blank=True, max_length=300)),
+                ('properties', models.JSONField(default=dict)),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lat', 'lon'), name='nws_point_lat_lon_uniq')],
+            },
+        ),
+    ]
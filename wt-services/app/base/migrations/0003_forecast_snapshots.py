@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_nwspoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('units', models.CharField(max_length=10)),
+                ('issued_at', models.DateTimeField()),
+                ('city', models.JSONField(default=dict)),
+                ('slice_count', models.PositiveSmallIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lat', 'lon', 'units', '-issued_at'], name='fc_snap_loc_issued_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ForecastSlice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('units', models.CharField(max_length=10)),
+                ('valid_at', models.DateTimeField()),
+                ('issued_at', models.DateTimeField()),
+                ('temp', models.FloatField(null=True)),
+                ('humidity', models.FloatField(null=True)),
+                ('wind', models.FloatField(null=True)),
+                ('pop', models.FloatField(null=True)),
+                ('raw', models.JSONField(default=dict)),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slices', to='base.forecastsnapshot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lat', 'lon', 'units', 'valid_at', 'issued_at'], name='fc_slice_loc_valid_idx')],
+            },
+        ),
+    ]
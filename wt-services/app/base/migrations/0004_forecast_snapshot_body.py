@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_forecast_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forecastsnapshot',
+            name='body',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -1,6 +1,133 @@
+import json
 from django.db import models
+from django.utils import timezone
 
 # data models will be defined here
 class React(models.Model): 
     name = models.CharField(max_length=30)
     detail = models.CharField(max_length= 500)
+
+
+# api.weather.gov resolves points at 4-decimal precision (~11 m)
+NWS_POINT_PRECISION = 4
+
+def snap_point(lat, lon, precision=NWS_POINT_PRECISION):
+    return round(float(lat), precision), round(float(lon), precision)
+
+
+class NwsPoint(models.Model):
+    """Cached /points metadata: lat/lon -> forecast office, grid and zone URLs."""
+    lat = models.FloatField()
+    lon = models.FloatField()
+    grid_id = models.CharField(max_length=8, blank=True)
+    grid_x = models.IntegerField(null=True)
+    grid_y = models.IntegerField(null=True)
+    forecast_url = models.URLField(max_length=300)
+    forecast_hourly_url = models.URLField(max_length=300, blank=True)
+    properties = models.JSONField(default=dict)
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["lat", "lon"], name="nws_point_lat_lon_uniq"),
+        ]
+
+    @classmethod
+    def lookup(cls, lat, lon, max_age):
+        """Properties dict for a snapped point fetched within max_age, else None."""
+        lat, lon = snap_point(lat, lon)
+        row = (cls.objects
+               .filter(lat=lat, lon=lon, fetched_at__gte=timezone.now() - max_age)
+               .only("properties")
+               .first())
+        return row.properties if row else None
+
+    @classmethod
+    def store(cls, lat, lon, props):
+        lat, lon = snap_point(lat, lon)
+        cls.objects.update_or_create(lat=lat, lon=lon, defaults={
+            "grid_id": props.get("gridId") or "",
+            "grid_x": props.get("gridX"),
+            "grid_y": props.get("gridY"),
+            "forecast_url": props.get("forecast") or "",
+            "forecast_hourly_url": props.get("forecastHourly") or "",
+            "properties": props,
+            "fetched_at": timezone.now(),
+        })
+
+
+class ForecastSnapshot(models.Model):
+    """One OWM 5-day/3-hour forecast as fetched for a snapped location and unit system."""
+    lat = models.FloatField()
+    lon = models.FloatField()
+    units = models.CharField(max_length=10)
+    issued_at = models.DateTimeField()   # OWM has no issue time; this is when we fetched it
+    city = models.JSONField(default=dict)
+    slice_count = models.PositiveSmallIntegerField(default=0)
+    # The response bytes as fetched, so a store hit serves (and ETags) exactly what the live fetch did
+    body = models.BinaryField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["lat", "lon", "units", "-issued_at"], name="fc_snap_loc_issued_idx"),
+        ]
+
+    @classmethod
+    def latest(cls, lat, lon, units, max_age):
+        """Newest snapshot for the location issued within max_age, else None."""
+        return (cls.objects
+                .filter(lat=lat, lon=lon, units=units, issued_at__gte=timezone.now() - max_age)
+                .order_by("-issued_at")
+                .first())
+
+    def payload(self):
+        """The snapshot rebuilt as an OWM /forecast response body."""
+        items = [s.raw for s in self.slices.order_by("valid_at").only("raw")]
+        return {"cod": "200", "message": 0, "cnt": len(items), "list": items, "city": self.city}
+
+    def content(self):
+        """The response body: the original bytes, or one rebuilt from the slices for older rows."""
+        if self.body is not None:
+            return bytes(self.body)
+        return json.dumps(self.payload()).encode()
+
+
+class ForecastSliceQuerySet(models.QuerySet):
+    def at(self, lat, lon, units):
+        return self.filter(lat=lat, lon=lon, units=units)
+
+    def valid_between(self, start, end):
+        return self.filter(valid_at__gte=start, valid_at__lt=end)
+
+    def issued_between(self, start, end):
+        return self.filter(issued_at__gte=start, issued_at__lt=end)
+
+    def latest_issued(self):
+        """For each valid time, only the slice from the most recent snapshot (SQL DISTINCT-free)."""
+        newer = ForecastSlice.objects.filter(
+            lat=models.OuterRef("lat"), lon=models.OuterRef("lon"), units=models.OuterRef("units"),
+            valid_at=models.OuterRef("valid_at"), issued_at__gt=models.OuterRef("issued_at"),
+        )
+        return self.filter(~models.Exists(newer))
+
+
+class ForecastSlice(models.Model):
+    """One 3-hour step of a snapshot; location/issue time are denormalized for index-only range scans."""
+    snapshot = models.ForeignKey(ForecastSnapshot, on_delete=models.CASCADE, related_name="slices")
+    lat = models.FloatField()
+    lon = models.FloatField()
+    units = models.CharField(max_length=10)
+    valid_at = models.DateTimeField()
+    issued_at = models.DateTimeField()
+    temp = models.FloatField(null=True)
+    humidity = models.FloatField(null=True)
+    wind = models.FloatField(null=True)
+    pop = models.FloatField(null=True)
+    raw = models.JSONField(default=dict)
+
+    objects = ForecastSliceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["lat", "lon", "units", "valid_at", "issued_at"], name="fc_slice_loc_valid_idx"),
+        ]
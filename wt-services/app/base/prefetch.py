@@ -0,0 +1,188 @@
+"""
+Popularity-driven background prefetch.
+
+Views record every upstream-bound request as (kind, *snapped args) in a
+decaying popularity counter. A background thread wakes every
+PREFETCH_INTERVAL_SECS, walks the PREFETCH_TOP_N most popular keys and
+refreshes those whose cached entry is missing or goes stale within
+PREFETCH_LEAD_SECS, spending at most PREFETCH_BUDGET upstream requests per
+pass. Hot locations therefore stay warm and their users never pay for a
+cold miss. What "cached" and "refresh" mean per kind is registered by the
+views through register().
+
+The caches being warmed are per process, so every worker runs its own
+tracker and scheduler over the requests it served. PREFETCH_BUDGET is the
+host's total: each of the PREFETCH_WORKERS workers spends an equal share.
+"""
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+PREFETCH_INTERVAL_SECS  = 30
+PREFETCH_TOP_N          = 50
+PREFETCH_BUDGET         = 20     # upstream requests per pass, across all workers
+PREFETCH_WORKERS        = 1      # processes sharing PREFETCH_BUDGET
+PREFETCH_LEAD_SECS      = 90     # refresh entries going stale within this window
+PREFETCH_HALF_LIFE_SECS = 1800
+PREFETCH_MIN_SCORE      = 2.0    # decayed hits; one-off lookups never spend budget
+PREFETCH_MAX_TRACKED    = 10000
+
+_REBASE_EXPONENT = 40.0
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+class PopularityTracker:
+    """
+    Exponentially decaying hit counts. Uses forward decay: a hit at time t
+    adds 2 ** ((t - t0) / half_life), so relative order never needs a rescan
+    and the decayed score is the stored weight scaled by 2 ** ((t0 - now) / half_life).
+    Weights are rebased before they can overflow; the table is bounded by
+    dropping the least popular tenth when it fills up.
+    """
+
+    def __init__(self, half_life=PREFETCH_HALF_LIFE_SECS, max_entries=PREFETCH_MAX_TRACKED, clock=time.monotonic):
+        self.half_life = float(half_life)
+        self.max_entries = max_entries
+        self._clock = clock
+        self._t0 = clock()
+        self._weights = {}
+        self._lock = threading.Lock()
+
+    def _exp(self, now):
+        return (now - self._t0) / self.half_life
+
+    def hit(self, key, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            e = self._exp(now)
+            if e > _REBASE_EXPONENT:
+                scale = 2.0 ** -e
+                self._weights = {k: w * scale for k, w in self._weights.items() if w * scale > 1e-12}
+                self._t0, e = now, 0.0
+            self._weights[key] = self._weights.get(key, 0.0) + 2.0 ** e
+            if len(self._weights) > self.max_entries:
+                for k, _ in heapq.nsmallest(max(1, self.max_entries // 10), self._weights.items(), key=lambda kv: kv[1]):
+                    del self._weights[k]
+
+    def score(self, key, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            return self._weights.get(key, 0.0) * 2.0 ** -self._exp(now)
+
+    def top(self, n, now=None):
+        """[(key, decayed score)] for the n most popular keys, best first."""
+        now = self._clock() if now is None else now
+        with self._lock:
+            scale = 2.0 ** -self._exp(now)
+            best = heapq.nlargest(n, self._weights.items(), key=lambda kv: kv[1])
+        return [(k, w * scale) for k, w in best]
+
+    def clear(self):
+        with self._lock:
+            self._weights.clear()
+            self._t0 = self._clock()
+
+    def __len__(self):
+        return len(self._weights)
+
+
+class _Handler:
+    __slots__ = ("ttl_remaining", "refresh", "cost")
+
+    def __init__(self, ttl_remaining, refresh, cost):
+        self.ttl_remaining = ttl_remaining
+        self.refresh = refresh
+        self.cost = cost
+
+
+_TRACKER = PopularityTracker()
+_HANDLERS = {}
+_SCHEDULER = None
+_LOCK = threading.Lock()
+_STATS = {"passes": 0, "refreshed": 0, "failed": 0, "budgetExhausted": 0}
+
+
+def register(kind, ttl_remaining, refresh, cost=1):
+    """
+    ttl_remaining(*args) -> seconds until the cached entry goes stale (None
+    when absent); refresh(*args) re-fetches it; cost is upstream requests per refresh.
+    """
+    _HANDLERS[kind] = _Handler(ttl_remaining, refresh, cost)
+
+
+def enabled():
+    return _conf("PREFETCH_ENABLED", True)
+
+
+def record(kind, *args):
+    """Counts one request for (kind, *args); args must already be snapped/normalized."""
+    if not enabled():
+        return
+    _TRACKER.hit((kind,) + args)
+    ensure_started()
+
+
+def run_once(now=None):
+    """One scheduler pass; returns the keys refreshed."""
+    budget = max(1, _conf("PREFETCH_BUDGET", PREFETCH_BUDGET) // max(1, _conf("PREFETCH_WORKERS", PREFETCH_WORKERS)))
+    lead = _conf("PREFETCH_LEAD_SECS", PREFETCH_LEAD_SECS)
+    min_score = _conf("PREFETCH_MIN_SCORE", PREFETCH_MIN_SCORE)
+    refreshed = []
+    _STATS["passes"] += 1
+
+    for key, score in _TRACKER.top(_conf("PREFETCH_TOP_N", PREFETCH_TOP_N), now=now):
+        if score < min_score:
+            break
+        handler = _HANDLERS.get(key[0])
+        if handler is None:
+            continue
+        remaining = handler.ttl_remaining(*key[1:])
+        if remaining is not None and remaining > lead:
+            continue
+        if handler.cost > budget:
+            _STATS["budgetExhausted"] += 1
+            break
+        budget -= handler.cost
+        try:
+            handler.refresh(*key[1:])
+            refreshed.append(key)
+        except Exception:
+            _STATS["failed"] += 1
+            log.warning("Prefetch of %s failed", key, exc_info=True)
+    _STATS["refreshed"] += len(refreshed)
+    return refreshed
+
+
+def _run():
+    while True:
+        time.sleep(_conf("PREFETCH_INTERVAL_SECS", PREFETCH_INTERVAL_SECS))
+        try:
+            run_once()
+        except Exception:
+            log.exception("Prefetch pass failed")
+
+
+def ensure_started():
+    global _SCHEDULER
+    if _SCHEDULER is not None:
+        return
+    with _LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = threading.Thread(target=_run, name="prefetch", daemon=True)
+            _SCHEDULER.start()
+
+
+def stats():
+    return {**_STATS, "tracked": len(_TRACKER)}
+
+
+def reset():
+    _TRACKER.clear()
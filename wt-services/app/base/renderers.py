@@ -0,0 +1,97 @@
+"""
+JSON rendering for the API.
+
+FastJSONRenderer (the project-wide default, see REST_FRAMEWORK in settings)
+serializes with orjson when it's installed and falls back to the stdlib with
+DRF's encoder otherwise. ColumnarRenderer (`?format=columnar` on the forecast
+endpoints) turns lists of uniform records into one array per field and drops
+the arrays /api/trends repeats, which is both smaller on the wire and faster
+for clients to parse.
+"""
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+from . import timing
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib path produces the same JSON, just slower
+    orjson = None
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.weathertracker.columnar+json"
+
+_ENCODER = encoders.JSONEncoder()
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_ENCODER.default,
+                                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. ints beyond 64 bits; let the stdlib deal with it
+    return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# -----------------------------
+# Columnar transform
+# -----------------------------
+def _flatten(record, prefix=""):
+    out = {}
+    for k, v in record.items():
+        if isinstance(v, dict):
+            out.update(_flatten(v, f"{prefix}{k}."))
+        else:
+            out[f"{prefix}{k}"] = v
+    return out
+
+
+def _trends_columns(data):
+    """/api/trends without officialForecast (daily carries the same values), predicted folded into daily."""
+    predicted = {p.get("date"): p for p in data.get("predicted") or []}
+    out = {k: v for k, v in data.items() if k not in ("officialForecast", "predicted")}
+    out["daily"] = [
+        {**d, "predicted": {k: v for k, v in predicted.get(d.get("date"), {}).items() if k != "date"}}
+        for d in data.get("daily") or []
+    ]
+    return out
+
+
+def columnar(data):
+    """
+    Lists of flat (or dict-nested) records become {field: [values...]}, nested
+    keys joined with '.'; lists whose records hold further lists are recursed into.
+    """
+    if isinstance(data, dict):
+        if {"officialForecast", "predicted", "daily"} <= data.keys():
+            data = _trends_columns(data)
+        return {k: columnar(v) for k, v in data.items()}
+    if isinstance(data, list) and data and all(isinstance(x, dict) for x in data):
+        rows = [_flatten(x) for x in data]
+        if any(isinstance(v, (list, tuple)) for r in rows for v in r.values()):
+            return [columnar(x) for x in data]
+        fields = list(dict.fromkeys(k for r in rows for k in r))
+        return {k: [r.get(k) for r in rows] for k in fields}
+    return data
+
+
+class FastJSONRenderer(JSONRenderer):
+    @timing.timed("render")
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # The browsable API / ?indent= ask for pretty output; that's rare, so leave it to DRF
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class ColumnarRenderer(FastJSONRenderer):
+    media_type = COLUMNAR_MEDIA_TYPE
+    format = "columnar"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar(data), accepted_media_type, renderer_context)
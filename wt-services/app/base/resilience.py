@@ -0,0 +1,232 @@
+"""
+Upstream protection: a circuit breaker per provider and a request budget
+shared by every worker process.
+
+admit(provider) is asked before each upstream call and returns None when the
+call may go ahead, or the reason it may not ("open" while the breaker is
+tripped, "quota" when the shared bucket is empty). Callers turn a refusal into
+an immediate 503 and fall back to stale cached data where they have it, so
+nothing ever waits on a dead upstream or for quota. record(provider, status)
+reports the outcome (None for a transport failure or timeout). Async code
+uses aadmit(), which keeps the SQLite bucket update off the event loop.
+spend(name) draws on a named sub-budget only, for callers that must stay
+within a smaller share of a provider's quota.
+
+The breaker is per process: CIRCUIT_FAILURE_THRESHOLD consecutive failures
+open it for CIRCUIT_OPEN_SECS, after which one trial call decides whether it
+closes again. The token bucket lives in a small SQLite file
+(UPSTREAM_QUOTA_DB) updated under BEGIN IMMEDIATE, so the budget is shared by
+all gunicorn workers on the host. If that file can't be used the bucket fails
+open; losing rate limiting beats losing the site.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_OPEN_SECS         = 30
+
+# Tokens per second and burst size; OWM's free tier allows 60 calls/minute.
+# "owm_risk_grid" is a slice of the OWM budget that map risk grids must also
+# spend from, so cold map views can't starve the forecast endpoints.
+UPSTREAM_BUDGETS = {
+    "owm": {"rate": 1.0, "burst": 60},
+    "nws": {"rate": 5.0, "burst": 50},
+    "owm_risk_grid": {"rate": 0.1, "burst": 12},
+}
+UPSTREAM_QUOTA_DB = os.path.join(tempfile.gettempdir(), "wt-upstream-quota.sqlite3")
+UPSTREAM_QUOTA_LOCK_SECS = 0.25   # longest we wait on another worker's bucket update
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+REFUSALS = {"open": "circuit open after repeated failures", "quota": "shared request budget exhausted"}
+
+
+class CircuitBreaker:
+    def __init__(self, name, threshold=CIRCUIT_FAILURE_THRESHOLD, open_secs=CIRCUIT_OPEN_SECS, clock=time.monotonic):
+        self.name = name
+        self.threshold = threshold
+        self.open_secs = open_secs
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self._clock() - self.opened_at >= self.open_secs:
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True      # exactly one probe; everyone else keeps failing fast
+                return True
+            return False
+
+    def cancel(self):
+        """Gives back a half-open probe that was granted but never made."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial = False
+
+    def success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                log.info("%s circuit closed", self.name)
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                if self.state == CLOSED:
+                    log.warning("%s circuit opened after %d consecutive failures", self.name, self.failures)
+                self.state = OPEN
+                self.opened_at = self._clock()
+                self._trial = False
+
+
+class SharedTokenBucket:
+    """Token buckets keyed by name in one SQLite file; safe across threads and processes."""
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=UPSTREAM_QUOTA_LOCK_SECS, isolation_level=None)
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            self._local.conn = conn
+        return conn
+
+    def take(self, name, rate, burst, n=1):
+        """True when n tokens were taken; refills at `rate` per second up to `burst`."""
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = self._clock()
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                ok = tokens >= n
+                if ok:
+                    tokens -= n
+                conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                             (name, tokens, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return ok
+        except sqlite3.Error:
+            log.warning("Upstream quota store %s unavailable; not rate limiting", self.path, exc_info=True)
+            return True
+
+
+_BREAKERS = {}
+_BUCKET = None
+_LOCK = threading.Lock()
+
+
+def breaker(provider):
+    b = _BREAKERS.get(provider)
+    if b is None:
+        with _LOCK:
+            b = _BREAKERS.get(provider)
+            if b is None:
+                b = _BREAKERS[provider] = CircuitBreaker(
+                    provider,
+                    getattr(settings, "CIRCUIT_FAILURE_THRESHOLD", CIRCUIT_FAILURE_THRESHOLD),
+                    getattr(settings, "CIRCUIT_OPEN_SECS", CIRCUIT_OPEN_SECS),
+                )
+    return b
+
+
+def _bucket():
+    global _BUCKET
+    path = getattr(settings, "UPSTREAM_QUOTA_DB", None) or UPSTREAM_QUOTA_DB
+    if _BUCKET is None or _BUCKET.path != path:
+        with _LOCK:
+            if _BUCKET is None or _BUCKET.path != path:
+                _BUCKET = SharedTokenBucket(path)
+    return _BUCKET
+
+
+def _budget(provider):
+    if not getattr(settings, "UPSTREAM_QUOTA_ENABLED", True):
+        return None
+    return getattr(settings, "UPSTREAM_BUDGETS", UPSTREAM_BUDGETS).get(provider)
+
+
+def _take(provider, budget):
+    """Takes a token from the shared bucket; False (probe handed back, refusal counted) when it's empty."""
+    if _bucket().take(provider, budget["rate"], budget["burst"]):
+        return True
+    breaker(provider).cancel()
+    metrics.rejected(provider, "quota")
+    return False
+
+
+def admit(provider):
+    """None if a call to provider may be made now, else "open" or "quota"."""
+    if not breaker(provider).allow():
+        metrics.rejected(provider, "open")
+        return "open"
+    budget = _budget(provider)
+    if budget and not _take(provider, budget):
+        return "quota"
+    return None
+
+
+def spend(name):
+    """Takes a token from a sub-budget that has no breaker of its own; False (refusal counted) when it's empty."""
+    budget = _budget(name)
+    if budget and not _bucket().take(name, budget["rate"], budget["burst"]):
+        metrics.rejected(name, "quota")
+        return False
+    return True
+
+
+async def aadmit(provider):
+    """admit() for the event loop: the breaker is checked in-process, the SQLite bucket on a worker thread."""
+    if not breaker(provider).allow():
+        metrics.rejected(provider, "open")
+        return "open"
+    budget = _budget(provider)
+    if budget and not await asyncio.to_thread(_take, provider, budget):
+        return "quota"
+    return None
+
+
+def is_failure(status):
+    return status is None or status == 429 or status >= 500
+
+
+def record(provider, status):
+    if is_failure(status):
+        breaker(provider).failure()
+    else:
+        breaker(provider).success()
+
+
+def reset():
+    global _BUCKET
+    _BREAKERS.clear()
+    _BUCKET = None
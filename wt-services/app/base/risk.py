@@ -0,0 +1,61 @@
+"""
+Vectorized heat-index / wind-chill math.
+
+Every function takes scalars or arrays (anything np.asarray accepts) and
+returns float64 arrays with NaN wherever an input is missing or the formula
+doesn't apply, so whole forecast series or spatial grids are computed in one
+call. The scalar heat_index_f / wind_chill_f in views.py wrap these.
+"""
+import numpy as np
+
+MS_TO_MPH = 2.23694
+
+
+def _arr(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+def c_to_f(t_c):
+    return _arr(t_c) * 9/5 + 32
+
+
+def f_to_c(t_f):
+    return (_arr(t_f) - 32) * 5/9
+
+
+def ms_to_mph(v_ms):
+    return _arr(v_ms) * MS_TO_MPH
+
+
+def heat_index_f_array(t_f, rh):
+    """Rothfusz regression (deg F, RH %). Like the scalar version, applied at every temperature."""
+    T, R = np.broadcast_arrays(_arr(t_f), _arr(rh))
+    return (-42.379 + 2.04901523*T + 10.14333127*R
+            - 0.22475541*T*R - 0.00683783*T*T - 0.05481717*R*R
+            + 0.00122874*T*T*R + 0.00085282*T*R*R - 0.00000199*T*T*R*R)
+
+
+def wind_chill_f_array(t_f, wind_mph):
+    """NWS wind chill (deg F, mph); NaN where T > 50 F or wind < 3 mph."""
+    t, v = np.broadcast_arrays(_arr(t_f), _arr(wind_mph))
+    with np.errstate(invalid="ignore"):
+        v16 = v ** 0.16
+        wc = 35.74 + 0.6215*t - 35.75*v16 + 0.4275*t*v16
+        return np.where((t > 50) | (v < 3), np.nan, wc)
+
+
+def risk_in_units(t_max, t_min, rh, wind_ms, is_metric):
+    """
+    (heat index, wind chill) in the caller's unit system: heat index from the
+    max temperature and humidity, wind chill from the min temperature and wind.
+    Temperatures are deg C when is_metric, else deg F; wind is always m/s.
+    """
+    hi_t = c_to_f(t_max) if is_metric else _arr(t_max)
+    wc_t = c_to_f(t_min) if is_metric else _arr(t_min)
+    wind_mph = ms_to_mph(wind_ms)
+
+    hi = heat_index_f_array(hi_t, rh)
+    wc = wind_chill_f_array(wc_t, wind_mph)
+    if is_metric:
+        hi, wc = f_to_c(hi), f_to_c(wc)
+    return hi, wc
@@ -0,0 +1,125 @@
+"""
+Gridded heat-index / wind-chill risk layer for the map.
+
+Samples a size x size lat/lon grid around a location, pulls current
+conditions per cell through the caller's (cached) fetch function with
+bounded concurrency, computes heat index and wind chill for the whole grid
+in one vectorized pass and turns them into HeatMap [lat, lon, weight]
+points. Grids are cached per snapped tile and time bucket.
+
+Cells sit on a fixed RISK_GRID_STEP_QUANTUM_DEG lattice, so neighbouring
+tiles and different steps share per-cell cache entries, and one build makes
+at most RISK_GRID_MAX_FETCHES upstream calls (cells nearest the centre
+first); a grid missing cells isn't cached, so later views fill it in.
+With the defaults a cold map view costs up to 9 OWM calls for the grid plus
+the NWS /points lookup (and an alerts point query when the local alert index
+is off), and the 5 x 5 grid is complete after three views of the tile.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from . import deadline, risk
+from .cache import TTLCache
+
+RISK_GRID_SIZE        = 5      # cells per side
+RISK_GRID_STEP_DEG    = 0.1
+RISK_GRID_MAX_SIZE    = 9
+RISK_GRID_MAX_STEP_DEG   = 1.0
+RISK_GRID_STEP_QUANTUM_DEG = 0.05   # cell lattice; steps and centres snap to it
+RISK_GRID_MAX_FETCHES = 9      # uncached cells fetched per build; the map view also caps them with a shared budget
+RISK_GRID_CONCURRENCY = 8
+RISK_GRID_BUCKET_SECS = 3600
+RISK_GRID_TILE_PRECISION = 1   # tiles snap to 0.1 deg
+
+# Weight scales: heat risk ramps from 80 F (where the Rothfusz fit starts to
+# apply) to 130 F, cold risk from 50 F wind chill down to -30 F.
+HEAT_RANGE_F = (80.0, 130.0)
+COLD_RANGE_F = (50.0, -30.0)
+
+_GRID_CACHE = TTLCache(max_entries=512, max_bytes=8 * 1024 * 1024, name="risk_grid")
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def grid_points(lat, lon, size, step, quantum=RISK_GRID_STEP_QUANTUM_DEG):
+    """Flattened (lats, lons) of a size x size grid centred on lat/lon, snapped to the cell lattice."""
+    offsets = (np.arange(size) - (size - 1) / 2.0) * step
+    lats, lons = np.meshgrid(lat + offsets, lon + offsets, indexing="ij")
+    return np.round(lats.ravel() / quantum) * quantum, np.round(lons.ravel() / quantum) * quantum
+
+
+def risk_weights(temp_f, rh, wind_mph):
+    """0..1 weight per cell: the larger of heat risk and cold risk, 0 where neither applies."""
+    temp_f = np.asarray(temp_f, dtype=np.float64)
+    hi = risk.heat_index_f_array(temp_f, rh)
+    hi = np.where(temp_f >= HEAT_RANGE_F[0], hi, np.nan)
+    wc = risk.wind_chill_f_array(temp_f, wind_mph)
+
+    lo, top = HEAT_RANGE_F
+    heat = np.clip((hi - lo) / (top - lo), 0.0, 1.0)
+    warm, cold_floor = COLD_RANGE_F
+    cold = np.clip((warm - wc) / (warm - cold_floor), 0.0, 1.0)
+    return np.nan_to_num(np.fmax(heat, cold), nan=0.0)
+
+
+def _cell_conditions(payload):
+    main = (payload or {}).get("main") or {}
+    wind = (payload or {}).get("wind") or {}
+    def num(v):
+        return float(v) if isinstance(v, (int, float)) else np.nan
+    return num(main.get("temp")), num(main.get("humidity")), num(wind.get("speed"))
+
+
+def build_risk_grid(lat, lon, fetch, size=None, step=None, now=None, is_cached=None):
+    """
+    HeatMap points [[lat, lon, weight], ...] for the grid around lat/lon.
+    fetch(lat, lon) must return an OWM current-weather payload in imperial
+    units (deg F, mph) or None; failed cells simply carry no weight.
+    is_cached(lat, lon), when given, tells which cells fetch can answer
+    without an upstream call; only the others count against the fetch cap.
+    """
+    size = max(1, min(int(size or _conf("RISK_GRID_SIZE", RISK_GRID_SIZE)), RISK_GRID_MAX_SIZE))
+    quantum = _conf("RISK_GRID_STEP_QUANTUM_DEG", RISK_GRID_STEP_QUANTUM_DEG)
+    step = float(step or _conf("RISK_GRID_STEP_DEG", RISK_GRID_STEP_DEG))
+    step = round(max(1, round(min(step, RISK_GRID_MAX_STEP_DEG) / quantum)) * quantum, 6)
+    bucket_secs = _conf("RISK_GRID_BUCKET_SECS", RISK_GRID_BUCKET_SECS)
+    prec = _conf("RISK_GRID_TILE_PRECISION", RISK_GRID_TILE_PRECISION)
+
+    clat, clon = round(float(lat), prec), round(float(lon), prec)
+    bucket = int((now if now is not None else time.time()) // bucket_secs)
+    key = (clat, clon, size, step, bucket)
+    hit, state = _GRID_CACHE.get(key)
+    if state is not None:
+        return hit
+
+    lats, lons = grid_points(clat, clon, size, step, quantum)
+    cells = list(zip(lats.tolist(), lons.tolist()))
+    budget = _conf("RISK_GRID_MAX_FETCHES", RISK_GRID_MAX_FETCHES)
+    wanted = [False] * len(cells)
+    for i in sorted(range(len(cells)), key=lambda i: (cells[i][0] - clat) ** 2 + (cells[i][1] - clon) ** 2):
+        if is_cached is not None and is_cached(*cells[i]):
+            wanted[i] = True
+        elif budget > 0:
+            wanted[i] = True
+            budget -= 1
+    todo = [c for c, w in zip(cells, wanted) if w]
+
+    workers = max(1, min(_conf("RISK_GRID_CONCURRENCY", RISK_GRID_CONCURRENCY), len(todo) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        fetched = iter(pool.map(deadline.in_context(fetch), [c[0] for c in todo], [c[1] for c in todo]))
+    payloads = [next(fetched) if w else None for w in wanted]
+
+    cond = np.array([_cell_conditions(p) for p in payloads], dtype=np.float64).reshape(-1, 3)
+    weights = risk_weights(cond[:, 0], cond[:, 1], cond[:, 2])
+
+    points = [[round(a, 4), round(b, 4), round(w, 3)]
+              for (a, b), w in zip(cells, weights.tolist()) if w > 0]
+    # Only cache grids where every cell got data, so an upstream blip or the fetch cap isn't pinned for a bucket
+    if all(p is not None for p in payloads):
+        _GRID_CACHE.set(key, points, bucket_secs, size=64 + 32 * len(points))
+    return points
@@ -0,0 +1,119 @@
+"""
+Douglas-Peucker simplification of alert polygons, with a per-alert,
+per-detail-level cache.
+
+Tolerances are in degrees. zoom_tolerance() maps a web-map zoom level to
+about one screen pixel at that zoom, so simplification is invisible on the
+map while dropping most vertices of detailed coastlines and county edges.
+"""
+import math
+
+import numpy as np
+
+from .cache import TTLCache
+
+MAX_ZOOM = 20
+SIMPLIFY_CACHE_TTL_SECS = 6 * 3600
+
+_CACHE = TTLCache(max_entries=8192, max_bytes=64 * 1024 * 1024, name="simplify")
+
+
+def zoom_tolerance(zoom):
+    """Degrees per 256-px-tile pixel at the given zoom level; ValueError unless zoom is finite."""
+    if not math.isfinite(zoom):
+        raise ValueError("zoom must be finite")
+    z = max(0, min(int(zoom), MAX_ZOOM))
+    return 360.0 / (256 * 2 ** z)
+
+
+def _seg_dist(pts, a, b):
+    """Perpendicular distance of pts from segment a-b (or from a when a == b)."""
+    ab = b - a
+    ap = pts - a
+    denom = float(ab @ ab)
+    if denom == 0.0:
+        return np.hypot(ap[:, 0], ap[:, 1])
+    t = np.clip((ap @ ab) / denom, 0.0, 1.0)
+    d = ap - np.outer(t, ab)
+    return np.hypot(d[:, 0], d[:, 1])
+
+
+def douglas_peucker(points, tolerance):
+    """Indices-preserving DP on an (N, 2) array; iterative, so deep rings can't hit the recursion limit."""
+    pts = np.asarray(points, dtype=np.float64)
+    n = len(pts)
+    if n < 3 or tolerance <= 0:
+        return pts
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        d = _seg_dist(pts[i + 1:j], pts[i], pts[j])
+        k = int(np.argmax(d))
+        if d[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return pts[keep]
+
+
+def _ring(coords, tolerance):
+    ring = np.asarray(coords, dtype=np.float64)
+    if len(ring) < 5:
+        return coords
+    # Closed rings have first == last, which DP can't split; split at the farthest vertex instead
+    far = int(np.argmax(np.hypot(*(ring[:, :2] - ring[0, :2]).T)))
+    head = douglas_peucker(ring[:far + 1, :2], tolerance)
+    tail = douglas_peucker(ring[far:, :2], tolerance)
+    out = np.vstack([head, tail[1:]])
+    if len(out) < 4:
+        return coords
+    return out.tolist()
+
+
+def simplify_geometry(geom, tolerance):
+    """Simplified copy of a GeoJSON geometry; non-areal geometries are returned unchanged."""
+    if not geom or tolerance <= 0:
+        return geom
+    kind = geom.get("type")
+    if kind == "Polygon":
+        return {"type": kind, "coordinates": [_ring(r, tolerance) for r in geom.get("coordinates") or []]}
+    if kind == "MultiPolygon":
+        return {"type": kind, "coordinates": [[_ring(r, tolerance) for r in poly]
+                                              for poly in geom.get("coordinates") or []]}
+    if kind == "GeometryCollection":
+        return {"type": kind, "geometries": [simplify_geometry(g, tolerance) for g in geom.get("geometries") or []]}
+    return geom
+
+
+def simplify_alert(alert, tolerance):
+    """Copy of an /api/alerts record with its polygon simplified, cached per alert id and tolerance."""
+    geom = alert.get("polygon")
+    if not geom or tolerance <= 0:
+        return alert
+    aid = alert.get("id")
+    key = (aid, f"{tolerance:.6g}")
+    simplified, state = _CACHE.get(key) if aid else (None, None)
+    if state is None:
+        simplified = simplify_geometry(geom, tolerance)
+        if aid:
+            _CACHE.set(key, simplified, SIMPLIFY_CACHE_TTL_SECS, size=64 + 40 * _vertex_count(simplified))
+    return {**alert, "polygon": simplified}
+
+
+def _vertex_count(geom):
+    if not geom:
+        return 0
+    if geom.get("type") == "GeometryCollection":
+        return sum(_vertex_count(g) for g in geom.get("geometries") or [])
+    coords = geom.get("coordinates") or []
+    polys = coords if geom.get("type") == "MultiPolygon" else [coords]
+    return sum(len(r) for poly in polys for r in poly)
+
+
+def clear_cache():
+    _CACHE.clear()
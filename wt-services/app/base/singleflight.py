@@ -0,0 +1,122 @@
+import asyncio
+import threading
+
+from . import metrics
+
+_REGISTRY = {}
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one execution.
+    The first caller (the leader) runs fn; everyone arriving while it is
+    in flight blocks on the same call and receives its result or error.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        _REGISTRY[name] = self
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+        metrics.singleflight_call(self.name, "leader" if leader else "coalesced")
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "inFlight": len(self._calls),
+            }
+
+
+def all_stats():
+    """Counters for every SingleFlight group, keyed by name (also exported as wt_singleflight_calls_total)."""
+    return {name: sf.stats() for name, sf in _REGISTRY.items()}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight. In-flight calls are tracked per
+    event loop, since a task can only be awaited on the loop that owns it.
+    fn runs in its own task that every caller awaits through shield(), so a
+    caller that is cancelled (a client going away) only stops waiting; the
+    fetch carries on for everyone else.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        _REGISTRY[name] = self
+
+    async def do(self, key, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        task = self._calls.get(slot)
+        if task is not None:
+            self.coalesced += 1
+            metrics.singleflight_call(self.name, "coalesced")
+        else:
+            self.leaders += 1
+            metrics.singleflight_call(self.name, "leader")
+            task = self._calls[slot] = loop.create_task(fn(*args, **kwargs))
+            task.add_done_callback(lambda t: self._finished(slot, t))
+        return await asyncio.shield(task)
+
+    def _finished(self, slot, task):
+        if self._calls.get(slot) is task:
+            del self._calls[slot]
+        # Mark retrieved so a failure nobody is left waiting on doesn't log "exception never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "inFlight": len(self._calls),
+        }
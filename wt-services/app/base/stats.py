@@ -0,0 +1,103 @@
+"""
+Streaming accumulators for the trend math.
+
+Each object takes one observation at a time in O(1) and holds only a few
+numbers (plus a bounded window where one is configured), so /api/trends
+smooths and scores every metric in a single pass over the daily rows.
+"""
+import math
+from collections import deque
+
+
+class EwmaState:
+    """Exponentially weighted moving average; the first observation seeds it."""
+    __slots__ = ("alpha", "value", "n")
+
+    def __init__(self, alpha=0.35):
+        self.alpha = alpha
+        self.value = None
+        self.n = 0
+
+    def update(self, x):
+        self.value = x if self.n == 0 else self.alpha * x + (1 - self.alpha) * self.value
+        self.n += 1
+        return self.value
+
+
+class RunningStats:
+    """
+    Welford mean / population variance. With a window, only the last `window`
+    observations count: the oldest is removed (Welford downdate) as each new
+    one arrives.
+    """
+    __slots__ = ("n", "mean", "m2", "window", "_values")
+
+    def __init__(self, window=None):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.window = window
+        self._values = deque() if window else None
+
+    @classmethod
+    def of(cls, values, window=None):
+        s = cls(window)
+        for x in values:
+            s.update(x)
+        return s
+
+    def update(self, x):
+        if self._values is not None:
+            self._values.append(x)
+            if len(self._values) > self.window:
+                self._remove(self._values.popleft())
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def _remove(self, x):
+        if self.n <= 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        delta = x - self.mean
+        self.n -= 1
+        self.mean -= delta / self.n
+        self.m2 = max(0.0, self.m2 - delta * (x - self.mean))
+
+    @property
+    def variance(self):
+        return self.m2 / self.n if self.n else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class TrendState:
+    """
+    Per-metric trend state behind /api/trends: the EWMA-smoothed value, the
+    spread over the last `window` days, and the first/last raw values.
+    confidence() is 1 - noise / (noise + signal), clamped to [0.1, 0.95].
+    """
+    __slots__ = ("ewma", "recent", "first", "last")
+
+    def __init__(self, alpha=0.35, window=7):
+        self.ewma = EwmaState(alpha)
+        self.recent = RunningStats(window)
+        self.first = None
+        self.last = None
+
+    def update(self, x):
+        if self.first is None:
+            self.first = x
+        self.last = x
+        self.recent.update(x)
+        return self.ewma.update(x)
+
+    def confidence(self):
+        noise = self.recent.std
+        signal = abs(self.last - self.first) if self.first is not None else 0.0
+        return max(0.1, min(0.95, 1 - noise / (noise + signal + 1e-6)))
+
+
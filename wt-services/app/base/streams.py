@@ -0,0 +1,144 @@
+"""
+Server-sent events fan-out for /api/stream.
+
+A Hub keeps one topic per requested location. The first subscriber to a topic
+starts a single poller task that runs every fetcher (alerts, current
+conditions) each STREAM_POLL_SECS and publishes an event only when that
+fetcher's digest of the payload changes; the last subscriber leaving cancels
+it. However many clients watch a location, upstream sees one poll per
+interval, and nearby locations share it too since the fetchers go through
+the snapped upstream caches.
+
+Hubs are per event loop, like the async HTTP client, so this only works under
+ASGI (see async_views.stream).
+"""
+import asyncio
+import contextvars
+import logging
+import weakref
+
+from django.conf import settings
+
+from . import renderers
+
+log = logging.getLogger(__name__)
+
+STREAM_POLL_SECS      = 60
+STREAM_HEARTBEAT_SECS = 15     # comment line so proxies don't time the connection out
+STREAM_QUEUE_SIZE     = 16     # per subscriber; a slow client skips to the newest events
+STREAM_RETRY_MS       = 5000
+
+
+def sse(event, payload):
+    """One SSE frame; compact JSON never contains a raw newline, so a single data: line is enough."""
+    return f"event: {event}\ndata: {renderers.dumps(payload).decode()}\n\n"
+
+
+class _Topic:
+    __slots__ = ("key", "subscribers", "last", "digests", "task")
+
+    def __init__(self, key):
+        self.key = key
+        self.subscribers = set()
+        self.last = {}
+        self.digests = {}
+        self.task = None
+
+
+class Hub:
+    """
+    fetchers: {event name: (async fetch(*key) -> payload or None, digest(payload) -> hashable)}.
+    """
+
+    def __init__(self, fetchers, interval=None):
+        self.fetchers = fetchers
+        self.interval = interval
+        self._topics = {}
+        self.polls = 0
+        self.pushes = 0
+
+    def subscribe(self, key):
+        """A queue of (event, payload) for key, pre-loaded with the latest known state."""
+        topic = self._topics.get(key)
+        if topic is None:
+            topic = self._topics[key] = _Topic(key)
+            # A fresh context: the poller outlives this request, so it mustn't inherit its deadline
+            topic.task = asyncio.get_running_loop().create_task(self._poll(topic), context=contextvars.Context())
+        q = asyncio.Queue(maxsize=getattr(settings, "STREAM_QUEUE_SIZE", STREAM_QUEUE_SIZE))
+        for event, payload in topic.last.items():
+            q.put_nowait((event, payload))
+        topic.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, key, q):
+        topic = self._topics.get(key)
+        if topic is None:
+            return
+        topic.subscribers.discard(q)
+        if not topic.subscribers:
+            topic.task.cancel()
+            del self._topics[key]
+
+    def _publish(self, topic, event, payload):
+        self.pushes += 1
+        for q in topic.subscribers:
+            if q.full():
+                q.get_nowait()
+            q.put_nowait((event, payload))
+
+    async def poll_once(self, topic):
+        self.polls += 1
+        for event, (fetch, digest) in self.fetchers.items():
+            try:
+                payload = await fetch(*topic.key)
+            except Exception:
+                log.warning("Stream fetch %s failed for %s", event, topic.key, exc_info=True)
+                continue
+            if payload is None:
+                continue
+            d = digest(payload)
+            if d != topic.digests.get(event):
+                topic.digests[event] = d
+                topic.last[event] = payload
+                self._publish(topic, event, payload)
+
+    async def _poll(self, topic):
+        while True:
+            await self.poll_once(topic)
+            await asyncio.sleep(self.interval or getattr(settings, "STREAM_POLL_SECS", STREAM_POLL_SECS))
+
+    def stats(self):
+        return {
+            "topics": len(self._topics),
+            "subscribers": sum(len(t.subscribers) for t in self._topics.values()),
+            "polls": self.polls,
+            "pushes": self.pushes,
+        }
+
+
+async def events(hub, key):
+    """SSE body for one subscriber; unsubscribes when the client goes away (the iterator is cancelled/closed)."""
+    q = hub.subscribe(key)
+    heartbeat = getattr(settings, "STREAM_HEARTBEAT_SECS", STREAM_HEARTBEAT_SECS)
+    try:
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True:
+            try:
+                event, payload = await asyncio.wait_for(q.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield sse(event, payload)
+    finally:
+        hub.unsubscribe(key, q)
+
+
+_HUBS = weakref.WeakKeyDictionary()
+
+
+def get_hub(fetchers):
+    loop = asyncio.get_running_loop()
+    hub = _HUBS.get(loop)
+    if hub is None:
+        hub = _HUBS[loop] = Hub(fetchers)
+    return hub
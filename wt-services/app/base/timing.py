@@ -0,0 +1,187 @@
+"""
+Per-request timing.
+
+span("owm") / @timed("aggregate") add the block's wall time to the current
+request's breakdown, held in a contextvar so it follows the request through
+sync_to_async and asyncio.to_thread; outside a request they cost one
+contextvar lookup. ServerTimingMiddleware reports the breakdown as a
+Server-Timing header (same-named spans are summed, nested spans overlap).
+
+SamplingProfilerMiddleware is opt-in (PROFILE_SAMPLE_EVERY > 0): it runs one
+in every N requests under cProfile and writes the stats to PROFILE_DIR,
+keeping the newest PROFILE_KEEP files. Only one request per process is
+profiled at a time; under ASGI the profile also sees whatever else the event
+loop ran meanwhile.
+"""
+import cProfile
+import functools
+import itertools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_SAMPLE_EVERY = 0              # 0 = profiler off
+PROFILE_DIR          = "/tmp/wt-profiles"
+PROFILE_KEEP         = 200
+
+_SPANS = ContextVar("wt_spans", default=None)
+
+
+@contextmanager
+def span(name):
+    spans = _SPANS.get()
+    if spans is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans[name] = spans.get(name, 0.0) + (time.perf_counter() - t0)
+
+
+def timed(name):
+    """Decorator form of span(); works on plain and async functions."""
+    def deco(fn):
+        if iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def server_timing(spans, total):
+    parts = [f"{name};dur={secs * 1000:.1f}" for name, secs in spans.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SERVER_TIMING_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        spans = {}
+        token = _SPANS.set(spans)
+        t0 = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _SPANS.reset(token)
+        response["Server-Timing"] = server_timing(spans, time.perf_counter() - t0)
+        return response
+
+    async def __acall__(self, request):
+        spans = {}
+        token = _SPANS.set(spans)
+        t0 = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _SPANS.reset(token)
+        response["Server-Timing"] = server_timing(spans, time.perf_counter() - t0)
+        return response
+
+
+# -----------------------------
+# Sampling profiler
+# -----------------------------
+_UNSAFE = re.compile(r"[^A-Za-z0-9]+")
+
+
+def _prune(directory, keep):
+    try:
+        files = sorted((e for e in os.scandir(directory) if e.name.endswith(".prof")),
+                       key=lambda e: e.stat().st_mtime)
+    except OSError:
+        return
+    for e in files[:max(0, len(files) - keep)]:
+        try:
+            os.remove(e.path)
+        except OSError:
+            pass
+
+
+class SamplingProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.every = int(getattr(settings, "PROFILE_SAMPLE_EVERY", PROFILE_SAMPLE_EVERY) or 0)
+        if self.every <= 0:
+            raise MiddlewareNotUsed
+        self.directory = getattr(settings, "PROFILE_DIR", PROFILE_DIR)
+        self.keep = getattr(settings, "PROFILE_KEEP", PROFILE_KEEP)
+        os.makedirs(self.directory, exist_ok=True)
+        self.get_response = get_response
+        self._counter = itertools.count(1)
+        self._busy = threading.Lock()   # cProfile can't nest; skip samples while one runs
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _claim(self):
+        """The request's sequence number if this one is sampled, else 0."""
+        n = next(self._counter)
+        return n if n % self.every == 0 and self._busy.acquire(blocking=False) else 0
+
+    def _save(self, prof, request, elapsed, n):
+        try:
+            name = "{}-{}-{}-{}-{}-{:.0f}ms.prof".format(
+                time.strftime("%Y%m%dT%H%M%S"), os.getpid(), n, request.method,
+                _UNSAFE.sub("_", request.path).strip("_") or "root", elapsed * 1000)
+            prof.dump_stats(os.path.join(self.directory, name))
+            _prune(self.directory, self.keep)
+        finally:
+            self._busy.release()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        n = self._claim()
+        if not n:
+            return self.get_response(request)
+        prof = cProfile.Profile()
+        t0 = time.perf_counter()
+        prof.enable()
+        try:
+            return self.get_response(request)
+        finally:
+            prof.disable()
+            self._save(prof, request, time.perf_counter() - t0, n)
+
+    async def __acall__(self, request):
+        n = self._claim()
+        if not n:
+            return await self.get_response(request)
+        prof = cProfile.Profile()
+        t0 = time.perf_counter()
+        prof.enable()
+        try:
+            return await self.get_response(request)
+        finally:
+            prof.disable()
+            self._save(prof, request, time.perf_counter() - t0, n)
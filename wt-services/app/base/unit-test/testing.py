@@ -1,11 +1,12 @@
 # tests/test_views.py
 import json
+import os
 import types
 import datetime as dt
 import pytest
 
 # Django app name that contains views.py
-from base import views
+from base import geoip, views
 
 from django.test import RequestFactory
 from django.http import QueryDict
@@ -68,6 +69,32 @@ def test_heat_index_and_wind_chill():
 def rf():
     return RequestFactory()
 
+@pytest.fixture(autouse=True)
+def _clear_caches(settings):
+    # Tests drive /api/alerts through the upstream point query unless they opt in
+    settings.ALERTS_INDEX_ENABLED = False
+    settings.PREFETCH_ENABLED = False
+    settings.FORECAST_STORE_ENABLED = False
+    settings.GAZETTEER_ENABLED = False
+    settings.UPSTREAM_QUOTA_ENABLED = False
+    views.alert_index.reset()
+    views.prefetch.reset()
+    views.resilience.reset()
+    views.hedging.reset()
+    views._POINT_ZONES.clear()
+    views._OWM_CACHE.clear()
+    views._NWS_CACHE.clear()
+    views._MAP_CACHE.clear()
+    views._LOCATION_MISSES.clear()
+    views.risk_grid._GRID_CACHE.clear()
+    views.geoip.clear_cache()
+    yield
+    views._OWM_CACHE.clear()
+    views._NWS_CACHE.clear()
+    views._MAP_CACHE.clear()
+    views.risk_grid._GRID_CACHE.clear()
+    views.geoip.clear_cache()
+
 def test__owm_request_missing_key(monkeypatch, settings):
     # Ensure missing key path returns a "fake" 401
     monkeypatch.setattr(views.settings, "OWM_API_KEY", None, raising=False)
@@ -102,7 +129,7 @@ def test_get_locations_success(monkeypatch, rf, settings):
     assert data["results"][0]["state"] == "NC"
 
 def test_alerts_success(monkeypatch, rf):
-    # Mock requests.get to return a standard NWS features payload
+    # Mock the NWS session's get to return a standard NWS features payload
     def fake_requests_get(url, headers=None, timeout=10):
         payload = {
             "features": [
@@ -122,7 +149,7 @@ def test_alerts_success(monkeypatch, rf):
         }
         return FakeResp(ok=True, status_code=200, payload=payload)
 
-    monkeypatch.setattr(views.requests, "get", fake_requests_get)
+    monkeypatch.setattr(views, "get_nws_session", lambda: types.SimpleNamespace(get=fake_requests_get))
 
     req = rf.get("/api/alerts?lat=35.23&lon=-80.84")
     resp = views.alerts(req)
@@ -199,7 +226,7 @@ def test_weather_data_success(monkeypatch, rf, settings):
     # mock geocoder.ip
     class FakeGeo:
         latlng = (35.23, -80.84)
-    monkeypatch.setattr(views.geocoder, "ip", lambda _: FakeGeo())
+    monkeypatch.setattr(geoip.geocoder, "ip", lambda _: FakeGeo())
 
     # mock _owm_request -> current weather payload
     payload = {"name": "Charlotte", "main": {"temp": 280.0}}
@@ -215,28 +242,1176 @@ def test_getData_alias(monkeypatch, rf, settings):
 
     class FakeGeo:
         latlng = (35.23, -80.84)
-    monkeypatch.setattr(views.geocoder, "ip", lambda _: FakeGeo())
+    monkeypatch.setattr(geoip.geocoder, "ip", lambda _: FakeGeo())
     payload = {"sys": {"country": "US"}}
     monkeypatch.setattr(views, "_owm_request", lambda path, params=None: FakeResp(True, 200, payload))
 
+    recorded = []
+    monkeypatch.setattr(views.prefetch, "record", lambda *key: recorded.append(key))
+
     req = rf.get("/api/getData?units=imperial")
     resp = views.getData(req)
     assert resp.status_code == 200
     assert resp.data["sys"]["country"] == "US"
+    # The busiest route feeds the prefetch popularity tracker like the other OWM views
+    assert recorded == [("owm", "/data/2.5/weather", 35.23, -80.84, "imperial")]
 
-def test_get_map_html_basic(monkeypatch, rf):
+def test_get_map_html_basic(monkeypatch, rf, settings):
     # Mock geolocate & suppress downstream network calls inside the try-block
     class FakeGeo:
         latlng = (35.23, -80.84)
-    monkeypatch.setattr(views.geocoder, "ip", lambda _: FakeGeo())
+    monkeypatch.setattr(geoip.geocoder, "ip", lambda _: FakeGeo())
 
     def fake_requests_get(url, headers=None, timeout=10):
         # return a non-ok so the alert overlay branch is skipped
         return FakeResp(ok=False, status_code=502, payload={"error": "skip"})
-    monkeypatch.setattr(views.requests, "get", fake_requests_get)
+    monkeypatch.setattr(views, "get_nws_session", lambda: types.SimpleNamespace(get=fake_requests_get))
 
     req = rf.get("/api/map-html/")
     resp = views.get_map_html(req)
     # returns HTML for folium map
     assert resp.status_code == 200
     assert b"<div " in resp.content  # folium map html container present
+
+def test_map_and_data_locate_clients_with_stock_geoip_settings(monkeypatch, settings):
+    # Stock settings: no range DB shipped, remote fallback not opted into; the main page must still work
+    from django.test import Client
+    settings.ALLOWED_HOSTS = ["testserver"]
+    assert not os.path.exists(settings.GEOIP_DB_PATH) and not settings.GEOIP_REMOTE_FALLBACK
+    monkeypatch.setattr(geoip.geocoder, "ip", lambda target: types.SimpleNamespace(latlng=(35.23, -80.84)))
+    monkeypatch.setattr(views, "get_nws_session", lambda: types.SimpleNamespace(
+        get=lambda url, headers=None, timeout=10: FakeResp(ok=False, status_code=502)))
+    monkeypatch.setattr(views, "_owm_request", lambda path, params=None: FakeResp(payload={"name": "Charlotte"}))
+
+    client = Client()
+    assert client.get("/api/map-html/").status_code == 200
+    assert client.get("/").json() == {"name": "Charlotte"}
+
+def test_owm_request_cache_hits_and_stale_refresh(monkeypatch, settings):
+    monkeypatch.setattr(views.settings, "OWM_API_KEY", "dummy", raising=False)
+    calls = []
+
+    class Resp(FakeResp):
+        content = b'{"name": "Charlotte"}'
+
+    def fake_fetch(path, params=None):
+        calls.append(dict(params))
+        return Resp(True, 200)
+    monkeypatch.setattr(views, "_owm_fetch", fake_fetch)
+
+    # Coordinates that snap to the same grid cell share one upstream call
+    r1 = views._owm_request("/data/2.5/weather", params={"lat": 35.2271, "lon": -80.8431, "units": "metric"})
+    r2 = views._owm_request("data/2.5/weather", params={"lon": -80.8412, "lat": 35.2289, "units": " Metric "})
+    assert r1.json() == r2.json() == {"name": "Charlotte"}
+    assert len(calls) == 1
+    assert calls[0]["lat"] == 35.23
+
+    # Expired-but-within-SWR entries are served immediately while one refresh runs
+    ckey = views._owm_cache_key("/data/2.5/weather", calls[0])
+    views._OWM_CACHE._data[ckey].expires_at = 0
+
+    class InlineThread:
+        def __init__(self, target, args=(), daemon=None):
+            self.target, self.args = target, args
+        def start(self):
+            self.target(*self.args)
+    monkeypatch.setattr(views.threading, "Thread", InlineThread)
+
+    r3 = views._owm_request("/data/2.5/weather", params={"lat": 35.23, "lon": -80.84, "units": "metric"})
+    assert r3.json() == {"name": "Charlotte"}
+    assert len(calls) == 2
+
+def test_ttl_cache_lru_bounds():
+    from base.cache import TTLCache, FRESH
+    c = TTLCache(max_entries=2, max_bytes=10)
+    c.set("a", 1, ttl=60, size=4)
+    c.set("b", 2, ttl=60, size=4)
+    assert c.get("a") == (1, FRESH)       # touch a -> b is now least recent
+    c.set("c", 3, ttl=60, size=4)         # over both bounds, evicts b
+    assert c.get("b") == (None, None)
+    assert c.get("a")[0] == 1 and c.get("c")[0] == 3
+    c.set("big", 4, ttl=60, size=11)      # larger than the whole cache, ignored
+    assert c.get("big") == (None, None)
+
+def test_singleflight_coalesces_concurrent_callers():
+    import threading
+    from base.singleflight import SingleFlight
+
+    sf = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        release.wait(timeout=2)
+        return {"ok": True}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(sf.do("k", slow_fetch))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while sf.stats()["coalesced"] < 4:
+        release.wait(timeout=0.001)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{"ok": True}] * 5
+    assert sf.stats() == {"leaders": 1, "coalesced": 4, "inFlight": 0}
+    # ...and exported on /metrics
+    from prometheus_client import REGISTRY
+    assert REGISTRY.get_sample_value("wt_singleflight_calls_total", {"group": "test", "role": "coalesced"}) >= 4
+
+    # Errors propagate to the leader and are not cached for later calls
+    def boom():
+        raise RuntimeError("upstream down")
+    with pytest.raises(RuntimeError):
+        sf.do("k", boom)
+    assert sf.do("k", lambda: 42) == 42
+
+def test_async_singleflight_survives_a_cancelled_leader():
+    import asyncio
+    from base.singleflight import AsyncSingleFlight
+
+    sf = AsyncSingleFlight("test-async")
+    calls = []
+
+    async def slow_fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    async def main():
+        leader = asyncio.ensure_future(sf.do("k", slow_fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(sf.do("k", slow_fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()                            # the leader's client goes away mid-fetch
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == [{"ok": True}] * 3
+    assert len(calls) == 1
+    assert sf.stats() == {"leaders": 1, "coalesced": 3, "inFlight": 0}
+
+def test_async_trends_matches_sync_contract(monkeypatch, rf, settings):
+    import asyncio
+    from base import async_views
+    monkeypatch.setattr(views.settings, "OWM_API_KEY", "dummy", raising=False)
+
+    list_payload = [
+        {"dt_txt": "2025-12-01 00:00:00", "main": {"temp": 10, "humidity": 50}, "wind": {"speed": 3.0}, "pop": 0.1},
+        {"dt_txt": "2025-12-02 00:00:00", "main": {"temp": 8, "humidity": 55},  "wind": {"speed": 5.0}, "pop": 0.6},
+    ]
+
+    async def fake_owm_request(path, params=None):
+        return views._CachedResp(200, json.dumps({"list": list_payload}).encode())
+    monkeypatch.setattr(async_views, "owm_request", fake_owm_request)
+    monkeypatch.setattr(views, "_owm_request", lambda path, params=None: FakeResp(True, 200, {"list": list_payload}))
+
+    req = rf.get("/api/trends?lat=35.23&lon=-80.84&units=metric&days=2")
+    resp = asyncio.run(async_views.trends(req))
+    assert resp.status_code == 200
+    assert json.loads(resp.content) == json.loads(json.dumps(views.trends(req).data))
+
+def test_async_alerts_uses_pooled_client_and_retries(monkeypatch, rf):
+    import asyncio
+    import httpx
+    from base import async_views
+
+    calls = []
+    def handler(request):
+        calls.append(str(request.url))
+        if len(calls) == 1:
+            return httpx.Response(503, json={"detail": "busy"})
+        return httpx.Response(200, json={"features": [
+            {"id": "abc", "properties": {"event": "Flood Watch", "severity": "Moderate"}, "geometry": None},
+        ]})
+
+    monkeypatch.setattr(async_views, "get_async_client",
+                        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(views, "NOAA_BACKOFF", 0)
+
+    req = rf.get("/api/alerts?lat=35.23&lon=-80.84")
+    resp = asyncio.run(async_views.alerts(req))
+    assert resp.status_code == 200
+    data = json.loads(resp.content)
+    assert data["count"] == 1 and data["alerts"][0]["event"] == "Flood Watch"
+    assert len(calls) == 2 and "point=35.23,-80.84" in calls[0]
+
+def test_asgi_mixed_routes_run_blocking_work_concurrently(monkeypatch, rf):
+    import asyncio
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from base import async_views
+
+    def slow_geocode(q, limit):
+        time.sleep(0.05)
+        return [{"id": q, "name": q, "state": None, "country": "US", "lat": 35.2, "lon": -80.8}], None
+    def slow_index(lat, lon):
+        time.sleep(0.05)
+        return {"count": 0, "alerts": []}
+    monkeypatch.setattr(views, "_owm_geocode", slow_geocode)
+    monkeypatch.setattr(views, "_alerts_from_index", slow_index)
+    reqs = [("get_locations", rf.get(f"/api/locations/?q=city{i}")) for i in range(8)]
+    reqs += [("alerts", rf.get(f"/api/alerts/?lat=35.{i}&lon=-80.8")) for i in range(8)]
+
+    # WSGI: one worker thread per request
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(reqs)) as pool:
+        sync_codes = list(pool.map(lambda r: getattr(views, r[0])(r[1]).status_code, reqs))
+    wsgi = time.perf_counter() - t0
+
+    async def serve():
+        return await asyncio.gather(*(getattr(async_views, name)(req) for name, req in reqs))
+    t0 = time.perf_counter()
+    async_codes = [r.status_code for r in asyncio.run(serve())]
+    asgi = time.perf_counter() - t0
+
+    assert sync_codes == async_codes == [200] * len(reqs)
+    # Queued on one thread-sensitive executor this would take 16 x 50 ms
+    assert asgi < max(2 * wsgi, 0.4)
+
+def test_async_upstream_quota_is_taken_off_the_event_loop(monkeypatch, rf, settings, tmp_path):
+    import asyncio
+    import threading
+    import httpx
+    from base import async_views, resilience
+
+    settings.UPSTREAM_QUOTA_ENABLED = True
+    settings.UPSTREAM_QUOTA_DB = str(tmp_path / "quota.sqlite3")
+    takes = []
+    real_take = resilience.SharedTokenBucket.take
+    def take(self, *args):
+        takes.append(threading.current_thread())
+        return real_take(self, *args)
+    monkeypatch.setattr(resilience.SharedTokenBucket, "take", take)
+    monkeypatch.setattr(async_views, "get_async_client",
+                        lambda: httpx.AsyncClient(transport=httpx.MockTransport(
+                            lambda request: httpx.Response(200, json={"features": []}))))
+
+    async def main():
+        resp = await async_views.alerts(rf.get("/api/alerts?lat=35.23&lon=-80.84"))
+        return resp, threading.current_thread()
+
+    resp, loop_thread = asyncio.run(main())
+    assert resp.status_code == 200
+    assert takes and loop_thread not in takes
+
+@pytest.mark.django_db
+def test_nws_points_are_persisted_and_reused(monkeypatch, rf):
+    from base.models import NwsPoint
+
+    urls = []
+    def fake_requests_get(url, headers=None, timeout=10):
+        urls.append(url)
+        if "/points/" in url:
+            return FakeResp(payload={"properties": {
+                "gridId": "GSP", "gridX": 118, "gridY": 65,
+                "forecast": "https://api.weather.gov/gridpoints/GSP/118,65/forecast",
+            }})
+        return FakeResp(payload={"properties": {"periods": [
+            {"startTime": "2025-12-01T06:00:00-05:00", "temperature": 55, "probabilityOfPrecipitation": {"value": 20}},
+            {"startTime": "2025-12-01T18:00:00-05:00", "temperature": 40, "probabilityOfPrecipitation": {"value": 40}},
+        ]}})
+    monkeypatch.setattr(views, "get_nws_session", lambda: types.SimpleNamespace(get=fake_requests_get))
+
+    req = rf.get("/api/nws?lat=35.227087&lon=-80.843127&days=1")
+    daily = views.nws(req).data["daily"]
+    assert daily == [{"date": "2025-12-01", "tMax": 55, "tMin": 40, "pop": 0.4}]
+    assert json.dumps(daily) == '[{"date": "2025-12-01", "tMax": 55, "tMin": 40, "pop": 0.4}]'   # ints, not 55.0
+    assert urls[0].endswith("/points/35.2271,-80.8431")
+    assert NwsPoint.objects.get().grid_id == "GSP"
+
+    # Within the forecast TTL nothing goes upstream at all
+    urls.clear()
+    assert views.nws(req).status_code == 200
+    assert urls == []
+
+    # Once the forecast expires, only the forecast is refetched; /points comes from the DB
+    views._NWS_CACHE.clear()
+    assert views.nws(req).status_code == 200
+    assert urls == ["https://api.weather.gov/gridpoints/GSP/118,65/forecast"]
+
+def test_nws_session_is_pooled_and_retrying(monkeypatch):
+    monkeypatch.setattr(views, "_NWS_SESSION", None)
+    s = views.get_nws_session()
+    assert views.get_nws_session() is s
+    adapter = s.get_adapter("https://api.weather.gov/points/1,1")
+    assert adapter.max_retries.total == views.NOAA_MAX_RETRIES
+    assert 503 in adapter.max_retries.status_forcelist
+    assert adapter._pool_maxsize == views.NOAA_POOL_MAXSIZE
+    assert "WeatherTracker" in s.headers["User-Agent"]
+
+    # Opening a pool makes it show up in the per-host stats
+    adapter.poolmanager.connection_from_url("https://api.weather.gov/")
+    stats = views.upstream_pool_stats()
+    assert stats["nws:https://api.weather.gov:443"]["maxsize"] == views.NOAA_POOL_MAXSIZE
+
+def test_geoip_range_db_resolves_forwarded_client(monkeypatch, rf, tmp_path, settings):
+    db = tmp_path / "geoip.bin"
+    geoip.write_db(db, [
+        ("8.8.8.0", "8.8.8.255", 37.386, -122.084),
+        ("1.1.1.0", "1.1.1.255", -33.494, 143.210),
+    ])
+    settings.GEOIP_DB_PATH = str(db)
+    settings.GEOIP_REMOTE_FALLBACK = False
+    geoip.clear_cache()
+
+    # Only hops appended by our own proxies count; anything to their left is client-supplied
+    req = rf.get("/api/data/", HTTP_X_FORWARDED_FOR="1.1.1.1, 8.8.8.8, 10.0.0.1", REMOTE_ADDR="10.0.0.2")
+    assert geoip.client_ip(req) == "10.0.0.2"
+    settings.TRUSTED_PROXY_COUNT = 2
+    assert geoip.client_ip(req) == "8.8.8.8"
+    settings.TRUSTED_PROXY_COUNT = 4                      # shorter chain than proxies: not forwarded by them
+    assert geoip.client_ip(req) == "10.0.0.2"
+    settings.TRUSTED_PROXY_COUNT = 2
+    lat, lon = geoip.locate_request(req)
+    assert lat == pytest.approx(37.386, abs=1e-4) and lon == pytest.approx(-122.084, abs=1e-4)
+
+    # Outside every range, and no remote fallback configured
+    with pytest.raises(ValueError):
+        geoip.locate_request(rf.get("/api/data/", REMOTE_ADDR="9.9.9.9"))
+    assert [type(r).__name__ for r in geoip.get_resolver().resolvers] == ["RangeDbResolver"]
+
+def test_geoip_remote_fallback_uses_client_ip(monkeypatch, rf, settings):
+    settings.GEOIP_DB_PATH = None
+    settings.GEOIP_REMOTE_FALLBACK = False                # no range DB: the remote lookup is all there is
+    seen = []
+    class FakeGeo:
+        latlng = (35.23, -80.84)
+    monkeypatch.setattr(geoip.geocoder, "ip", lambda target: seen.append(target) or FakeGeo())
+
+    req = rf.get("/", REMOTE_ADDR="8.8.4.4")
+    assert geoip.locate_request(req) == (35.23, -80.84)
+    assert geoip.locate_request(req) == (35.23, -80.84)   # second call served from the LRU
+    assert seen == ["8.8.4.4"]
+    assert geoip.locate_request(rf.get("/")) == (35.23, -80.84)  # loopback -> server location
+    assert seen[-1] == "me"
+
+def test_aggregation_daily_stats_grouped_reductions():
+    from base import aggregation
+    cols = aggregation.owm_columns([
+        {"dt_txt": "2025-12-02 00:00:00", "main": {"temp": 8, "humidity": 55}, "wind": {"speed": 5.0}, "pop": 0.6},
+        {"dt_txt": "2025-12-01 00:00:00", "main": {"temp": 10, "humidity": 50}, "pop": 0.1},
+        {"dt": 1764558000, "main": {"temp": 12}, "wind": {"speed": 4.5}},       # 2025-12-01 03:00 UTC
+        {"dt_txt": "2025-12-03 00:00:00", "main": {}},                           # day with no values
+        {"main": {"temp": 99}},                                                  # no timestamp -> dropped
+    ])
+    stats = aggregation.daily_stats(cols)
+    assert list(stats["date"]) == ["2025-12-01", "2025-12-02", "2025-12-03"]
+    assert list(stats["n"]) == [2, 1, 1]
+    assert stats["tMax"][0] == 12 and stats["tMin"][0] == 10 and stats["tMean"][0] == 11
+    assert stats["rhMax"][0] == 50 and stats["windMax"][0] == 4.5
+    assert aggregation.opt(stats["tMax"][2]) is None
+
+    tmax, tmin = aggregation.filled_range(stats)
+    assert tmax[2] == 0.0 and tmin[2] == 0.0
+    assert list(aggregation.pop_max(stats)) == [0.1, 0.6, 0.0]
+
+def test_forecast_batch_fans_out_concurrently(monkeypatch, settings):
+    import time
+    from rest_framework.test import APIRequestFactory
+    monkeypatch.setattr(views.settings, "OWM_API_KEY", "dummy", raising=False)
+
+    list_payload = [
+        {"dt_txt": "2025-12-01 00:00:00", "main": {"temp": 10, "humidity": 50}, "wind": {"speed": 3.0}, "pop": 0.1},
+        {"dt_txt": "2025-12-02 00:00:00", "main": {"temp": 8, "humidity": 55}, "wind": {"speed": 5.0}, "pop": 0.6},
+    ]
+    def slow_owm_request(path, params=None):
+        time.sleep(0.2)
+        return FakeResp(ok=True, status_code=200, payload={"list": list_payload})
+    monkeypatch.setattr(views, "_owm_request", slow_owm_request)
+
+    body = {"kind": "daily", "locations": [
+        {"lat": 35.2, "lon": -80.8, "days": 2},
+        {"lat": 40.7, "lon": -74.0, "units": "imperial"},
+        {"lat": 41.9, "lon": -87.6, "kind": "trends", "days": 2},
+        {"lat": 47.6, "lon": -122.3},
+        {"lon": 1.0},
+    ]}
+    req = APIRequestFactory().post("/api/forecast/batch", body, format="json")
+    started = time.monotonic()
+    resp = views.forecast_batch(req)
+    elapsed = time.monotonic() - started
+
+    assert resp.status_code == 200
+    results = resp.data["results"]
+    assert [r["status"] for r in results] == [200, 200, 200, 200, 400]
+    assert results[0]["data"]["daily"][0]["tMax"] == 10.0
+    assert results[1]["data"]["units"] == "imperial"
+    assert "predicted" in results[2]["data"]
+    assert results[4]["error"]["error"] == "lat & lon are required"
+    assert elapsed < 0.6   # four 0.2 s fetches in parallel, not ~0.8 s in series
+
+    bad = views.forecast_batch(APIRequestFactory().post("/api/forecast/batch", {"locations": []}, format="json"))
+    assert bad.status_code == 400
+
+def test_vectorized_risk_matches_scalar():
+    import numpy as np
+    from base import risk
+    temps = np.array([95.0, 30.0, 60.0, 40.0, np.nan])
+    rh    = np.array([60.0, 50.0, 40.0, 80.0, 50.0])
+    winds = np.array([10.0, 10.0, 10.0, 1.0, 10.0])
+
+    hi = risk.heat_index_f_array(temps, rh)
+    assert hi[0] == pytest.approx(views.heat_index_f(95, 60))
+    assert np.isnan(hi[4])
+
+    wc = risk.wind_chill_f_array(temps, winds)
+    assert wc[1] == pytest.approx(views.wind_chill_f(30, 10))
+    assert np.isnan(wc[[0, 2, 3, 4]]).all()   # too warm, too warm, too calm, missing
+
+    # Unit round trip and broadcasting against a scalar
+    assert risk.f_to_c(risk.c_to_f([-40.0, 100.0])) == pytest.approx([-40.0, 100.0])
+    assert risk.wind_chill_f_array([20.0, 30.0], 15.0).shape == (2,)
+
+def test_risk_grid_weights_and_tile_cache(monkeypatch):
+    from base import risk_grid
+    calls = []
+
+    def fetch(lat, lon):
+        calls.append((lat, lon))
+        # hot and humid north of the centre, bitter and windy to the south
+        if lat > 35.2:
+            return {"main": {"temp": 100, "humidity": 60}, "wind": {"speed": 5}}
+        if lat < 35.2:
+            return {"main": {"temp": 10, "humidity": 40}, "wind": {"speed": 20}}
+        return {"main": {"temp": 70, "humidity": 40}, "wind": {"speed": 5}}
+
+    pts = risk_grid.build_risk_grid(35.23, -80.84, fetch, size=3, step=0.1, now=0)
+    assert len(calls) == 9
+    assert len(pts) == 6                      # the mild middle row carries no weight
+    assert all(0 < w <= 1 for _, _, w in pts)
+    assert {round(p[0], 1) for p in pts} == {35.1, 35.3}
+
+    # Same tile (after snapping) and time bucket -> served from cache
+    assert risk_grid.build_risk_grid(35.21, -80.79, fetch, size=3, step=0.1, now=10) == pts
+    assert len(calls) == 9
+
+    # Big grids spend at most RISK_GRID_MAX_FETCHES upstream calls, centre first; cached cells are free
+    calls.clear()
+    cached = set()
+    def is_cached(lat, lon):
+        return (round(lat, 2), round(lon, 2)) in cached
+    def fetch_and_cache(lat, lon):
+        cached.add((round(lat, 2), round(lon, 2)))
+        return fetch(lat, lon)
+    risk_grid.build_risk_grid(40.0, -75.0, fetch_and_cache, size=9, step=0.1, now=0, is_cached=is_cached)
+    assert len(calls) == risk_grid.RISK_GRID_MAX_FETCHES
+    assert (40.0, -75.0) in {(round(a, 2), round(b, 2)) for a, b in calls}
+    risk_grid.build_risk_grid(40.0, -75.0, fetch_and_cache, size=9, step=0.1, now=0, is_cached=is_cached)
+    n = risk_grid.RISK_GRID_MAX_FETCHES
+    assert len(calls) == n + 2 * n and len(cached) == 2 * n   # an incomplete grid isn't cached; the next view fills in
+
+    # A cell whose fetch failed leaves the grid uncached too
+    calls.clear()
+    def fetch_with_gap(lat, lon):
+        return None if (round(lat, 2), round(lon, 2)) == (45.1, -70.0) else fetch(lat, lon)
+    risk_grid.build_risk_grid(45.0, -70.0, fetch_with_gap, size=3, step=0.1, now=0)
+    risk_grid.build_risk_grid(45.0, -70.0, fetch_with_gap, size=3, step=0.1, now=0)
+    assert len(calls) == 16
+
+    # Odd steps land on the shared cell lattice
+    lats, _ = risk_grid.grid_points(35.2, -80.8, 3, 0.05)
+    assert [round(x, 6) for x in lats.tolist()[::3]] == [35.15, 35.2, 35.25]
+
+def test_get_map_html_rejects_bad_grid_params(rf):
+    for query in ("grid=abc", "step=abc", "step=nan", "step=inf", "step=0", "step=-0.1", "grid=0", "step=5"):
+        resp = views.get_map_html(rf.get(f"/api/map-html/?lat=35.2&lon=-80.8&{query}"))
+        assert resp.status_code == 400, query
+
+def test_get_map_html_in_process_alerts_and_etag(monkeypatch, rf):
+    calls = []
+    def fake_requests_get(url, headers=None, timeout=10):
+        calls.append(url)
+        return FakeResp(payload={"features": [{
+            "id": "a1",
+            "properties": {"event": "Flood Watch", "severity": "Moderate", "headline": "Flooding possible"},
+            "geometry": {"type": "Polygon", "coordinates": [[[-80.9, 35.2], [-80.8, 35.3], [-80.8, 35.2], [-80.9, 35.2]]]},
+        }]})
+    monkeypatch.setattr(views, "get_nws_session", lambda: types.SimpleNamespace(get=fake_requests_get))
+    renders = []
+    real_render = views._render_map
+    monkeypatch.setattr(views, "_render_map", lambda *a: renders.append(a) or real_render(*a))
+
+    resp = views.get_map_html(rf.get("/api/map-html/?lat=35.2271&lon=-80.8431"))
+    assert resp.status_code == 200
+    assert b"Flooding possible" in resp.content          # alert layer made it onto the map
+    assert calls and "point=35.227,-80.843" in calls[0]    # in-process call, snapped point
+    etag = resp["ETag"]
+
+    # Unchanged map: 304 without rendering again
+    resp2 = views.get_map_html(rf.get("/api/map-html/?lat=35.2271&lon=-80.8431", HTTP_IF_NONE_MATCH=etag))
+    assert resp2.status_code == 304 and resp2["ETag"] == etag
+    # Cold client, warm cache: served without re-rendering
+    resp3 = views.get_map_html(rf.get("/api/map-html/?lat=35.2272&lon=-80.8432"))
+    assert resp3.content == resp.content
+    assert len(renders) == 1
+
+def test_alert_index_answers_point_queries_locally(monkeypatch, rf, settings):
+    from base import alert_index
+    square = [[-81.0, 35.0], [-80.0, 35.0], [-80.0, 36.0], [-81.0, 36.0], [-81.0, 35.0]]
+    hole   = [[-80.6, 35.4], [-80.4, 35.4], [-80.4, 35.6], [-80.6, 35.6], [-80.6, 35.4]]
+    feed = {"features": [
+        {"id": "poly", "properties": {"event": "Tornado Warning"},
+         "geometry": {"type": "Polygon", "coordinates": [square, hole]}},
+        {"id": "zone", "properties": {"event": "Heat Advisory",
+                                      "affectedZones": ["https://api.weather.gov/zones/forecast/NCZ071"]},
+         "geometry": None},
+        {"id": "far", "properties": {"event": "Gale Warning"},
+         "geometry": {"type": "MultiPolygon", "coordinates": [[[[-70, 40], [-69, 40], [-69, 41], [-70, 40]]]]}},
+    ]}
+
+    settings.ALERTS_INDEX_ENABLED = True
+    monkeypatch.setattr(alert_index, "ensure_started", lambda *a: None)
+    monkeypatch.setattr(views, "_point_zones", lambda lat, lon: ("NCZ071",) if lat < 36 else ())
+    def no_upstream(*a, **k):
+        raise AssertionError("point query should not reach upstream")
+    monkeypatch.setattr(views, "get_nws_session", lambda: types.SimpleNamespace(get=no_upstream))
+
+    idx = alert_index.refresh(lambda: feed, views._alert_record)
+    assert len(idx) == 3
+
+    ids = lambda lat, lon: [a["id"] for a in views.alerts(rf.get(f"/api/alerts?lat={lat}&lon={lon}")).data["alerts"]]
+    assert ids(35.2, -80.8) == ["poly", "zone"]
+    assert ids(35.5, -80.5) == ["zone"]            # inside the hole
+    assert ids(40.3, -69.2) == ["far"]
+    assert ids(45.0, -100.0) == []
+
+    # Near an edge the ASGI view answers from the exact point too, not the snapped one
+    import asyncio
+    from base import async_views
+    edge = "/api/alerts?lat=35.2&lon=-80.00004"     # snaps to lon -80.0, just outside
+    async_resp = asyncio.run(async_views.alerts(rf.get(edge)))
+    assert [a["id"] for a in json.loads(async_resp.content)["alerts"]] == ids(35.2, -80.00004) == ["poly", "zone"]
+
+    # SSE topics keep the exact point, so the stream agrees with /api/alerts too
+    settings.ASYNC_VIEWS = True
+    keys = []
+    monkeypatch.setattr(async_views.streams, "events", lambda hub, key: keys.append(key) or iter(()))
+    monkeypatch.setattr(async_views.streams, "get_hub", lambda fetchers: None)
+    asyncio.run(async_views.stream(rf.get("/api/stream?lat=35.2&lon=-80.00004")))
+    streamed = asyncio.run(async_views._stream_alerts(*keys[0]))
+    assert [a["id"] for a in streamed["alerts"]] == ["poly", "zone"]
+
+    # A stale index is not trusted; the view falls back to upstream
+    idx.built_at -= alert_index.ALERTS_INDEX_MAX_AGE_SECS + 1
+    assert alert_index.current() is None
+
+def test_alerts_zoom_simplifies_polygons(monkeypatch, rf):
+    import numpy as np
+    from base import simplify
+    simplify.clear_cache()
+    # A wiggly 2000-vertex ring around a ~1 deg circle
+    theta = np.linspace(0, 2 * np.pi, 2000)
+    r = 1 + 0.0005 * np.sin(theta * 400)
+    ring = np.column_stack([-80 + r * np.cos(theta), 35 + r * np.sin(theta)]).tolist()
+    ring[-1] = ring[0]
+    feed = {"features": [{"id": "big", "properties": {"event": "Flood Warning"},
+                          "geometry": {"type": "Polygon", "coordinates": [ring]}}]}
+    monkeypatch.setattr(views, "get_nws_session", lambda: types.SimpleNamespace(get=lambda *a, **k: FakeResp(payload=feed)))
+
+    raw = views.alerts(rf.get("/api/alerts?lat=35&lon=-80")).data["alerts"][0]["polygon"]
+    assert len(raw["coordinates"][0]) == 2000
+
+    coarse = views.alerts(rf.get("/api/alerts?lat=35&lon=-80&zoom=6")).data["alerts"][0]["polygon"]
+    fine = views.alerts(rf.get("/api/alerts?lat=35&lon=-80&zoom=14")).data["alerts"][0]["polygon"]
+    c, f = coarse["coordinates"][0], fine["coordinates"][0]
+    assert 4 <= len(c) < len(f) < 2000
+    assert c[0] == c[-1] == ring[0]                      # still a closed ring
+    # Kept vertices are original ones, so they sit on the wiggly circle
+    radii = np.hypot(np.array(c)[:, 0] + 80, np.array(c)[:, 1] - 35)
+    assert np.all(np.abs(radii - 1) <= 0.0005 + 1e-9)
+
+    for bad in ("zoom=x", "zoom=inf", "zoom=nan", "zoom=-inf", "tolerance=nan", "tolerance=inf"):
+        assert views.alerts(rf.get(f"/api/alerts?lat=35&lon=-80&{bad}")).status_code == 400, bad
+    assert views.get_map_html(rf.get("/api/map-html/?lat=35&lon=-80&zoom=inf")).status_code == 400
+    # Cached per alert id and detail level
+    assert simplify._CACHE.get(("big", f"{simplify.zoom_tolerance(6):.6g}"))[0] == coarse
+
+def test_prefetch_refreshes_popular_locations_within_budget(monkeypatch, settings):
+    from base import prefetch
+    clock = [0.0]
+    tracker = prefetch.PopularityTracker(half_life=100, clock=lambda: clock[0])
+    monkeypatch.setattr(prefetch, "_TRACKER", tracker)
+    monkeypatch.setattr(prefetch, "ensure_started", lambda: None)
+    settings.PREFETCH_ENABLED = True
+    settings.PREFETCH_BUDGET = 2
+    settings.PREFETCH_MIN_SCORE = 2
+
+    ttls = {("a",): 30.0, ("b",): None, ("c",): 10.0, ("d",): 5000.0}
+    refreshed = []
+    monkeypatch.setitem(prefetch._HANDLERS, "t", prefetch._Handler(
+        lambda *k: ttls[k], lambda *k: refreshed.append(k), 1))
+
+    for key, hits in (("d", 9), ("a", 8), ("b", 7), ("c", 6), ("e", 1)):
+        for _ in range(hits):
+            prefetch.record("t", key)
+
+    # d is fresh, e is a one-off; a and b use up the budget before c
+    assert prefetch.run_once() == [("t", "a"), ("t", "b")]
+    assert refreshed == [("a",), ("b",)]
+
+    # Old popularity decays: one half-life later, c (6/2 + 5) outranks d (9/2)
+    clock[0] = 100.0
+    for _ in range(5):
+        prefetch.record("t", "c")
+    assert [k for k, _ in tracker.top(2)] == [("t", "c"), ("t", "d")]
+    assert tracker.score(("t", "a")) == pytest.approx(4.0)
+
+    # The budget is per host: with two workers each pass spends half of it
+    settings.PREFETCH_BUDGET = 4
+    settings.PREFETCH_WORKERS = 2
+    ttls[("a",)] = ttls[("b",)] = ttls[("c",)] = None
+    assert len(prefetch.run_once()) == 2
+
+@pytest.mark.django_db
+def test_forecast_store_persists_and_serves_cold_misses(monkeypatch, rf, settings):
+    from django.utils import timezone
+    from base import forecast_store
+    from base.models import ForecastSlice
+    monkeypatch.setattr(views.settings, "OWM_API_KEY", "dummy", raising=False)
+    settings.FORECAST_STORE_ENABLED = True
+
+    t0 = 1764547200  # 2025-12-01 00:00 UTC
+    items = [{"dt": t0 + i * 10800, "dt_txt": dt.datetime.fromtimestamp(t0 + i * 10800, dt.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+              "main": {"temp": 10 + i, "humidity": 50}, "wind": {"speed": 3.0}, "pop": 0.1 * i} for i in range(6)]
+    payload = {"list": items, "city": {"name": "Charlotte"}}
+    raw = json.dumps(payload, separators=(",", ":")).encode()   # upstream's bytes, not our serialization
+
+    calls = []
+    class Session:
+        def get(self, url, params=None, timeout=None):
+            calls.append(params)
+            return types.SimpleNamespace(ok=True, status_code=200, content=raw)
+    monkeypatch.setattr(views, "get_owm_session", lambda: Session())
+    archived = []
+    monkeypatch.setattr(forecast_store, "archive", lambda *a: archived.append(a))
+
+    req = rf.get("/api/forecast/daily?lat=35.2271&lon=-80.8431&units=metric&days=1")
+    first = views.daily_forecast(req).data
+    assert len(calls) == 1
+    # The fetched forecast is queued for the writer with the snapped location
+    (lat, lon, units, content, issued_at), = archived
+    assert (lat, lon, units) == (35.23, -80.84, "metric")
+    forecast_store._write_batch(archived)
+    assert ForecastSlice.objects.at(35.23, -80.84, "metric").count() == 6
+
+    # Cold process (empty memory cache): served from the store, not upstream, byte for byte (same ETag)
+    forecast_params = {"lat": 35.2271, "lon": -80.8431, "units": "metric"}
+    live = views._owm_request("/data/2.5/forecast", params=forecast_params)
+    views._OWM_CACHE.clear()
+    stored = views._owm_request("/data/2.5/forecast", params=forecast_params)
+    assert stored.content == live.content == raw and stored.digest == live.digest
+    assert views.daily_forecast(req).data == first
+    assert views.trends(rf.get("/api/trends?lat=35.2271&lon=-80.8431&units=metric")).status_code == 200
+    assert len(calls) == 1
+
+    # Range queries over valid time; a newer snapshot supersedes older slices for the same valid time
+    start = dt.datetime.fromtimestamp(t0 + 3 * 3600, dt.timezone.utc)
+    window = ForecastSlice.objects.at(35.23, -80.84, "metric").valid_between(start, start + dt.timedelta(hours=9))
+    assert [s.temp for s in window.order_by("valid_at")] == [11, 12, 13]
+    forecast_store.save(35.23, -80.84, "metric", {"list": items[:2]}, timezone.now())
+    latest = ForecastSlice.objects.at(35.23, -80.84, "metric").latest_issued()
+    assert latest.count() == 6 and ForecastSlice.objects.count() == 8
+
+    # Snapshots older than the cache TTL are not served
+    views._OWM_CACHE.clear()
+    from base.models import ForecastSnapshot
+    ForecastSnapshot.objects.update(issued_at=timezone.now() - dt.timedelta(hours=1))
+    views.daily_forecast(req)
+    assert len(calls) == 2
+
+    # Retention: snapshots (and their slices) past FORECAST_STORE_RETAIN_HOURS are deleted
+    settings.FORECAST_STORE_RETAIN_HOURS = 24
+    ForecastSnapshot.objects.update(issued_at=timezone.now() - dt.timedelta(hours=25))
+    forecast_store.save(35.23, -80.84, "metric", {"list": items}, timezone.now())
+    assert forecast_store.prune() == 2
+    assert ForecastSnapshot.objects.count() == 1 and ForecastSlice.objects.count() == 6
+
+def test_streaming_stats_match_batch():
+    import random
+    from base.stats import EwmaState, RunningStats, TrendState
+    rnd = random.Random(7)
+    xs = [rnd.uniform(-30, 40) for _ in range(50)]
+
+    s = RunningStats(window=7)
+    for i, x in enumerate(xs):
+        s.update(x)
+        win = xs[max(0, i - 6):i + 1]
+        m = sum(win) / len(win)
+        assert s.mean == pytest.approx(m)
+        assert s.std == pytest.approx((sum((v - m) ** 2 for v in win) / len(win)) ** 0.5)
+
+    e = EwmaState(0.5)
+    assert [e.update(x) for x in (10, 20, 30)] == views._ewma([10, 20, 30], alpha=0.5)
+    t = TrendState()
+    assert [round(t.update(x), 6) for x in (10, 20, 30)] == [10, 13.5, 19.275]
+    noise = RunningStats.of([10, 20, 30]).std
+    assert t.confidence() == pytest.approx(1 - noise / (noise + 20 + 1e-6))
+
+def test_get_locations_local_gazetteer_then_cached_owm_misses(monkeypatch, rf, settings):
+    settings.GAZETTEER_ENABLED = True
+    calls = []
+    def fake_owm_request(path, params=None):
+        calls.append(params["q"])
+        payload = [{"name": "Mooresville", "state": "North Carolina", "country": "US", "lat": 35.58, "lon": -80.81}] \
+            if "moores" in params["q"].lower() else []
+        return FakeResp(ok=True, status_code=200, payload=payload)
+    monkeypatch.setattr(views, "_owm_request", fake_owm_request)
+
+    def names(q, limit=10):
+        body = views.get_locations(rf.get("/api/locations", {"q": q, "limit": limit})).content
+        return [(r["name"], r["state"]) for r in json.loads(body)["results"]]
+
+    # A full page of prefix hits is answered locally, ranked by population
+    assert names("char", limit=2) == [("Charlotte", "North Carolina"), ("Charleston", "South Carolina")]
+    assert calls == []
+
+    # Any prefix hit is answered locally, with state filters and accents; typos still ask OWM
+    assert names("charleston, wv") == [("Charleston", "West Virginia")]
+    assert names("sao paulo") == [("São Paulo", "São Paulo")]
+    assert calls == []
+    assert names("Charlote")[0] == ("Charlotte", "North Carolina")
+
+    # OWM answers are cached once per normalized query, negative answers included
+    assert names("Mooresville") == [("Mooresville", "North Carolina")]
+    assert names("  mooresville ") == [("Mooresville", "North Carolina")]
+    assert names("Qwzxv") == [] and names("qwzxv!") == []
+    assert calls == ["Charlote", "Mooresville", "Qwzxv"]
+
+def test_get_locations_clamps_and_validates_limit(monkeypatch, rf, settings):
+    settings.GAZETTEER_ENABLED = True
+    monkeypatch.setattr(views, "_owm_request", lambda path, params=None: FakeResp(payload=[]))
+
+    def get(limit):
+        return views.get_locations(rf.get("/api/locations", {"q": "char", "limit": limit}))
+
+    assert get("abc").status_code == 400 and get("2.5").status_code == 400
+    for limit in ("-3", "0"):
+        resp = get(limit)
+        assert resp.status_code == 200
+        assert [r["name"] for r in json.loads(resp.content)["results"]] == ["Charlotte"]
+    assert len(json.loads(get("500").content)["results"]) <= 25
+
+def test_get_locations_merges_owm_only_for_fuzzy_names(monkeypatch, rf, settings):
+    settings.GAZETTEER_ENABLED = True
+    upstream = {
+        "charlottesville": [{"name": "Charlottesville", "state": "Virginia", "country": "US", "lat": 38.03, "lon": -78.48}],
+        "paris": [{"name": "Paris", "state": "Ile-de-France", "country": "FR", "lat": 48.86, "lon": 2.35},
+                  {"name": "Paris", "state": "Texas", "country": "US", "lat": 33.66, "lon": -95.56}],
+    }
+    monkeypatch.setattr(views, "_owm_request", lambda path, params=None:
+                        FakeResp(payload=upstream.get(params["q"].lower(), [])))
+
+    def names(q):
+        return [(r["name"], r["country"]) for r in json.loads(views.get_locations(rf.get("/api/locations", {"q": q})).content)["results"]]
+
+    # A trigram guess never hides the real place; it ranks behind OWM's match
+    assert names("Charlottesville") == [("Charlottesville", "US"), ("Charlotte", "US")]
+    # Prefix hits never go upstream, even for names OWM knows more places for
+    assert names("Paris") == [("Paris", "FR")]
+
+def test_trends_columnar_format_and_compression(monkeypatch, settings):
+    import gzip
+    from django.test import Client
+    from base import async_views
+    settings.ALLOWED_HOSTS = ["testserver"]
+    monkeypatch.setattr(views.settings, "OWM_API_KEY", "dummy", raising=False)
+    items = [{"dt_txt": f"2025-12-0{1 + i // 8} {(i % 8) * 3:02d}:00:00",
+              "main": {"temp": 10 + i % 5, "humidity": 60}, "wind": {"speed": 4.0}, "pop": 0.1} for i in range(40)]
+    monkeypatch.setattr(views, "_owm_request", lambda path, params=None: FakeResp(payload={"list": items}))
+
+    client = Client()
+    plain = client.get("/api/trends/?lat=35.2&lon=-80.8")
+    rows = plain.json()
+    col = client.get("/api/trends/?lat=35.2&lon=-80.8&format=columnar")
+    assert col["Content-Type"].startswith("application/vnd.weathertracker.columnar+json")
+    cols = col.json()
+
+    # Same information, one array per field, no officialForecast copy
+    assert "officialForecast" not in cols and "predicted" not in cols
+    assert cols["daily"]["date"] == [d["date"] for d in rows["daily"]]
+    assert cols["daily"]["risk.heatIndex"] == [d["risk"]["heatIndex"] for d in rows["daily"]]
+    assert cols["daily"]["predicted.tMax"] == [p["tMax"] for p in rows["predicted"]]
+    assert cols["confidence"] == rows["confidence"]
+    assert len(col.content) < len(plain.content)
+
+    # Negotiated compression: gzip or brotli on request, untouched without Accept-Encoding
+    gz = client.get("/api/trends/?lat=35.2&lon=-80.8", HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+    assert gz["Content-Encoding"] == "gzip" and "Accept-Encoding" in gz["Vary"]
+    assert json.loads(gzip.decompress(gz.content)) == rows
+    assert not plain.has_header("Content-Encoding")
+    import brotli
+    br = client.get("/api/trends/?lat=35.2&lon=-80.8", HTTP_ACCEPT_ENCODING="gzip, br")
+    assert br["Content-Encoding"] == "br" and json.loads(brotli.decompress(br.content)) == rows
+
+    # The async view honours the same format parameter
+    import asyncio
+    async def fake_async_owm(path, params=None):
+        return FakeResp(payload={"list": items})
+    monkeypatch.setattr(async_views, "owm_request", fake_async_owm)
+    async_col = asyncio.run(async_views.daily_forecast(RequestFactory().get("/api/forecast/daily?lat=35.2&lon=-80.8&format=columnar")))
+    assert json.loads(async_col.content)["daily"]["date"][:2] == ["2025-12-01", "2025-12-02"]
+
+def test_conditional_get_on_forecast_and_alerts(monkeypatch, rf):
+    items = [{"dt_txt": f"2025-12-0{1 + i // 8} {(i % 8) * 3:02d}:00:00",
+              "main": {"temp": 10 + i % 5, "humidity": 60}, "wind": {"speed": 4.0}, "pop": 0.1} for i in range(16)]
+    cached = views._CachedResp(200, json.dumps({"list": items}).encode())
+    monkeypatch.setattr(views, "_owm_request", lambda path, params=None: cached)
+    built = []
+    real_body = views._trends_body
+    monkeypatch.setattr(views, "_trends_body", lambda *a: built.append(a) or real_body(*a))
+
+    first = views.trends(rf.get("/api/trends/?lat=35.2&lon=-80.8"))
+    etag = first["ETag"]
+    assert first.status_code == 200 and first["Last-Modified"]
+    assert first["Cache-Control"].startswith("public, max-age=") and "stale-while-revalidate=" in first["Cache-Control"]
+
+    # Matching validator (weak form too, as compression sends it): 304 without aggregating again
+    again = views.trends(rf.get("/api/trends/?lat=35.2&lon=-80.8", HTTP_IF_NONE_MATCH=f"W/{etag}"))
+    assert again.status_code == 304 and again["ETag"] == etag and len(built) == 1
+    since = views.trends(rf.get("/api/trends/?lat=35.2&lon=-80.8", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]))
+    assert since.status_code == 304
+    # Different parameters or new upstream content -> different validator
+    assert views.trends(rf.get("/api/trends/?lat=35.2&lon=-80.8&days=3"))["ETag"] != etag
+    cached = views._CachedResp(200, json.dumps({"list": items[:8]}).encode())
+    assert views.trends(rf.get("/api/trends/?lat=35.2&lon=-80.8", HTTP_IF_NONE_MATCH=etag)).status_code == 200
+
+    # NWS validators follow the forecast's issue time
+    payload = {"properties": {"updateTime": "2025-12-01T10:00:00+00:00", "periods": [
+        {"startTime": "2025-12-01T06:00:00-05:00", "temperature": 55, "probabilityOfPrecipitation": {"value": 20}}]}}
+    monkeypatch.setattr(views, "_nws_forecast_payload", lambda lat, lon: payload)
+    n1 = views.nws(rf.get("/api/nws?lat=35.2&lon=-80.8"))
+    assert n1["Last-Modified"] == "Mon, 01 Dec 2025 10:00:00 GMT"
+    assert views.nws(rf.get("/api/nws?lat=35.2&lon=-80.8", HTTP_IF_NONE_MATCH=n1["ETag"])).status_code == 304
+    payload["properties"]["updateTime"] = "2025-12-01T11:00:00+00:00"
+    assert views.nws(rf.get("/api/nws?lat=35.2&lon=-80.8", HTTP_IF_NONE_MATCH=n1["ETag"])).status_code == 200
+
+    # Alerts: keyed on the alert id set
+    monkeypatch.setattr(views, "fetch_alerts", lambda lat, lon: ({"count": 1, "alerts": [{"id": "a1", "polygon": None}]}, 200))
+    a1 = views.alerts(rf.get("/api/alerts?lat=35.2&lon=-80.8"))
+    assert views.alerts(rf.get("/api/alerts?lat=35.2&lon=-80.8", HTTP_IF_NONE_MATCH=a1["ETag"])).status_code == 304
+
+def test_stream_hub_shares_one_poll_and_pushes_only_changes(settings):
+    import asyncio
+    from base import streams
+
+    settings.STREAM_HEARTBEAT_SECS = 5
+    state = {"alerts": ["a1"], "calls": 0}
+
+    async def fetch_alerts(lat, lon, units):
+        state["calls"] += 1
+        return {"alerts": [{"id": i} for i in state["alerts"]]}
+
+    hub = streams.Hub({"alerts": (fetch_alerts, lambda b: tuple(a["id"] for a in b["alerts"]))}, interval=3600)
+    key = (35.23, -80.84, "metric")
+
+    async def scenario():
+        one, two = streams.events(hub, key), streams.events(hub, key)
+        assert await one.__anext__() == "retry: 5000\n\n"
+        assert await two.__anext__() == "retry: 5000\n\n"
+        first = await one.__anext__()
+        assert first.startswith("event: alerts\ndata: ") and '"a1"' in first
+        assert await two.__anext__() == first          # late joiner gets the current state
+        assert hub.stats()["topics"] == 1 and hub.stats()["subscribers"] == 2
+
+        topic = hub._topics[key]
+        await hub.poll_once(topic)                     # unchanged: nothing queued
+        assert all(q.empty() for q in topic.subscribers)
+        state["alerts"] = ["a1", "a2"]
+        await hub.poll_once(topic)
+        assert '"a2"' in await one.__anext__() and '"a2"' in await two.__anext__()
+        assert state["calls"] == 3 and hub.pushes == 2
+
+        await one.aclose()
+        await two.aclose()
+        assert hub.stats()["topics"] == 0 and topic.task.cancelling()
+
+    asyncio.run(scenario())
+
+def test_stream_endpoint_is_sse_under_asgi_only(settings, rf):
+    import asyncio
+    from base import async_views
+
+    settings.ASYNC_VIEWS = False
+    assert asyncio.run(async_views.stream(rf.get("/api/stream/?lat=35.2&lon=-80.8"))).status_code == 501
+    settings.ASYNC_VIEWS = True
+    assert asyncio.run(async_views.stream(rf.get("/api/stream/"))).status_code == 400
+
+    async def open_stream():
+        resp = await async_views.stream(rf.get("/api/stream/?lat=35.2&lon=-80.8"))
+        await resp.streaming_content.aclose()
+        return resp
+    resp = asyncio.run(open_stream())
+    assert resp.streaming and resp["Content-Type"] == "text/event-stream" and resp["Cache-Control"] == "no-cache"
+
+def test_bench_stub_counts_upstream_calls_per_route(settings):
+    import requests as http
+    from base import bench
+
+    with bench.StubUpstream(error_rate=1.0) as stub:
+        r = http.get(f"{stub.base_url}/points/35.23,-80.84")
+        assert r.status_code == 503 and stub.snapshot()["nws_points"] == 1
+    with bench.StubUpstream() as stub:
+        props = http.get(f"{stub.base_url}/points/35.23,-80.84").json()["properties"]
+        assert props["forecast"].startswith(stub.base_url)
+
+    report = {"routes": {}}
+    bench._run_routes(report, ["api/trends/"], requests=6, concurrency=3, warmup=0,
+                      locs=[(35.23, -80.84), (40.71, -74.01)], names=["Charlotte"], payload_dir=None,
+                      latency_ms=0, jitter_ms=0, error_rate=0, seed=0, cold=True)
+    trends = report["routes"]["api/trends/"]
+    assert trends["requests"] == 6 and trends["statuses"] == {"200": 6}
+    # Two locations, cold cache: one forecast fetch each, the rest served from cache / single-flight
+    assert trends["upstream"] == {"owm_forecast": 2} and trends["upstreamPerRequest"] == round(2 / 6, 4)
+    assert trends["latencyMs"]["p50"] <= trends["latencyMs"]["p99"]
+
+def test_metrics_record_routes_upstreams_retries_and_caches(monkeypatch, settings):
+    from django.test import Client
+    from prometheus_client import REGISTRY
+    from urllib3.response import HTTPResponse
+    from base import metrics
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    settings.OWM_API_KEY = "k"
+    settings.ALLOWED_HOSTS = ["testserver"]
+    payload = {"list": [{"dt_txt": "2025-12-01 00:00:00", "main": {"temp": 10, "humidity": 50}, "pop": 0.1}]}
+    resp = FakeResp(payload=payload)
+    resp.content = json.dumps(payload).encode()
+    monkeypatch.setattr(views, "get_owm_session", lambda: types.SimpleNamespace(get=lambda *a, **k: resp))
+
+    route = dict(route="/api/trends/", method="GET", status="200")
+    owm = dict(provider="owm", path="/data/2.5/forecast")
+    before = (sample("wt_http_request_duration_seconds_count", **route),
+              sample("wt_upstream_responses_total", **owm, status="200"),
+              sample("wt_cache_lookups_total", cache="owm", result="fresh"))
+    client = Client()
+    for _ in range(2):
+        assert client.get("/api/trends/?lat=35.2&lon=-80.8").status_code == 200
+    assert sample("wt_http_request_duration_seconds_count", **route) == before[0] + 2
+    assert sample("wt_upstream_responses_total", **owm, status="200") == before[1] + 1   # second one was cached
+    assert sample("wt_cache_lookups_total", cache="owm", result="fresh") == before[2] + 1
+    assert sample("wt_http_requests_in_flight") == 0
+
+    # NWS URLs collapse to bounded path labels
+    assert metrics.upstream_path("nws", "https://api.weather.gov/gridpoints/GSP/118,65/forecast") == "/gridpoints/forecast"
+    assert metrics.upstream_path("nws", "https://api.weather.gov/points/35.2,-80.8") == "/points"
+
+    # Session retries are counted per provider and trigger
+    retry = metrics.CountingRetry(provider="owm", total=2, status_forcelist=[503])
+    n = sample("wt_upstream_retries_total", provider="owm", reason="503")
+    retry = retry.increment("GET", "/data/2.5/weather", response=HTTPResponse(status=503))
+    retry.increment("GET", "/data/2.5/weather", response=HTTPResponse(status=503))
+    assert sample("wt_upstream_retries_total", provider="owm", reason="503") == n + 2
+
+    # Upstream connection pools are read at scrape time
+    import requests
+    session = requests.Session()
+    session.mount("https://", views.HTTPAdapter(pool_maxsize=7))
+    session.adapters["https://"].poolmanager.connection_from_url("https://api.openweathermap.org")
+    monkeypatch.setattr(views, "_OWM_SESSION", session)
+
+    body = client.get("/metrics").content.decode()
+    assert "wt_http_request_duration_seconds_bucket" in body and "wt_upstream_retries_total" in body
+    assert 'wt_upstream_pool_maxsize{pool="owm:https://api.openweathermap.org:443"} 7.0' in body
+
+def test_server_timing_breakdown_and_sampling_profiler(monkeypatch, settings, tmp_path):
+    from django.test import Client
+
+    settings.OWM_API_KEY = "k"
+    settings.ALLOWED_HOSTS = ["testserver"]
+    payload = {"list": [{"dt_txt": "2025-12-01 00:00:00", "main": {"temp": 10, "humidity": 50}, "pop": 0.1}]}
+    resp = FakeResp(payload=payload)
+    resp.content = json.dumps(payload).encode()
+    monkeypatch.setattr(views, "get_owm_session", lambda: types.SimpleNamespace(get=lambda *a, **k: resp))
+
+    r = Client().get("/api/trends/?lat=35.2&lon=-80.8")
+    timings = dict(part.split(";dur=") for part in r["Server-Timing"].split(", "))
+    assert {"owm", "aggregate", "risk", "render", "total"} <= timings.keys()
+    assert float(timings["owm"]) <= float(timings["total"])
+
+    settings.PROFILE_SAMPLE_EVERY = 2
+    settings.PROFILE_DIR = str(tmp_path)
+    settings.PROFILE_KEEP = 2
+    client = Client()
+    for _ in range(8):
+        assert client.get("/api/trends/?lat=35.2&lon=-80.8").status_code == 200
+    profiles = sorted(p.name for p in tmp_path.iterdir())
+    assert len(profiles) == 2 and all("api_trends" in p and p.endswith(".prof") for p in profiles)
+
+def test_circuit_breaker_fails_fast_and_serves_stale_owm(monkeypatch, settings):
+    from base import resilience
+    from base.cache import TTLCache
+
+    settings.OWM_API_KEY = "k"
+    settings.CIRCUIT_FAILURE_THRESHOLD = 2
+    settings.CIRCUIT_OPEN_SECS = 3600
+    clock = [0.0]
+    monkeypatch.setattr(views, "_OWM_CACHE", TTLCache(clock=lambda: clock[0], name="owm"))
+
+    calls = []
+    status = [200]
+    def fake_get(url, params=None, timeout=None):
+        calls.append(url)
+        return types.SimpleNamespace(ok=status[0] == 200, status_code=status[0], content=b'{"name": "Charlotte"}',
+                                     json=lambda: {"name": "Charlotte"})
+    monkeypatch.setattr(views, "get_owm_session", lambda: types.SimpleNamespace(get=fake_get))
+
+    params = {"lat": 35.23, "lon": -80.84, "units": "metric"}
+    assert views._owm_request("/data/2.5/weather", params=params).ok
+    clock[0] += 300 + 120 + 1                     # past TTL and SWR: a plain miss
+    status[0] = 503
+    for _ in range(2):                            # upstream failing: the expired copy is served instead
+        assert views._owm_request("/data/2.5/weather", params=params).json() == {"name": "Charlotte"}
+    assert len(calls) == 3 and resilience.breaker("owm").state == resilience.OPEN
+
+    # Open: no upstream call at all; a location with nothing cached gets a fast 503
+    assert views._owm_request("/data/2.5/weather", params=params).json() == {"name": "Charlotte"}
+    miss = views._owm_request("/data/2.5/weather", params={**params, "lat": 40.71})
+    assert miss.status_code == 503 and "circuit open" in miss.json()["message"] and len(calls) == 3
+
+def test_shared_token_bucket_limits_across_instances(tmp_path):
+    from base.resilience import CircuitBreaker, SharedTokenBucket, OPEN, CLOSED
+
+    now = [1000.0]
+    path = str(tmp_path / "quota.sqlite3")
+    a, b = SharedTokenBucket(path, clock=lambda: now[0]), SharedTokenBucket(path, clock=lambda: now[0])
+    taken = [bucket.take("owm", rate=1.0, burst=3) for bucket in (a, b, a, b)]
+    assert taken == [True, True, True, False]     # one budget, whichever "worker" asks
+    now[0] += 2
+    assert [b.take("owm", 1.0, 3), a.take("owm", 1.0, 3), a.take("owm", 1.0, 3)] == [True, True, False]
+
+    t = [0.0]
+    br = CircuitBreaker("nws", threshold=1, open_secs=10, clock=lambda: t[0])
+    br.failure()
+    assert br.state == OPEN and not br.allow()
+    t[0] = 10
+    assert br.allow() and not br.allow()          # one half-open probe
+    br.success()
+    assert br.state == CLOSED and br.allow()
+
+def test_risk_grid_cells_spend_their_own_owm_share(monkeypatch, settings, tmp_path):
+    settings.OWM_API_KEY = "k"
+    settings.UPSTREAM_QUOTA_ENABLED = True
+    settings.UPSTREAM_QUOTA_DB = str(tmp_path / "quota.sqlite3")
+    settings.UPSTREAM_BUDGETS = {"owm": {"rate": 0.0, "burst": 10}, "owm_risk_grid": {"rate": 0.0, "burst": 2}}
+    calls = []
+    def fake_get(url, params=None, timeout=None):
+        calls.append(params["lat"])
+        return types.SimpleNamespace(ok=True, status_code=200, content=b'{"main": {}}', json=lambda: {"main": {}})
+    monkeypatch.setattr(views, "get_owm_session", lambda: types.SimpleNamespace(get=fake_get))
+
+    assert views._risk_grid_cell(35.0, -80.0) and views._risk_grid_cell(35.1, -80.0)
+    assert views._risk_grid_cell(35.2, -80.0) is None     # grid share spent; no upstream call
+    assert views._risk_grid_cell(35.0, -80.0)             # cached cells are free
+    assert calls == [35.0, 35.1]
+    # The rest of the OWM budget is still there for everything else
+    assert views._owm_request("/data/2.5/weather", params={"lat": 40.0, "lon": -75.0}).ok
+
+def test_risk_grid_cells_past_swr_are_not_counted_as_cached(monkeypatch, settings):
+    from base.cache import TTLCache
+    settings.OWM_API_KEY = "k"
+    clock = [0.0]
+    monkeypatch.setattr(views, "_OWM_CACHE", TTLCache(clock=lambda: clock[0], name="owm"))
+    calls = []
+    def fake_get(url, params=None, timeout=None):
+        calls.append(params["lat"])
+        return types.SimpleNamespace(ok=True, status_code=200, content=b'{"main": {}}', json=lambda: {"main": {}})
+    monkeypatch.setattr(views, "get_owm_session", lambda: types.SimpleNamespace(get=fake_get))
+
+    assert not views._risk_grid_cell_cached(35.0, -80.0)
+    views._risk_grid_cell(35.0, -80.0)
+    assert calls == [35.0]
+    ttl = views.OWM_CACHE_TTLS["/data/2.5/weather"]
+    clock[0] = ttl + 1                                       # stale but servable
+    assert views._risk_grid_cell_cached(35.0, -80.0)
+    clock[0] = ttl + views.OWM_CACHE_SWR_SECS + 60           # only kept for outages now
+    assert not views._risk_grid_cell_cached(35.0, -80.0)
+    assert views._OWM_CACHE.get_stale(views._owm_cache_key(
+        "/data/2.5/weather", views._owm_normalize_params({"lat": 35.0, "lon": -80.0, "units": "imperial"}))) is not None
+
+def test_request_deadline_bounds_upstream_calls_and_retries(monkeypatch, settings):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import requests
+    import urllib3
+    from base import deadline, metrics, resilience
+
+    settings.OWM_API_KEY = "k"
+    timeouts = []
+    def fake_get(url, params=None, timeout=None):
+        timeouts.append(timeout)
+        if len(timeouts) == 3:
+            time.sleep(0.1)
+            raise requests.Timeout("read timed out")
+        return types.SimpleNamespace(ok=True, status_code=200, content=b"{}", json=lambda: {})
+    monkeypatch.setattr(views, "get_owm_session", lambda: types.SimpleNamespace(get=fake_get))
+
+    assert views._owm_fetch("/data/2.5/weather").ok and timeouts == [views.OWM_TIMEOUT_SECS]
+    with deadline.scope(2):
+        assert views._owm_fetch("/data/2.5/weather").ok and timeouts[1] <= 2
+        # The deadline follows the request into worker threads
+        with ThreadPoolExecutor(1) as pool:
+            assert 0 < pool.submit(deadline.in_context(deadline.remaining)).result() <= 2
+    with deadline.scope(0.06):                     # upstream outlives the budget: 504, breaker untouched
+        r = views._owm_fetch("/data/2.5/weather")
+        assert r.status_code == 504 and "deadline" in r.text
+        assert resilience.breaker("owm").failures == 0
+        assert views._owm_fetch("/data/2.5/weather").status_code == 504 and len(timeouts) == 3
+
+    # urllib3 retries stop once the next backoff would cross the deadline
+    retry = metrics.CountingRetry(provider="owm", total=3, backoff_factor=5, status_forcelist=[503],
+                                  raise_on_status=False)
+    busy = urllib3.HTTPResponse(status=503, body=b"")
+    with deadline.scope(3):
+        again = retry.increment("GET", "/x", response=busy)   # first retry has no backoff
+        with pytest.raises(urllib3.exceptions.MaxRetryError):
+            again.increment("GET", "/x", response=busy)
+    assert retry.increment("GET", "/x", response=busy).increment("GET", "/x", response=busy)
+
+def test_hedged_request_answers_from_the_faster_copy(settings):
+    import asyncio
+    import itertools
+    import time
+    from base import hedging, metrics
+
+    settings.HEDGE_ENABLED = True
+    settings.HEDGE_MIN_SAMPLES = 3
+    url = "https://api.openweathermap.org/data/2.5/weather"
+    for _ in range(5):
+        hedging.window("owm", url).observe(0.01)
+    assert hedging.hedge_delay("owm", url) == hedging.HEDGE_MIN_DELAY_SECS
+
+    won = metrics.UPSTREAM_HEDGES.labels("owm", "won")
+    before = won._value.get()
+    n = itertools.count()
+    def slow_then_fast():
+        if next(n) == 0:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+    t0 = time.perf_counter()
+    assert hedging.call("owm", url, slow_then_fast) == "fast" and time.perf_counter() - t0 < 0.5
+
+    cancelled = []
+    m = itertools.count()
+    async def aslow_then_fast():
+        if next(m) == 0:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "slow"
+        return "fast"
+    assert asyncio.run(hedging.acall("owm", url, aslow_then_fast)) == "fast" and cancelled == [True]
+    assert won._value.get() == before + 2
+
+    settings.HEDGE_ENABLED = False                 # off: exactly one call, no waiting on history
+    assert hedging.call("owm", url, lambda: "once") == "once"
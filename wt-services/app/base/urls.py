@@ -1,15 +1,21 @@
 from django.urls import path 
-from . import views
+from django.conf import settings
+from . import views, async_views, metrics
 
 # HTTP operations are routed here
+# Under an ASGI worker every endpoint is async: native versions, or sync views run off the event loop
+upstream = async_views if getattr(settings, "ASYNC_VIEWS", False) else views
 
 urlpatterns = [
-    path('', views.getData),
-    path('api/locations/', views.get_locations),
-    path('api/data/', views.weather_data),
-    path('api/trends/', views.trends),
-    path('api/forecast/daily', views.daily_forecast),   # <-- NEW (OWM aggregated daily)
-    path('api/nws', views.nws),                         # <-- NEW (NOAA daily)
-    path('api/alerts/', views.alerts, name='alerts'),
-    path('api/map-html/', views.get_map_html),  # New route for map HTML
+    path('', upstream.getData),
+    path('api/locations/', upstream.get_locations),
+    path('api/data/', upstream.weather_data),
+    path('api/trends/', upstream.trends),
+    path('api/forecast/daily', upstream.daily_forecast),   # <-- NEW (OWM aggregated daily)
+    path('api/forecast/batch', upstream.forecast_batch),   # many locations, one call
+    path('api/nws', upstream.nws),                         # <-- NEW (NOAA daily)
+    path('api/alerts/', upstream.alerts, name='alerts'),
+    path('api/stream/', async_views.stream, name='stream'),  # SSE; ASGI only
+    path('api/map-html/', upstream.get_map_html),  # New route for map HTML
+    path('metrics', metrics.metrics_view, name='metrics'),  # Prometheus, merged across workers
 ]
\ No newline at end of file
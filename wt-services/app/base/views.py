@@ -1,53 +1,42 @@
 import logging
 from datetime import datetime, timedelta
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.http import HttpResponse
 from django.conf import settings
 import requests
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from django.utils import timezone
 import math
-from django.http import JsonResponse
-
-# views.py
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
-from django.conf import settings
-import logging
-from datetime import datetime
-import math
-import requests
-import geocoder
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
+import json
+import threading
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from django.http import JsonResponse, HttpResponseNotModified
+from .cache import TTLCache, FRESH, STALE
+from .singleflight import SingleFlight
+from .models import NwsPoint, snap_point
+from . import (aggregation, alert_index, conditional, deadline, forecast_store, gazetteer, geoip, hedging, metrics,
+               prefetch, risk, resilience, risk_grid, simplify, timing)
+from .stats import EwmaState, RunningStats, TrendState
+from .renderers import ColumnarRenderer
 
 #Map Purposes
 import folium
-from django.shortcuts import render
 from django.views.decorators.clickjacking import xframe_options_exempt
-import geocoder
 from folium.plugins import HeatMap
-import numpy as np
 
 # Configure logger
 log = logging.getLogger(__name__)
-NOAA_TIMEOUT_SECS = 20
+NOAA_TIMEOUT_SECS = 10
 NOAA_MAX_RETRIES = 3
 NOAA_BACKOFF = 0.6
+NOAA_POOL_MAXSIZE = 10   # keep-alive connections per host; >= concurrent callers per worker
 
-_session = None
-
-
-# Gets the coordinates of the current user using there IP address
-def get_coordinates():
-    current_location = geocoder.ip("me")
-
-    if current_location and current_location.latlng:
-        latitude, longitude = current_location.latlng
-    
-    return latitude, longitude
+# Session cache
+_NWS_SESSION = None
 
 OWM_TIMEOUT_SECS = 20
 OWM_MAX_RETRIES  = 3
@@ -61,7 +50,8 @@ def get_owm_session():
     global _OWM_SESSION
     if _OWM_SESSION is None:
         s = requests.Session()
-        retry = Retry(
+        retry = metrics.CountingRetry(
+            provider="owm",
             total=OWM_MAX_RETRIES,
             read=OWM_MAX_RETRIES,
             connect=OWM_MAX_RETRIES,
@@ -75,63 +65,245 @@ def get_owm_session():
         _OWM_SESSION = s
     return _OWM_SESSION
 
+# -----------------------------
+# OWM response cache
+# -----------------------------
+# Per-path TTLs (seconds); paths not listed here bypass the cache.
+OWM_CACHE_TTLS = {
+    "/data/2.5/weather": 300,
+    "/data/2.5/forecast": 1800,
+    "/geo/1.0/direct": 86400,
+}
+OWM_CACHE_SWR_SECS        = 120   # serve-stale window while one refresh runs
+OWM_CACHE_GRACE_SECS      = 6 * 3600   # expired entries kept for OWM outages (see _owm_last_resort)
+OWM_CACHE_MAX_ENTRIES     = 2048
+OWM_CACHE_MAX_BYTES       = 64 * 1024 * 1024
+OWM_CACHE_COORD_PRECISION = 2     # ~1 km; nearby users share one entry
+
+_OWM_CACHE = TTLCache(
+    max_entries=getattr(settings, "OWM_CACHE_MAX_ENTRIES", OWM_CACHE_MAX_ENTRIES),
+    max_bytes=getattr(settings, "OWM_CACHE_MAX_BYTES", OWM_CACHE_MAX_BYTES),
+    name="owm",
+)
+
+# Identical in-flight upstream fetches share one request
+_OWM_FLIGHT = SingleFlight("owm")
+_NWS_FLIGHT = SingleFlight("nws")
+
+
+class _CachedResp:
+    """Minimal stand-in for requests.Response built from a cached body."""
+    __slots__ = ("status_code", "content", "fetched_at", "_digest")
+
+    def __init__(self, status_code, content, fetched_at=None):
+        self.status_code = status_code
+        self.content = content
+        self.fetched_at = fetched_at or timezone.now()
+        self._digest = None
+
+    @property
+    def digest(self):
+        # Cached entries are shared, so each body is hashed once, not once per request
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.content).hexdigest()
+        return self._digest
+
+    @property
+    def ok(self): return 200 <= self.status_code < 400
+
+    @property
+    def text(self): return self.content.decode("utf-8", errors="replace")
+
+    def json(self): return json.loads(self.content)
+
+
+def _owm_normalize_params(params):
+    """Drops appid, snaps coordinates and normalizes values so equivalent queries share a key."""
+    prec = getattr(settings, "OWM_CACHE_COORD_PRECISION", OWM_CACHE_COORD_PRECISION)
+    out = {}
+    for k, v in (params or {}).items():
+        k = str(k).strip().lower()
+        if k == "appid" or v is None:
+            continue
+        if k in ("lat", "lon"):
+            v = round(float(v), prec)
+        elif isinstance(v, str):
+            v = " ".join(v.split()).lower()
+        out[k] = v
+    return out
+
+
+def _owm_cache_key(path, q):
+    return "/" + path.lstrip("/") + "?" + urlencode(sorted(q.items()))
+
+
+def _owm_ttl(path):
+    ttls = getattr(settings, "OWM_CACHE_TTLS", OWM_CACHE_TTLS)
+    return ttls.get("/" + path.lstrip("/"), 0)
+
+
+def _owm_fetch_and_store(ckey, path, q, ttl):
+    return _OWM_FLIGHT.do(ckey, _owm_fetch_and_store_once, ckey, path, q, ttl)
+
+
+def _owm_fetch_and_store_once(ckey, path, q, ttl):
+    r = _owm_fetch(path, q)
+    if not getattr(r, "ok", False):
+        return r
+    resp = _owm_store(ckey, _CachedResp(r.status_code, r.content), ttl)
+    _owm_archive(path, q, resp)
+    return resp
+
+
+def _owm_store(ckey, resp, ttl):
+    _OWM_CACHE.set(
+        ckey, resp, ttl,
+        swr=getattr(settings, "OWM_CACHE_SWR_SECS", OWM_CACHE_SWR_SECS),
+        size=len(resp.content) + len(ckey),
+        grace=getattr(settings, "OWM_CACHE_GRACE_SECS", OWM_CACHE_GRACE_SECS),
+    )
+    return resp
+
+
+OWM_FORECAST_PATH = "/data/2.5/forecast"
+
+def _owm_archive(path, q, resp):
+    """Hands a freshly fetched forecast to the persistent store (written off the request path)."""
+    if "/" + path.lstrip("/") == OWM_FORECAST_PATH:
+        forecast_store.archive(q.get("lat"), q.get("lon"), q.get("units", "standard"), resp.content, resp.fetched_at)
+
+
+def _owm_from_store(ckey, path, q, ttl):
+    """
+    Cold-miss fallback for forecasts: a snapshot persisted by any worker within
+    the cache TTL is loaded into the cache for the rest of its TTL and served.
+    """
+    if "/" + path.lstrip("/") != OWM_FORECAST_PATH or not forecast_store.enabled():
+        return None
+    try:
+        stored = forecast_store.latest(q.get("lat"), q.get("lon"), q.get("units", "standard"),
+                                       max_age=timedelta(seconds=ttl))
+    except Exception:
+        log.warning("Forecast store lookup failed", exc_info=True)
+        return None
+    if stored is None:
+        return None
+    content, issued_at = stored
+    remaining = ttl - (timezone.now() - issued_at).total_seconds()
+    if remaining <= 0:
+        return None
+    return _owm_store(ckey, _CachedResp(200, content, fetched_at=issued_at), remaining)
+
+
+def _owm_refresh(ckey, path, q, ttl):
+    try:
+        _owm_fetch_and_store(ckey, path, q, ttl)
+    except Exception:
+        log.exception("Background OWM refresh failed for %s", ckey)
+    finally:
+        _OWM_CACHE.end_refresh(ckey)
+
+
+@timing.timed("owm")
 def _owm_request(path, params=None):
+    """Cached GET against OWM: fresh hits are served directly, stale hits are served while one background refresh runs."""
+    q   = _owm_normalize_params(params)
+    ttl = _owm_ttl(path)
+    ckey = _owm_cache_key(path, q)
+    if ttl <= 0 or not getattr(settings, "OWM_API_KEY", None):
+        return _OWM_FLIGHT.do(ckey, _owm_fetch, path, q)
+
+    hit, state = _OWM_CACHE.get(ckey)
+    if state == FRESH:
+        return hit
+    if state == STALE:
+        if _OWM_CACHE.begin_refresh(ckey):
+            threading.Thread(target=_owm_refresh, args=(ckey, path, q, ttl), daemon=True).start()
+        return hit
+    return _owm_last_resort(ckey, _owm_from_store(ckey, path, q, ttl) or _owm_fetch_and_store(ckey, path, q, ttl))
+
+def _owm_last_resort(ckey, resp):
+    """While OWM is failing (or we've stopped calling it), an expired copy still in its grace period beats an error."""
+    if getattr(resp, "ok", False) or not resilience.is_failure(getattr(resp, "status_code", None)):
+        return resp
+    stale = _OWM_CACHE.get_stale(ckey)
+    return stale if stale is not None else resp
+
+
+def _owm_fetch(path, params=None):
+    """Uncached GET against OWM; never raises, failures come back as non-ok fake responses."""
     base = getattr(settings, "OWM_BASE_URL", "https://api.openweathermap.org").rstrip("/")
     key  = getattr(settings, "OWM_API_KEY", None)
     if not key:
-        class FakeResp:
-            status_code = 401
-            text = "Missing OWM_API_KEY"
-            def json(self): return {"cod":401, "message":"Missing OWM_API_KEY"}
-            @property
-            def ok(self): return False
-        return FakeResp()
+        return _owm_failure(401, "Missing OWM_API_KEY")
+    try:
+        timeout = deadline.timeout(OWM_TIMEOUT_SECS)
+    except deadline.DeadlineExceeded:
+        return _owm_failure(504, "OWM request skipped: request deadline exceeded")
+    refused = resilience.admit("owm")
+    if refused:
+        return _owm_failure(503, f"OWM unavailable: {resilience.REFUSALS[refused]}")
 
     url = f"{base}/{path.lstrip('/')}"
     q   = dict(params or {})
     q["appid"] = key
 
-    try:
-        r = get_owm_session().get(url, params=q, timeout=OWM_TIMEOUT_SECS)
-        # DEBUG: uncomment to verify the final URL during troubleshooting
-        # print("OWM URL:", r.url, "status:", r.status_code)
-        return r
-    except requests.Timeout:
-        class FakeResp:
-            status_code = 504
-            text = "OWM request timed out"
-            def json(self): return {"cod":504, "message": self.text}
-            @property
-            def ok(self): return False
-        return FakeResp()
-    except requests.RequestException as e:
-        class FakeResp:
-            status_code = 502
-            text = f"OWM request failed: {e}"
-            def json(self): return {"cod":502, "message": self.text}
-            @property
-            def ok(self): return False
-        return FakeResp()
+    with metrics.upstream_call("owm", url) as call:
+        try:
+            r = hedging.call("owm", url, lambda: get_owm_session().get(url, params=q, timeout=timeout))
+            call.status = r.status_code
+            resilience.record("owm", r.status_code)
+            return r
+        except requests.RequestException as e:
+            if deadline.expired():
+                # Our budget ran out, not OWM's patience: don't count it against the breaker
+                call.status = "deadline"
+                resilience.breaker("owm").cancel()
+                return _owm_failure(504, "OWM request cut off by the request deadline")
+            if isinstance(e, requests.Timeout):
+                call.status = "timeout"
+                resilience.record("owm", None)
+                return _owm_failure(504, "OWM request timed out")
+            call.status = "error"
+            resilience.record("owm", None)
+            return _owm_failure(502, f"OWM request failed: {e}")
+
+def _owm_failure(status, message):
+    """Non-ok stand-in response for a request that never got an answer."""
+    class FakeResp:
+        status_code = status
+        text = message
+        def json(self): return {"cod": status, "message": self.text}
+        @property
+        def ok(self): return False
+    return FakeResp()
 
 # -----------------------------
 # Small math helpers
 # -----------------------------
 def _ewma(arr, alpha=0.35):
-    s = arr[0]
-    out = []
-    for i, x in enumerate(arr):
-        s = x if i == 0 else alpha * x + (1 - alpha) * s
-        out.append(s)
-    return out
+    e = EwmaState(alpha)
+    return [e.update(x) for x in arr]
 
-def _avg(a): return sum(a)/len(a) if a else 0.0
+def _avg(a): return RunningStats.of(a).mean if a else 0.0
 
 def _std(a):
-    if not a: return 0.0
-    m = _avg(a)
-    return math.sqrt(sum((x - m)**2 for x in a)/len(a))
+    # population std, single pass (Welford)
+    return RunningStats.of(a).std
 def _clamp(x, lo, hi): return max(lo, min(hi, x))
 
+@timing.timed("geoip")
+def _geolocate_ip(request):
+    """(lat, lon) floats for the client's IP; raises ValueError when it can't be determined."""
+    return geoip.locate_request(request)
+
+def _owm_error(resp):
+    """(body, status) for a failed OWM response."""
+    try:
+        return resp.json(), resp.status_code
+    except Exception:
+        return {"error": "owm_error", "text": str(getattr(resp, "text", ""))[:500]}, getattr(resp, "status_code", 502)
+
 # -----------------------------
 # current-weather endpoint
 # -----------------------------
@@ -139,102 +311,219 @@ def _clamp(x, lo, hi): return max(lo, min(hi, x))
 def weather_data(request):
     try:
         # Dynamic location based on IP
-        curr_loc = geocoder.ip("me")
-        if not curr_loc or not curr_loc.latlng:
-            raise ValueError("Could not geolocate client IP.")
-        lat, lon = map(float, curr_loc.latlng)
+        lat, lon = _geolocate_ip(request)
     except (TypeError, ValueError):
         return Response({"error": "lat & lon are required or could not be determined"}, status=400)
 
     units = (request.GET.get("units") or "metric").strip()
+    _track_owm("/data/2.5/weather", lat, lon, units)
     resp = _owm_request("/data/2.5/weather", params={"lat": lat, "lon": lon, "units": units})
     if not getattr(resp, "ok", False):
-        try:
-            return Response(resp.json(), status=resp.status_code)
-        except Exception:
-            return Response({"error":"owm_error","text": str(getattr(resp, "text", ""))[:500]}, status=getattr(resp, "status_code", 502))
+        body, status = _owm_error(resp)
+        return Response(body, status=status)
     return Response(resp.json(), status=200)
 
 # Backward-compatible alias
 @api_view(['GET'])
 def getData(request):
     try:
-        curr_loc = geocoder.ip("me")
-        if not curr_loc or not curr_loc.latlng:
-            raise ValueError("Could not geolocate client IP.")
-        lat, lon = map(float, curr_loc.latlng)
+        lat, lon = _geolocate_ip(request)
     except (TypeError, ValueError):
         return Response({"error": "lat & lon are required or could not be determined"}, status=400)
 
     units = request.GET.get("units", "metric")
+    _track_owm("/data/2.5/weather", lat, lon, units)
     resp = _owm_request("/data/2.5/weather", params={"lat": lat, "lon": lon, "units": units})
     if not getattr(resp, "ok", False):
-        try:
-            return Response(resp.json(), status=resp.status_code)
-        except Exception:
-            return Response({"error":"owm_error","text": str(getattr(resp, "text", ""))[:500]}, status=getattr(resp, "status_code", 502))
+        body, status = _owm_error(resp)
+        return Response(body, status=status)
     return Response(resp.json(), status=200)
 
 
-def _nws_points(lat, lon):
-    url = f"https://api.weather.gov/points/{lat},{lon}"
-    HDRS = {"User-Agent": "WeatherTracker/1.0 (student project) blank@example.com"}
-    return requests.get(url, headers=HDRS, timeout=10).json()
+NWS_HEADERS = {"User-Agent": "WeatherTracker/1.0 (student project) blank@example.com"}
 
-def _nws_forecast(lat, lon, days=7):
-    HDRS = {"User-Agent": "WeatherTracker/1.0 (student project) blank@example.com"}
-    meta = _nws_points(lat, lon)
-    grid_url = meta["properties"]["forecast"]
-    r = requests.get(grid_url, headers=HDRS, timeout=10).json()
-
-    daily = {}
-    for day in r.get("properties", {}).get("periods", []):
-        d = (day.get("startTime") or "")[:10]
-        if not d:
+def get_nws_session():
+    global _NWS_SESSION
+    if _NWS_SESSION is None:
+        s = requests.Session()
+        s.headers.update(NWS_HEADERS)
+        retry = metrics.CountingRetry(
+            provider="nws",
+            total=NOAA_MAX_RETRIES,
+            read=NOAA_MAX_RETRIES,
+            connect=NOAA_MAX_RETRIES,
+            backoff_factor=NOAA_BACKOFF,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        size = getattr(settings, "NOAA_POOL_MAXSIZE", NOAA_POOL_MAXSIZE)
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=size)
+        s.mount("https://", adapter)
+        s.mount("http://",  adapter)
+        _NWS_SESSION = s
+    return _NWS_SESSION
+
+def upstream_pool_stats():
+    """Per-host connection pool counters for the OWM and NWS sessions."""
+    out = {}
+    for name, sess in (("owm", _OWM_SESSION), ("nws", _NWS_SESSION)):
+        if sess is None:
             continue
-        rec = daily.setdefault(d, {"tMax": None, "tMin": None, "pop": 0})
+        for adapter in {id(a): a for a in sess.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                out[f"{name}:{pool.scheme}://{pool.host}:{pool.port}"] = {
+                    "connectionsOpened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                    "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                }
+    return out
+
+def _nws_url(path):
+    base = getattr(settings, "NWS_BASE_URL", "https://api.weather.gov").rstrip("/")
+    return f"{base}/{path.lstrip('/')}"
+
+def _nws_fetch(url):
+    try:
+        timeout = deadline.timeout(NOAA_TIMEOUT_SECS)
+    except deadline.DeadlineExceeded:
+        raise requests.Timeout("NWS request skipped: request deadline exceeded")
+    refused = resilience.admit("nws")
+    if refused:
+        return _CachedResp(503, json.dumps({"detail": f"NWS unavailable: {resilience.REFUSALS[refused]}"}).encode())
+    with metrics.upstream_call("nws", url) as call:
+        try:
+            r = hedging.call("nws", url, lambda: get_nws_session().get(url, timeout=timeout))
+        except requests.RequestException as e:
+            if deadline.expired():
+                call.status = "deadline"
+                resilience.breaker("nws").cancel()
+                raise requests.Timeout("NWS request cut off by the request deadline") from e
+            call.status = "timeout" if isinstance(e, requests.Timeout) else "error"
+            resilience.record("nws", None)
+            raise
+        call.status = getattr(r, "status_code", None)
+        resilience.record("nws", call.status)
+        return r
 
-        temp = day.get("temperature")
-        if temp is not None:
-            rec["tMax"] = temp if rec["tMax"] is None else max(rec["tMax"], temp)
-            rec["tMin"] = temp if rec["tMin"] is None else min(rec["tMin"], temp)
+def _nws_get(url):
+    """GET against api.weather.gov; concurrent callers for the same URL share one request."""
+    return _NWS_FLIGHT.do(url, _nws_fetch, url)
 
-        pop_obj = day.get("probabilityOfPrecipitation") or {}
-        pop_val = pop_obj.get("value")
-        if pop_val is not None:
-            rec["pop"] = max(rec["pop"], pop_val)
+NWS_POINTS_TTL = timedelta(days=30)   # office/grid assignments almost never move
+
+def _nws_points_cached(lat, lon):
+    """Stored /points properties for (lat, lon), or None; DB trouble just means a cache miss."""
+    try:
+        return NwsPoint.lookup(lat, lon, getattr(settings, "NWS_POINTS_TTL", NWS_POINTS_TTL))
+    except Exception:
+        log.warning("NWS points lookup failed", exc_info=True)
+        return None
+
+def _nws_points_store(lat, lon, meta):
+    props = (meta or {}).get("properties") or {}
+    if not props.get("forecast"):
+        return
+    try:
+        NwsPoint.store(lat, lon, props)
+    except Exception:
+        log.warning("NWS points store failed", exc_info=True)
+
+def _nws_points(lat, lon):
+    lat, lon = snap_point(lat, lon)
+    props = _nws_points_cached(lat, lon)
+    if props is not None:
+        return {"properties": props}
+    url = _nws_url(f"/points/{lat},{lon}")
+    meta = _nws_get(url).json()
+    _nws_points_store(lat, lon, meta)
+    return meta
+
+# -----------------------------
+# NWS response cache (gridpoint forecasts and point alerts, by snapped point)
+# -----------------------------
+NWS_FORECAST_TTL_SECS = 900    # NWS reissues gridpoint forecasts roughly hourly
+ALERTS_POINT_TTL_SECS = 60
+NWS_CACHE_GRACE_SECS  = 6 * 3600   # expired forecasts (never alerts) kept for NWS outages
+_NWS_CACHE = TTLCache(max_entries=4096, max_bytes=32 * 1024 * 1024, name="nws")
+
+def _nws_cache_store(key, value, ttl, resp, grace=0):
+    _NWS_CACHE.set(key, value, ttl, size=len(getattr(resp, "content", b"") or b"") + 128, grace=grace)
+
+@timing.timed("nws")
+def _nws_forecast_payload(lat, lon):
+    lat, lon = snap_point(lat, lon)
+    hit, state = _NWS_CACHE.get(("forecast", lat, lon))
+    if state is not None:
+        return hit
+    return _nws_forecast_fetch(lat, lon)
+
+def _nws_forecast_fetch(lat, lon):
+    """Uncached gridpoint forecast for a snapped point; ok responses are cached."""
+    try:
+        meta = _nws_points(lat, lon)
+        r, error = _nws_get(meta["properties"]["forecast"]), None
+    except (requests.RequestException, KeyError) as e:
+        r, error = None, e
+    return _nws_forecast_result(lat, lon, r, error)
+
+def _nws_forecast_result(lat, lon, r, error=None):
+    """Payload for a gridpoint fetch: cached when ok; when NWS is failing, an expired copy if one is left."""
+    key = ("forecast", lat, lon)
+    if r is not None and getattr(r, "ok", False):
+        payload = r.json()
+        _nws_cache_store(key, payload, getattr(settings, "NWS_FORECAST_TTL_SECS", NWS_FORECAST_TTL_SECS), r,
+                         grace=getattr(settings, "NWS_CACHE_GRACE_SECS", NWS_CACHE_GRACE_SECS))
+        return payload
+    if error is not None or resilience.is_failure(getattr(r, "status_code", None)):
+        stale = _NWS_CACHE.get_stale(key)
+        if stale is not None:
+            return stale
+    if error is not None:
+        raise error
+    return r.json()
+
+def _nws_forecast(lat, lon, days=7):
+    return _nws_daily(_nws_forecast_payload(lat, lon), days)
+
+@timing.timed("aggregate")
+def _nws_daily(r, days):
+    """Collapses NWS forecast periods into daily tMax/tMin/pop."""
+    stats = aggregation.daily_stats(aggregation.nws_columns(r.get("properties", {}).get("periods", [])))
+    tmax, tmin = aggregation.filled_range(stats)
+    pop = aggregation.pop_max(stats)
 
     out = []
-    for d in sorted(daily.keys())[:days]:
-        v = daily[d]
-        # fallback if one of the temps is missing
-        tmax = v["tMax"] if v["tMax"] is not None else (v["tMin"] if v["tMin"] is not None else 0)
-        tmin = v["tMin"] if v["tMin"] is not None else (v["tMax"] if v["tMax"] is not None else 0)
+    for i, d in enumerate(stats["date"][:days]):
         out.append({
-            "date": d,
-            "tMax": tmax,
-            "tMin": tmin,
-            "pop": (v["pop"] or 0) / 100.0
+            "date": str(d),
+            "tMax": int(tmax[i]),   # NWS temperatures are whole degrees; keep them ints in the JSON
+            "tMin": int(tmin[i]),
+            "pop": float(pop[i]) / 100.0
         })
     return out
 
+@timing.timed("risk")
 def heat_index_f(t_f, rh):
-    # Rothfusz regression 
+    # Rothfusz regression; scalar wrapper over risk.heat_index_f_array
     if t_f is None or rh is None: return None
-    T, R = t_f, rh
-    return (-42.379 + 2.04901523*T + 10.14333127*R
-            - 0.22475541*T*R - 0.00683783*T*T - 0.05481717*R*R
-            + 0.00122874*T*T*R + 0.00085282*T*R*R - 0.00000199*T*T*R*R)
+    return float(risk.heat_index_f_array(t_f, rh))
 
+@timing.timed("risk")
 def wind_chill_f(t_f, wind_mph):
     if t_f is None or wind_mph is None: return None
-    if t_f > 50 or wind_mph < 3: return None
-    v = wind_mph
-    return 35.74 + 0.6215*t_f - 35.75*(v**0.16) + 0.4275*t_f*(v**0.16)
+    return aggregation.opt(risk.wind_chill_f_array(t_f, wind_mph))
 
-    
+# Forecast endpoints also offer ?format=columnar
+FORECAST_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarRenderer]
 
 @api_view(["GET"])
+@renderer_classes(FORECAST_RENDERERS)
 def trends(request):
     try:
         lat = float(request.GET.get("lat"))
@@ -244,111 +533,62 @@ def trends(request):
 
     days  = int(request.GET.get("days", 7))
     units = (request.GET.get("units") or "metric").strip()
-    is_metric = (units == "metric")
+    _track_owm("/data/2.5/forecast", lat, lon, units)
 
     # Use free-tier 3-hour forecast (about 5 days horizon)
     resp = _owm_request("/data/2.5/forecast", params={
         "lat": lat, "lon": lon, "units": units
     })
     if not getattr(resp, "ok", False):
-        try:
-            return Response(resp.json(), status=resp.status_code)
-        except Exception:
-            return Response(
-                {"error": "owm_error", "text": str(getattr(resp, "text", ""))[:500]},
-                status=getattr(resp, "status_code", 502),
-            )
-
-    data = resp.json()
+        body, status = _owm_error(resp)
+        return Response(body, status=status)
+
+    cond = _owm_validators(request, "trends", resp, lat, lon, units, days)
+    if cond is not None and cond.fresh_for(request):
+        return cond.not_modified()
+    body, status = _trends_body(resp.json(), lat, lon, units, days)
+    return _with_validators(cond, Response(body, status=status))
+
+@timing.timed("aggregate")
+def _trends_body(data, lat, lon, units, days):
+    """Builds the /api/trends payload from an OWM 3-hour forecast; returns (body, status)."""
+    is_metric = (units == "metric")
     slices = data.get("list") or []
     if not slices:
-        return Response({"error": "No forecast data"}, status=502)
+        return {"error": "No forecast data"}, 502
 
     # Group by UTC date (YYYY-MM-DD) using dt_txt (e.g., "2025-12-01 03:00:00")
     # Also collect humidity (%) and wind_speed (m/s) to compute daily risk.
     # We'll use max temp + RH for heat index, and min temp + wind for wind chill.
-    agg = {}
-    for item in slices:
-        dt_txt = item.get("dt_txt") or ""
-        if len(dt_txt) >= 10:
-            d = dt_txt[:10]
-        else:
-            ts = item.get("dt")
-            if ts is None:
-                continue
-            d = datetime.utcfromtimestamp(ts).date().isoformat()
-
-        bucket = agg.setdefault(d, {
-            "tMax": None, "tMin": None, "pop": 0.0,
-            "temps": [], "rhs": [], "winds_ms": []
-        })
-
-        main = item.get("main") or {}
-        wind = item.get("wind") or {}
-
-        t = main.get("temp")
-        rh = main.get("humidity")      # %
-        w = wind.get("speed")          # m/s in OWM for metric/imperial units
-
-        if t is not None:
-            bucket["tMax"] = t if bucket["tMax"] is None else max(bucket["tMax"], t)
-            bucket["tMin"] = t if bucket["tMin"] is None else min(bucket["tMin"], t)
-            bucket["temps"].append(t)
-
-        if isinstance(rh, (int, float)):
-            bucket["rhs"].append(float(rh))
-
-        if isinstance(w, (int, float)):
-            bucket["winds_ms"].append(float(w))
-
-        pop = item.get("pop")
-        if pop is not None:
-            bucket["pop"] = max(bucket["pop"], float(pop))  # 0..1
-
-    ordered_days = sorted(agg.keys())[:days]
+    stats = aggregation.daily_stats(aggregation.owm_columns(slices))
+    ordered_days = [str(d) for d in stats["date"][:days]]
     if not ordered_days:
-        return Response({"error": "No daily aggregation available"}, status=502)
-
-    official = []
-    for d in ordered_days:
-        v = agg[d]
-        tmax = v["tMax"] if v["tMax"] is not None else (v["tMin"] if v["tMin"] is not None else 0.0)
-        tmin = v["tMin"] if v["tMin"] is not None else (v["tMax"] if v["tMax"] is not None else 0.0)
-        pop  = _clamp(v.get("pop", 0.0), 0.0, 1.0)
-        official.append({"date": d, "tMax": tmax, "tMin": tmin, "pop": pop})
+        return {"error": "No daily aggregation available"}, 502
 
-    # EWMA smoothing of official
-    tmax_series = [x["tMax"] for x in official if x["tMax"] is not None]
-    tmin_series = [x["tMin"] for x in official if x["tMin"] is not None]
-    pop_series  = [x["pop"]  for x in official]
+    tmax_f, tmin_f = aggregation.filled_range(stats)
+    pop_max = aggregation.pop_max(stats)
 
-    if not (tmax_series and tmin_series and pop_series):
-        return Response({"error": "Insufficient forecast for trends"}, status=422)
-
-    tmax_tr = _ewma(tmax_series)
-    tmin_tr = _ewma(tmin_series)
-    pop_tr  = _ewma(pop_series)
+    official = []
+    for i, d in enumerate(ordered_days):
+        official.append({
+            "date": d,
+            "tMax": float(tmax_f[i]),
+            "tMin": float(tmin_f[i]),
+            "pop": _clamp(float(pop_max[i]), 0.0, 1.0),
+        })
 
+    # One pass: EWMA smoothing plus the confidence proxy (spread over the last 7 days vs. net change)
+    state = {m: TrendState(window=7) for m in ("tMax", "tMin", "pop")}
     predicted = []
-    for i, base in enumerate(official):
+    for base in official:
         predicted.append({
             "date": base["date"],
-            "tMax": round(tmax_tr[i], 1),
-            "tMin": round(tmin_tr[i], 1),
-            "pop":  _clamp(pop_tr[i], 0.0, 1.0),
+            "tMax": round(state["tMax"].update(base["tMax"]), 1),
+            "tMin": round(state["tMin"].update(base["tMin"]), 1),
+            "pop":  _clamp(state["pop"].update(base["pop"]), 0.0, 1.0),
         })
 
-    # Confidence proxy (variation over last N)
-    lastN = min(7, len(official))
-    def conf(metric):
-        series = [d[metric] for d in official if d[metric] is not None]
-        if len(series) < lastN:
-            return 0.5
-        noise  = _std(series[-lastN:])
-        signal = abs(series[-1] - series[0])
-        return _clamp(1 - noise / (noise + signal + 1e-6), 0.1, 0.95)
-
-    c = {"tMax": conf("tMax"), "tMin": conf("tMin"), "pop": conf("pop")}
+    c = {m: st.confidence() for m, st in state.items()}
     c["overall"] = round((c["tMax"] + c["tMin"] + c["pop"]) / 3, 2)
 
     def trend_word(delta, up="increasing", down="decreasing", flat="steady"):
@@ -361,41 +601,29 @@ def trends(request):
         f"{trend_word(r_delta, 'higher','lower','steady')} rain chance."
     )
 
-    daily_enriched = []
-    for d in ordered_days:
-        v = agg[d]
-        tmax = v["tMax"]
-        tmin = v["tMin"]
-
-        # Choose representative RH and wind
-        rh_for_hi = max(v["rhs"]) if v["rhs"] else (sum(v["rhs"])/len(v["rhs"]) if v["rhs"] else None)
-        wind_ms_max = max(v["winds_ms"]) if v["winds_ms"] else None
+    # Heat index from max temp + RH, wind chill from min temp + wind, for all days at once
+    n = len(ordered_days)
+    with timing.span("risk"):
+        hi, wc = risk.risk_in_units(stats["tMax"][:n], stats["tMin"][:n], stats["rhMax"][:n], stats["windMax"][:n], is_metric)
 
-        # Convert for formulas 
-        t_f_for_hi = (tmax * 9/5 + 32) if (tmax is not None and is_metric) else tmax
-        t_f_for_wc = (tmin * 9/5 + 32) if (tmin is not None and is_metric) else tmin
-        wind_mph   = (wind_ms_max * 2.23694) if wind_ms_max is not None else None
-
-        hi_f = heat_index_f(t_f_for_hi, rh_for_hi) if (t_f_for_hi is not None and rh_for_hi is not None) else None
-        wc_f = wind_chill_f(t_f_for_wc, wind_mph)   if (t_f_for_wc is not None and wind_mph is not None)   else None
-
-        # Return risk values in the same unit system the client requested
-        def back_to_units(x):
-            if x is None: return None
-            return (x - 32) * 5/9 if is_metric else x
+    def rounded(x):
+        x = aggregation.opt(x)
+        return round(x, 1) if x is not None else None
 
+    daily_enriched = []
+    for i, d in enumerate(ordered_days):
         daily_enriched.append({
             "date": d,
-            "tMax": tmax,
-            "tMin": tmin,
-            "pop": _clamp(v.get("pop", 0.0), 0.0, 1.0),
+            "tMax": aggregation.opt(stats["tMax"][i]),
+            "tMin": aggregation.opt(stats["tMin"][i]),
+            "pop": _clamp(float(pop_max[i]), 0.0, 1.0),
             "risk": {
-                "heatIndex": round(back_to_units(hi_f), 1) if hi_f is not None else None,
-                "windChill": round(back_to_units(wc_f), 1) if wc_f is not None else None,
+                "heatIndex": rounded(hi[i]),
+                "windChill": rounded(wc[i]),
             }
         })
 
-    return Response({
+    return {
         "location": {"lat": lat, "lon": lon},
         "units": units,
         "days": days,
@@ -404,12 +632,17 @@ def trends(request):
         "confidence": c,
         "summary": summary,
         "daily": daily_enriched,   # <-- use this in your UI for risk chips
-    }, status=200)
+    }, 200
+
+LOCATION_MISS_TTL_SECS     = 86400
+LOCATION_NEGATIVE_TTL_SECS = 3600   # typos and non-places; short so new OWM entries show up
+_LOCATION_MISSES = TTLCache(max_entries=20000, max_bytes=16 * 1024 * 1024, name="location_misses")
 
 @api_view(['GET'])
 def get_locations(request):
     """
-    City search using OpenWeather Geocoding API.
+    City search: name-prefix matches from the local gazetteer; the OpenWeather
+    Geocoding API is asked only when there are none (trigram guesses rank behind it).
     Query: q (or query), limit (default 10)
     Returns a lightweight list with id-ish slug, name, state, country, lat, lon.
     """
@@ -417,14 +650,43 @@ def get_locations(request):
     if not q:
         return JsonResponse({"results": []}, status=200, safe=False)
 
-    limit = int(request.GET.get("limit") or 10)
-    resp = _owm_request("/geo/1.0/direct", params={"q": q, "limit": min(limit, 25)})
-    if not resp.ok:
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or 10), 25))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400, safe=False)
+    local, fuzzy = gazetteer.match(q, limit) if gazetteer.enabled() else ([], False)
+    if local and not fuzzy:
+        return JsonResponse({"results": local}, status=200, safe=False)
+
+    remote, resp = _owm_geocode(q, limit)
+    if remote is None:
+        if local:
+            return JsonResponse({"results": local}, status=200, safe=False)
         try:
             return JsonResponse({"error":"owm_error","detail": resp.json()}, status=resp.status_code, safe=False)
         except Exception:
             return JsonResponse({"error":"owm_error","text": resp.text[:500]}, status=resp.status_code, safe=False)
 
+    # Trigram guesses rank behind whatever OWM actually matched
+    seen, merged = set(), []
+    for r in remote + local:
+        key = gazetteer.location_key(r)
+        if key not in seen:
+            seen.add(key)
+            merged.append(r)
+    return JsonResponse({"results": merged[:limit]}, status=200, safe=False)
+
+def _owm_geocode(q, limit):
+    """(results, None) from the OWM geocoder, cached per normalized query (empty answers too); (None, resp) on failure."""
+    mkey = (gazetteer.normalize(q), limit)
+    cached, state = _LOCATION_MISSES.get(mkey)
+    if state is not None:
+        return cached, None
+
+    resp = _owm_request("/geo/1.0/direct", params={"q": q, "limit": limit})
+    if not resp.ok:
+        return None, resp
+
     items = resp.json() or []
     trimmed = []
     for it in items:
@@ -442,7 +704,10 @@ def get_locations(request):
             "lat": lat,
             "lon": lon
         })
-    return JsonResponse({"results": trimmed[:25]}, status=200, safe=False)
+    trimmed = trimmed[:25]
+    ttl = LOCATION_MISS_TTL_SECS if trimmed else LOCATION_NEGATIVE_TTL_SECS
+    _LOCATION_MISSES.set(mkey, trimmed, ttl, size=64 + 160 * len(trimmed))
+    return trimmed, None
 
 def _get_lat_lon_from_request(request):
     """lat/lon from query or IP; returns (lat, lon) floats or raises ValueError."""
@@ -451,13 +716,11 @@ def _get_lat_lon_from_request(request):
     if qlat and qlon:
         return float(qlat), float(qlon)
     # fallback: IP geolocation
-    curr_loc = geocoder.ip("me")
-    if not curr_loc or not curr_loc.latlng:
-        raise ValueError("Could not determine location")
-    return map(float, curr_loc.latlng)
+    return _geolocate_ip(request)
 
 
 @api_view(["GET"])
+@renderer_classes(FORECAST_RENDERERS)
 def daily_forecast(request):
     try:
         lat, lon = _get_lat_lon_from_request(request)
@@ -466,62 +729,139 @@ def daily_forecast(request):
 
     days  = int(request.GET.get("days", 5))
     units = (request.GET.get("units") or "metric").strip()
+    _track_owm("/data/2.5/forecast", lat, lon, units)
 
     # Pull 5-day/3-hour slices
     resp = _owm_request("/data/2.5/forecast", params={"lat": lat, "lon": lon, "units": units})
     if not getattr(resp, "ok", False):
-        try:
-            return Response(resp.json(), status=resp.status_code)
-        except Exception:
-            return Response({"error": "owm_error", "text": str(getattr(resp, "text", ""))[:500]}, status=getattr(resp, "status_code", 502))
-
-    data = resp.json()
+        body, status = _owm_error(resp)
+        return Response(body, status=status)
+
+    cond = _owm_validators(request, "daily", resp, lat, lon, units, days)
+    if cond is not None and cond.fresh_for(request):
+        return cond.not_modified()
+    body, status = _daily_body(resp.json(), lat, lon, units, days)
+    return _with_validators(cond, Response(body, status=status))
+
+@timing.timed("aggregate")
+def _daily_body(data, lat, lon, units, days):
+    """Builds the /api/forecast/daily payload from an OWM 3-hour forecast; returns (body, status)."""
     slices = data.get("list") or []
     if not slices:
-        return Response({"error": "No forecast data"}, status=502)
+        return {"error": "No forecast data"}, 502
 
     # Aggregate to daily tMax / tMin / PoP
-    daily = {}
-    for item in slices:
-        # date key
-        dt_txt = item.get("dt_txt") or ""
-        if len(dt_txt) >= 10:
-            dkey = dt_txt[:10]  # YYYY-MM-DD (UTC)
-        else:
-            ts = item.get("dt")
-            if ts is None:
-                continue
-            dkey = datetime.utcfromtimestamp(ts).date().isoformat()
-
-        rec = daily.setdefault(dkey, {"tMax": None, "tMin": None, "pop": 0.0})
-
-        m = item.get("main") or {}
-        t = m.get("temp")
-        if t is not None:
-            rec["tMax"] = t if rec["tMax"] is None else max(rec["tMax"], t)
-            rec["tMin"] = t if rec["tMin"] is None else min(rec["tMin"], t)
-
-        pop = item.get("pop")
-        if pop is not None:
-            rec["pop"] = max(rec["pop"], float(pop))  # keep max 0..1
+    stats = aggregation.daily_stats(aggregation.owm_columns(slices))
+    tmax, tmin = aggregation.filled_range(stats)
+    pop = aggregation.pop_max(stats)
 
     # Normalize and trim to requested days
     out = []
-    for d in sorted(daily.keys())[:days]:
-        v = daily[d]
-        tmax = v["tMax"] if v["tMax"] is not None else (v["tMin"] if v["tMin"] is not None else 0.0)
-        tmin = v["tMin"] if v["tMin"] is not None else (v["tMax"] if v["tMax"] is not None else 0.0)
-        out.append({"date": d, "tMax": round(tmax, 1), "tMin": round(tmin, 1), "pop": _clamp(v.get("pop", 0.0), 0.0, 1.0)})
+    for i, d in enumerate(stats["date"][:days]):
+        out.append({"date": str(d), "tMax": round(float(tmax[i]), 1), "tMin": round(float(tmin[i]), 1), "pop": _clamp(float(pop[i]), 0.0, 1.0)})
 
-    return Response({
+    return {
         "location": {"lat": float(lat), "lon": float(lon)},
         "units": units,
         "days": len(out),
         "daily": out
-    }, status=200)
+    }, 200
+
+
+# -----------------------------
+# batch forecast endpoint
+# -----------------------------
+BATCH_MAX_LOCATIONS   = 50
+BATCH_MAX_CONCURRENCY = 8
+_BATCH_BUILDERS = {"daily": (_daily_body, 5), "trends": (_trends_body, 7)}
+
+def _batch_parse(data):
+    """(locations, kind, concurrency) from a batch request body; raises ValueError with a client message."""
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object with a 'locations' list")
+    locations = data.get("locations")
+    if not isinstance(locations, list) or not locations:
+        raise ValueError("'locations' must be a non-empty list")
+    max_n = getattr(settings, "BATCH_MAX_LOCATIONS", BATCH_MAX_LOCATIONS)
+    if len(locations) > max_n:
+        raise ValueError(f"at most {max_n} locations per batch")
+    kind = data.get("kind") or "daily"
+    if kind not in _BATCH_BUILDERS:
+        raise ValueError(f"'kind' must be one of {sorted(_BATCH_BUILDERS)}")
+    limit = getattr(settings, "BATCH_MAX_CONCURRENCY", BATCH_MAX_CONCURRENCY)
+    try:
+        concurrency = max(1, min(int(data.get("concurrency") or limit), limit))
+    except (TypeError, ValueError):
+        raise ValueError("'concurrency' must be an integer")
+    return locations, kind, concurrency
+
+def _batch_spec(item, kind):
+    """(builder, lat, lon, units, days) for one batch entry; raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError("each location must be an object")
+    kind = item.get("kind") or kind
+    if kind not in _BATCH_BUILDERS:
+        raise ValueError(f"unknown kind {kind!r}")
+    build, default_days = _BATCH_BUILDERS[kind]
+    try:
+        lat = float(item.get("lat"))
+        lon = float(item.get("lon"))
+        days = int(item.get("days") or default_days)
+    except (TypeError, ValueError):
+        raise ValueError("lat & lon are required")
+    units = (item.get("units") or "metric").strip()
+    return build, lat, lon, units, days
+
+def _batch_finish(resp, spec):
+    build, lat, lon, units, days = spec
+    if not getattr(resp, "ok", False):
+        body, status = _owm_error(resp)
+        return status, body
+    body, status = build(resp.json(), lat, lon, units, days)
+    return status, body
+
+def _batch_item(item, kind):
+    """(status, body) for one batch entry; failures stay local to the entry."""
+    try:
+        spec = _batch_spec(item, kind)
+    except ValueError as e:
+        return 400, {"error": str(e)}
+    _, lat, lon, units, _ = spec
+    try:
+        resp = _owm_request("/data/2.5/forecast", params={"lat": lat, "lon": lon, "units": units})
+        return _batch_finish(resp, spec)
+    except Exception as e:
+        log.exception("Batch forecast entry failed")
+        return 502, {"error": "batch_item_failed", "message": str(e)[:200]}
+
+def _batch_body(outcomes):
+    results = []
+    for i, (status, body) in enumerate(outcomes):
+        key = "data" if status == 200 else "error"
+        results.append({"index": i, "status": status, key: body})
+    return {"count": len(results), "results": results}
+
+@api_view(["POST"])
+@renderer_classes(FORECAST_RENDERERS)
+def forecast_batch(request):
+    """
+    Daily or trends forecasts for many locations in one call.
+    Body: {"kind": "daily"|"trends", "concurrency": n,
+           "locations": [{"lat", "lon", "units", "days", "kind"?}, ...]}
+    Upstream fetches run concurrently (bounded), so latency tracks the slowest location.
+    """
+    try:
+        locations, kind, concurrency = _batch_parse(request.data)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(locations))) as pool:
+        outcomes = list(pool.map(deadline.in_context(lambda item: _batch_item(item, kind)), locations))
+    return Response(_batch_body(outcomes), status=200)
 
 
 @api_view(["GET"])
+@renderer_classes(FORECAST_RENDERERS)
 def nws(request):
     try:
         lat, lon = _get_lat_lon_from_request(request)
@@ -529,25 +869,68 @@ def nws(request):
         return Response({"error": "lat & lon are required or could not be determined"}, status=400)
 
     days = int(request.GET.get("days", 7))
+    prefetch.record("nws", *snap_point(lat, lon))
     try:
-        out = _nws_forecast(lat, lon, days=days)  # returns list[{date,tMax,tMin,pop}]
+        payload = _nws_forecast_payload(lat, lon)
+        cond = _nws_validators(request, payload, lat, lon, days)
+        if cond.fresh_for(request):
+            return cond.not_modified()
+        out = _nws_daily(payload, days)  # list[{date,tMax,tMin,pop}]
     except Exception as e:
         return Response({"error": "nws_error", "message": str(e)[:200]}, status=502)
 
-    return Response({
+    return cond.apply(Response({
         "location": {"lat": float(lat), "lon": float(lon)},
         "days": len(out),
         "daily": out
-    }, status=200)
+    }, status=200))
 
-@api_view(["GET"]) 
-@xframe_options_exempt
-def get_map_html(request):#no need for request for now
-    latitude, longitude = get_coordinates()
-    
-    #heat map data points
-    heat_data = np.random.normal(size=(100, 2), loc=[latitude, longitude], scale=0.1).tolist()
-    
+def _risk_grid_cell(lat, lon):
+    """Current conditions (deg F, mph) for one risk-grid cell, or None; uncached cells spend the grid's OWM share."""
+    if not _risk_grid_cell_cached(lat, lon) and not resilience.spend("owm_risk_grid"):
+        return None
+    resp = _owm_request("/data/2.5/weather", params={"lat": lat, "lon": lon, "units": "imperial"})
+    if not getattr(resp, "ok", False):
+        return None
+    try:
+        return resp.json()
+    except ValueError:
+        return None
+
+def _risk_grid_cell_cached(lat, lon):
+    """Whether _risk_grid_cell can answer (lat, lon) from the OWM cache, fresh or stale (not outage grace)."""
+    q = _owm_normalize_params({"lat": lat, "lon": lon, "units": "imperial"})
+    return _OWM_CACHE.peek_servable(_owm_cache_key("/data/2.5/weather", q))
+
+def _risk_grid_params(params):
+    """(size, step) from ?grid= / ?step= (None where absent); raises ValueError on bad values."""
+    size = params.get("grid")
+    step = params.get("step")
+    size = int(size) if size not in (None, "") else None
+    step = float(step) if step not in (None, "") else None
+    if size is not None and size < 1:
+        raise ValueError("grid must be a positive integer")
+    if step is not None and not (math.isfinite(step) and 0 < step <= risk_grid.RISK_GRID_MAX_STEP_DEG):
+        raise ValueError(f"step must be a number in (0, {risk_grid.RISK_GRID_MAX_STEP_DEG}]")
+    return size, step
+
+MAP_CACHE_COORD_PRECISION = 3    # ~100 m; invisible at the map's zoom level
+MAP_CACHE_TTL_SECS        = 600
+MAP_ALERT_ZOOM            = 12   # polygons are simplified to ~1 px two levels past zoom_start
+_MAP_CACHE = TTLCache(max_entries=256, max_bytes=32 * 1024 * 1024, name="map")
+
+def _map_etag(lat, lon, alert_list, heat_data):
+    """Validator over everything the rendered map depends on."""
+    h = hashlib.sha1()
+    h.update(f"{lat},{lon}".encode())
+    for a in sorted(alert_list, key=lambda a: a.get("id") or ""):
+        h.update(json.dumps([a.get("id"), a.get("event"), a.get("severity"), a.get("headline"), a.get("polygon")],
+                            sort_keys=True, separators=(",", ":")).encode())
+    h.update(json.dumps(heat_data, separators=(",", ":")).encode())
+    return f'"map-{h.hexdigest()[:20]}"'
+
+@timing.timed("folium")
+def _render_map(latitude, longitude, alert_list, heat_data):
     m = folium.Map(location=[latitude, longitude], zoom_start=10)
     folium.Marker(
         location=[latitude, longitude],
@@ -555,68 +938,310 @@ def get_map_html(request):#no need for request for now
         popup="Mt. Hood Meadows",
         icon=folium.Icon(icon="cloud"),
     ).add_to(m)
-    
-    HeatMap(heat_data).add_to(m)
+
+    if heat_data:
+        HeatMap(heat_data, name="Heat / cold risk", min_opacity=0.3).add_to(m)
+
+    for a in alert_list:
+        geom = a.get("polygon")
+        if not geom: 
+            continue
+        folium.GeoJson(
+            data=geom,
+            name=f"{a.get('event')} ({a.get('severity') or 'N/A'})",
+            tooltip=(a.get("headline") or a.get("event") or "Alert")
+        ).add_to(m)
+
+    folium.LayerControl().add_to(m)
+    return m._repr_html_()
+
+@api_view(["GET"]) 
+@xframe_options_exempt
+def get_map_html(request):
     try:
-        r = requests.get(
-            f"{request.build_absolute_uri('/')}api/alerts?lat={lat}&lon={lon}",
-            timeout=8
+        latitude, longitude = _get_lat_lon_from_request(request)
+    except (TypeError, ValueError):
+        return HttpResponse("lat & lon are required or could not be determined", status=400, content_type="text/plain")
+    prec = getattr(settings, "MAP_CACHE_COORD_PRECISION", MAP_CACHE_COORD_PRECISION)
+    latitude, longitude = round(latitude, prec), round(longitude, prec)
+
+    try:
+        tolerance = _simplify_tolerance(request.GET, default_zoom=getattr(settings, "MAP_ALERT_ZOOM", MAP_ALERT_ZOOM))
+    except ValueError:
+        return HttpResponse("zoom/tolerance must be finite numbers", status=400, content_type="text/plain")
+    try:
+        grid_size, grid_step = _risk_grid_params(request.GET)
+    except ValueError as e:
+        return HttpResponse(f"invalid grid/step: {e}", status=400, content_type="text/plain")
+
+    # Alerts come from the in-process service; an NWS failure just drops the layer
+    body, status = fetch_alerts(latitude, longitude, tolerance=tolerance)
+    alert_list = body.get("alerts", []) if status == 200 else []
+
+    #heat map data points: heat-index / wind-chill risk over a grid around the user
+    with timing.span("riskgrid"):
+        heat_data = risk_grid.build_risk_grid(
+            latitude, longitude, fetch=_risk_grid_cell,
+            size=grid_size, step=grid_step, is_cached=_risk_grid_cell_cached,
         )
-        if r.ok:
-            data = r.json()
-            for a in data.get("alerts", []):
-                geom = a.get("polygon")
-                if not geom: 
-                    continue
-                folium.GeoJson(
-                    data=geom,
-                    name=f"{a.get('event')} ({a.get('severity') or 'N/A'})",
-                    tooltip=(a.get("headline") or a.get("event") or "Alert")
-                ).add_to(m)
-    except Exception:
-        pass
 
-    folium.LayerControl().add_to(m)
-    return HttpResponse(m._repr_html_())
+    etag = _map_etag(latitude, longitude, alert_list, heat_data)
+    if conditional.etag_matches(request, etag):
+        resp = HttpResponseNotModified()
+        resp["ETag"] = etag
+        return resp
+
+    html, state = _MAP_CACHE.get(etag)
+    if state is None:
+        html = _render_map(latitude, longitude, alert_list, heat_data)
+        _MAP_CACHE.set(etag, html, getattr(settings, "MAP_CACHE_TTL_SECS", MAP_CACHE_TTL_SECS), size=len(html))
+
+    resp = HttpResponse(html)
+    resp["ETag"] = etag
+    resp["Cache-Control"] = "private, no-cache"   # always revalidate; unchanged maps cost a 304
+    return resp
 
 @api_view(["GET"])
 def alerts(request):
-    import requests
     try:
         lat = float(request.GET.get("lat"))
         lon = float(request.GET.get("lon"))
     except (TypeError, ValueError):
         return Response({"error": "lat & lon required"}, status=400)
-
-    url = f"https://api.weather.gov/alerts/active?point={lat},{lon}"
-    hdrs = {"User-Agent": "WeatherTracker/1.0 (student project) blank@example.com"}
     try:
-        r = requests.get(url, headers=hdrs, timeout=10)
+        tolerance = _simplify_tolerance(request.GET)
+    except ValueError:
+        return Response({"error": "zoom/tolerance must be finite numbers"}, status=400)
+
+    prefetch.record("alerts", *snap_point(lat, lon))
+    body, status = fetch_alerts(lat, lon)
+    if status != 200:
+        return Response(body, status=status)
+    cond = _alerts_validators(request, body, tolerance)
+    if cond.fresh_for(request):
+        return cond.not_modified()
+    return cond.apply(Response(_simplified_alerts(body, tolerance), status=200))
+
+@timing.timed("alerts")
+def fetch_alerts(lat, lon, tolerance=None):
+    """
+    In-process alert service behind /api/alerts; returns (body, status).
+    With a tolerance (degrees), polygons are Douglas-Peucker simplified.
+    """
+    body = _alerts_from_index(lat, lon)
+    if body is None:
+        body, status = _alerts_point(lat, lon)
+        if status != 200:
+            return body, status
+    return _simplified_alerts(body, tolerance), 200
+
+def _alerts_point(lat, lon):
+    """Upstream point query, cached briefly per snapped point; returns (body, status)."""
+    lat, lon = snap_point(lat, lon)
+    hit, state = _NWS_CACHE.get(("alerts", lat, lon))
+    if state is not None:
+        return hit, 200
+    return _alerts_point_fetch(lat, lon)
+
+def _alerts_point_fetch(lat, lon):
+    url = _nws_url(f"/alerts/active?point={lat},{lon}")
+    try:
+        r = _nws_get(url)
         if not getattr(r, "ok", False):
-            # Return structured error without raise_for_status
-            try:
-                detail = r.json()
-            except Exception:
-                detail = (getattr(r, "text", "") or "")[:500]
-            return Response(
-                {"error": "nws_error", "message": detail},
-                status=getattr(r, "status_code", 502),
-            )
-
-        payload = r.json() or {}
-        feats = payload.get("features") or []
-        alerts = [{
-            "id": f.get("id"),
-            "event": (f.get("properties") or {}).get("event"),
-            "severity": (f.get("properties") or {}).get("severity"),
-            "headline": (f.get("properties") or {}).get("headline"),
-            "effective": (f.get("properties") or {}).get("effective"),
-            "ends": (f.get("properties") or {}).get("ends"),
-            "area": (f.get("properties") or {}).get("areaDesc"),
-            "polygon": f.get("geometry"),
-        } for f in feats]
-        return Response({"count": len(alerts), "alerts": alerts}, status=200)
+            return _nws_error(r)
+        body = _alerts_body(r.json())
     except requests.RequestException as e:
-        return Response({"error": "nws_error", "message": str(e)}, status=502)
+        return {"error": "nws_error", "message": str(e)}, 502
+    _nws_cache_store(("alerts", lat, lon), body, getattr(settings, "ALERTS_POINT_TTL_SECS", ALERTS_POINT_TTL_SECS), r)
+    return body, 200
 
+def _simplify_tolerance(params, default_zoom=None):
+    """
+    Simplification tolerance in degrees from ?tolerance= or ?zoom= (about one
+    pixel at that zoom); None when neither is given and there's no default.
+    Raises ValueError on non-numeric or non-finite input.
+    """
+    if params.get("tolerance") not in (None, ""):
+        tolerance = float(params["tolerance"])
+        if not math.isfinite(tolerance):
+            raise ValueError("tolerance must be finite")
+        return max(0.0, tolerance)
+    zoom = params.get("zoom")
+    if zoom in (None, ""):
+        zoom = default_zoom
+    if zoom is None:
+        return None
+    return simplify.zoom_tolerance(float(zoom))
+
+def _simplified_alerts(body, tolerance):
+    if not tolerance:
+        return body
+    return {**body, "alerts": [simplify.simplify_alert(a, tolerance) for a in body.get("alerts", [])]}
+
+def _nws_error(r):
+    """(body, status) for a failed NWS response, without raise_for_status."""
+    try:
+        detail = r.json()
+    except Exception:
+        detail = (getattr(r, "text", "") or "")[:500]
+    return {"error": "nws_error", "message": detail}, getattr(r, "status_code", 502)
+
+def _alert_record(f):
+    return {
+        "id": f.get("id"),
+        "event": (f.get("properties") or {}).get("event"),
+        "severity": (f.get("properties") or {}).get("severity"),
+        "headline": (f.get("properties") or {}).get("headline"),
+        "effective": (f.get("properties") or {}).get("effective"),
+        "ends": (f.get("properties") or {}).get("ends"),
+        "area": (f.get("properties") or {}).get("areaDesc"),
+        "polygon": f.get("geometry"),
+    }
+
+def _alerts_body(payload):
+    """Flattens an NWS alerts FeatureCollection into the /api/alerts payload."""
+    feats = (payload or {}).get("features") or []
+    alerts = [_alert_record(f) for f in feats]
+    return {"count": len(alerts), "alerts": alerts}
+
+# -----------------------------
+# Local active-alerts index
+# -----------------------------
+POINT_ZONES_TTL_SECS      = 7 * 24 * 3600
+POINT_ZONES_MISS_TTL_SECS = 3600
+_POINT_ZONES = TTLCache(max_entries=20000, max_bytes=8 * 1024 * 1024, name="point_zones")
+
+def _fetch_alert_feed():
+    """Full active-alerts FeatureCollection, or None on failure."""
+    try:
+        r = _nws_get(_nws_url("/alerts/active"))
+    except requests.RequestException:
+        log.warning("Active alert feed fetch failed", exc_info=True)
+        return None
+    if not getattr(r, "ok", False):
+        log.warning("Active alert feed returned %s", getattr(r, "status_code", None))
+        return None
+    return r.json()
+
+def _point_zones(lat, lon):
+    """NWS forecast/county/fire-weather zone ids containing the point (from the persisted /points data)."""
+    key = snap_point(lat, lon)
+    zones, state = _POINT_ZONES.get(key)
+    if state is not None:
+        return zones
+    try:
+        props = (_nws_points(*key) or {}).get("properties") or {}
+        zones = tuple(sorted({alert_index.zone_id(props.get(k))
+                              for k in ("forecastZone", "county", "fireWeatherZone") if props.get(k)}))
+    except Exception:
+        log.warning("Zone lookup failed for %s", key, exc_info=True)
+        zones = ()
+    ttl = POINT_ZONES_TTL_SECS if zones else POINT_ZONES_MISS_TTL_SECS
+    _POINT_ZONES.set(key, zones, ttl, size=64)
+    return zones
+
+def _alerts_from_index(lat, lon):
+    """/api/alerts body answered from the local index, or None when it isn't available."""
+    if not alert_index.enabled():
+        return None
+    alert_index.ensure_started(_fetch_alert_feed, _alert_record)
+    idx = alert_index.current()
+    if idx is None:
+        return None
+    alerts = idx.query(lat, lon, zones=_point_zones(lat, lon))
+    return {"count": len(alerts), "alerts": alerts}
 
+# -----------------------------
+# Conditional GET (see base/conditional.py)
+# -----------------------------
+ALERTS_HTTP_MAX_AGE_SECS = 60
+
+def _response_format(request):
+    renderer = getattr(request, "accepted_renderer", None)
+    return getattr(renderer, "format", None) or request.GET.get("format") or "json"
+
+def _shared_cacheable(request):
+    # Responses located by client IP must never land in a shared cache
+    return bool(request.GET.get("lat") and request.GET.get("lon"))
+
+def _with_validators(cond, response):
+    return cond.apply(response) if cond is not None else response
+
+def _owm_validators(request, name, resp, *params):
+    """Validators for a response built from an OWM forecast; None when resp isn't a real upstream body."""
+    content = getattr(resp, "content", None)
+    if not isinstance(content, (bytes, bytearray)):
+        return None
+    digest = getattr(resp, "digest", None) or hashlib.sha1(content).hexdigest()
+    fetched_at = getattr(resp, "fetched_at", None)
+    age = (timezone.now() - fetched_at).total_seconds() if fetched_at else 0
+    return conditional.Validators(
+        conditional.etag_for(name, digest, _response_format(request), *params),
+        fetched_at,
+        conditional.cache_control(_owm_ttl(OWM_FORECAST_PATH) - age, public=_shared_cacheable(request)),
+    )
+
+def _nws_validators(request, payload, lat, lon, days):
+    """Keyed on the forecast's updateTime (its issue time), falling back to a hash of the periods."""
+    props = (payload or {}).get("properties") or {}
+    issued, last_modified = props.get("updateTime"), None
+    if issued:
+        try:
+            last_modified = datetime.fromisoformat(issued)
+        except ValueError:
+            pass
+    else:
+        issued = hashlib.sha1(json.dumps(props.get("periods"), sort_keys=True).encode()).hexdigest()
+    remaining = _NWS_CACHE.ttl_remaining(("forecast",) + snap_point(lat, lon))
+    if remaining is None:
+        remaining = getattr(settings, "NWS_FORECAST_TTL_SECS", NWS_FORECAST_TTL_SECS)
+    return conditional.Validators(
+        conditional.etag_for("nws", issued, lat, lon, days, _response_format(request)),
+        last_modified,
+        conditional.cache_control(remaining, public=_shared_cacheable(request)),
+    )
+
+def _alerts_validators(request, body, tolerance):
+    """NWS gives every alert update a new id, so the id set identifies the response."""
+    ids = sorted(a.get("id") or "" for a in body.get("alerts", []))
+    return conditional.Validators(
+        conditional.etag_for("alerts", tolerance, _response_format(request), *ids),
+        None,
+        conditional.cache_control(getattr(settings, "ALERTS_HTTP_MAX_AGE_SECS", ALERTS_HTTP_MAX_AGE_SECS),
+                                  swr=30, public=True),
+    )
+
+# -----------------------------
+# Popularity-driven prefetch (see base/prefetch.py)
+# -----------------------------
+def _track_owm(path, lat, lon, units):
+    q = _owm_normalize_params({"lat": lat, "lon": lon, "units": units})
+    prefetch.record("owm", path, q["lat"], q["lon"], q["units"])
+
+def _owm_prefetch_args(path, lat, lon, units):
+    q = _owm_normalize_params({"lat": lat, "lon": lon, "units": units})
+    return _owm_cache_key(path, q), q
+
+def _owm_prefetch_ttl(path, lat, lon, units):
+    if not getattr(settings, "OWM_API_KEY", None):
+        return float("inf")
+    return _OWM_CACHE.ttl_remaining(_owm_prefetch_args(path, lat, lon, units)[0])
+
+def _owm_prefetch(path, lat, lon, units):
+    ckey, q = _owm_prefetch_args(path, lat, lon, units)
+    # Shares the claim with stale-while-revalidate refreshes, so a key is never fetched twice
+    if _OWM_CACHE.begin_refresh(ckey):
+        _owm_refresh(ckey, path, q, _owm_ttl(path))
+
+def _alerts_prefetch_ttl(lat, lon):
+    # Answered locally while the alert index is live; nothing to keep warm
+    if alert_index.enabled() and alert_index.current() is not None:
+        return float("inf")
+    return _NWS_CACHE.ttl_remaining(("alerts", lat, lon))
+
+prefetch.register("owm", _owm_prefetch_ttl, _owm_prefetch)
+# A /points miss makes the NWS refresh two upstream calls; budget for the worst case
+prefetch.register("nws", lambda lat, lon: _NWS_CACHE.ttl_remaining(("forecast", lat, lon)), _nws_forecast_fetch,
+                  cost=2)
+prefetch.register("alerts", _alerts_prefetch_ttl, _alerts_point_fetch)
+metrics.register_pool_stats(upstream_pool_stats)
@@ -0,0 +1,23 @@
+# Gunicorn settings for the container (see Dockerfile).
+import os
+import shutil
+
+# Each worker writes its Prometheus samples here; /metrics merges them (base/metrics.py).
+# Must be set before the app is imported, hence in the environment rather than settings.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/wt-prometheus")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# Exported so settings.PREFETCH_WORKERS splits the prefetch budget the same way
+workers = int(os.environ.setdefault("GUNICORN_WORKERS", "3"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def on_starting(server):
+    # Samples from a previous run would be merged into this one's
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)